@@ -10,6 +10,12 @@ linear_fit : function
     Applies linear fit and returns m, b and Rsq. Can also plot it.
 nonlinear_fit : function
     Applies nonlinear fit and returns parameters and Rsq. Plots it.
+sweep_response : function
+    Gets impulse, frequency and harmonic responses from a recorded sweep.
+multisine_response : function
+    Gets the frequency response on every bin excited by a multisine.
+mls_response : function
+    Gets the impulse response from a recorded maximum length sequence.
 
 @author: Vall
 """
@@ -404,4 +410,314 @@ def nonlinear_fit(X, Y, fitfunction, initial_guess=None, dY=None,
             [sqrt(covariance[i,i]) for i in range(n)])
     parameters = list(zip(parameters, parameters_error))
     
-    return rsq, parameters
\ No newline at end of file
+    return rsq, parameters
+
+#%%
+
+def sweep_inverse_filter(sweep, samplerate=44100):
+    """Returns the inverse filter of an exponential sine sweep.
+    
+    It is the time-reversed sweep with an amplitude envelope decaying 
+    6 dB per octave, which compensates the sweep's pink spectrum. It is 
+    normalized so that convolving it with the sweep gives unit gain 
+    between the sweep's start and stop frequencies.
+    
+    Parameters
+    ----------
+    sweep : wavemaker.Sweep
+        Played sweep.
+    samplerate : int, float optional
+        Sampling rate. Default: 44100.
+    
+    Returns
+    -------
+    np.array
+        Inverse filter, as long as one sweep (silence excluded).
+    
+    """
+    
+    samples = int(round(sweep.duration * samplerate))
+    time = np.arange(samples) / samplerate
+    
+    inverse = sweep.evaluate(time)[::-1] * np.exp(-time / sweep.rate_time)
+    
+    nfft = 2**int(np.ceil(np.log2(2 * samples)))
+    gain = np.abs(np.fft.rfft(sweep.evaluate(time), nfft) * 
+                  np.fft.rfft(inverse, nfft))
+    frequencies = np.fft.rfftfreq(nfft, 1/samplerate)
+    band = (frequencies >= sweep.frequency) & (frequencies <= sweep.stop_frequency)
+    
+    return inverse / np.median(gain[band])
+
+def sweep_response(recording, sweep, samplerate=44100, harmonics=3, 
+                   preroll=1e-3):
+    """Gets impulse, frequency and harmonic responses from a recorded sweep.
+    
+    The last whole sweep period in the recording is circularly convolved 
+    with the sweep's inverse filter. The linear impulse response is found 
+    at the deconvolution's maximum; the response to the k-th harmonic 
+    shows up rate_time*ln(k) seconds before it, so each one is windowed 
+    out separately.
+    
+    Parameters
+    ----------
+    recording : np.array
+        Recorded signal (one channel). Should hold at least one whole 
+        sweep period, taken while the sweep was being played on loop.
+    sweep : wavemaker.Sweep
+        Played sweep.
+    samplerate : int, float optional
+        Sampling rate. Default: 44100.
+    harmonics : int optional
+        Highest harmonic order to get (1 means linear response only). 
+        Default: 3.
+    preroll : float optional
+        Time kept before each impulse response, in seconds. Default: 1e-3.
+    
+    Returns
+    -------
+    time : np.array
+        Time of the linear impulse response, in seconds.
+    impulse : np.array
+        Linear impulse response.
+    frequencies : np.array
+        Frequencies of the responses, in Hz.
+    response : np.array
+        Complex linear frequency response.
+    distortion : list of np.array
+        Complex response of every harmonic order from 2 to harmonics. 
+        The k-th one's value at frequency f is the k-th harmonic's 
+        amplitude when exciting at f, relative to the excitation.
+    
+    Raises
+    ------
+    "Recording should hold at least one whole sweep period" : ValueError
+        If recording is too short.
+    
+    """
+    
+    recording = np.asarray(recording, dtype=float)
+    period = int(round(sweep.period * samplerate))
+    if len(recording) < period:
+        raise ValueError("Recording should hold at least one whole sweep period")
+    
+    inverse = sweep_inverse_filter(sweep, samplerate)
+    deconvolved = np.fft.irfft(np.fft.rfft(recording[-period:]) *
+                               np.fft.rfft(inverse, period), period)
+    
+    peak = np.argmax(np.abs(deconvolved))
+    pre = int(round(preroll * samplerate))
+    offsets = [int(round(sweep.rate_time * np.log(k) * samplerate)) 
+               for k in range(1, harmonics + 2)]
+    
+    #Linear response is as long as the gap before the 2nd harmonic
+    length = offsets[1] if harmonics > 1 else int(round(sweep.rate_time * np.log(2) * samplerate))
+    start = peak - pre
+    impulse = deconvolved.take(range(start, start + length), mode='wrap')
+    time = (np.arange(length) - pre) / samplerate
+    
+    frequencies = np.fft.rfftfreq(length, 1/samplerate)
+    response = np.fft.rfft(impulse)
+    
+    distortion = []
+    for k in range(2, harmonics + 1):
+        start = peak - offsets[k-1] - pre
+        k_length = min(length, offsets[k] - offsets[k-1])
+        k_impulse = deconvolved.take(range(start, start + k_length), mode='wrap')
+        #k-th harmonic of f is found at k*f in this response
+        k_response = np.fft.rfft(k_impulse, length)
+        distortion.append(np.interp(k * frequencies, frequencies, k_response.real, right=0) +
+                          1j * np.interp(k * frequencies, frequencies, k_response.imag, right=0))
+        
+    return time, impulse, frequencies, response, distortion
+
+#%%
+
+def multisine_response(recording, multisine, periods=None):
+    """Gets the frequency response on every bin excited by a multisine.
+    
+    The last whole periods of the recording, counted from its start, are 
+    averaged and transformed; the response is read on the excited bins 
+    only, relative to the played tones. Measured phase includes whatever 
+    delay there is between playback and recording.
+    
+    Parameters
+    ----------
+    recording : np.array
+        Recorded signal (one channel), taken while the multisine was 
+        being played on loop.
+    multisine : wavemaker.Multisine
+        Played multisine.
+    periods : int or None optional
+        Number of periods to average. If None, all whole periods in the 
+        recording are used but the first one, which holds the system's 
+        transient (unless it is the only one). Default: None.
+    
+    Returns
+    -------
+    frequencies : np.array
+        Excited frequencies, in Hz.
+    amplitude : np.array
+        Response's amplitude on every excited frequency.
+    phase : np.array
+        Response's phase on every excited frequency, in radians.
+    
+    Raises
+    ------
+    "Recording should hold at least one whole multisine period" : ValueError
+        If recording is too short.
+    
+    """
+    
+    recording = np.asarray(recording, dtype=float)
+    samples = multisine.samples
+    
+    available = len(recording) // samples
+    if periods is None:
+        periods = max(1, available - 1)
+    if periods < 1 or periods > available:
+        raise ValueError("Recording should hold at least one whole multisine period")
+    
+    start = (available - periods) * samples
+    averaged = recording[start:start + periods*samples]
+    averaged = averaged.reshape(periods, samples).mean(axis=0)
+    
+    played = np.fft.rfft(multisine.period_table()[:-1].astype(float))
+    played = played[multisine.bins]
+    response = np.fft.rfft(averaged)[multisine.bins] / played
+    
+    return multisine.frequencies, np.abs(response), np.angle(response)
+
+#%%
+
+def fast_hadamard(data):
+    """Returns the (unnormalized) Walsh-Hadamard transform of data.
+    
+    Uses the fast butterfly algorithm, which is O(N log N).
+    
+    Parameters
+    ----------
+    data : np.array
+        Data to transform. Its length must be a power of 2.
+    
+    Returns
+    -------
+    np.array
+        Transformed data, in natural (Sylvester) order.
+    
+    """
+    
+    result = np.array(data, dtype=float)
+    length = len(result)
+    half = 1
+    while half < length:
+        pairs = result.reshape(-1, 2, half)
+        first = pairs[:, 0, :].copy()
+        second = pairs[:, 1, :]
+        pairs[:, 0, :] += second
+        np.subtract(first, second, out=second)
+        half *= 2
+    return result
+
+def mls_permutations(sequence, order):
+    """Returns the permutations that turn MLS correlation into a Hadamard
+    transform.
+    
+    The matrix of shifted sequences M[i,j] = sequence[(i+j) % L] equals 
+    the parity of r[i] & c[j], so it is a row and column permuted 
+    Sylvester-Hadamard matrix.
+    
+    Parameters
+    ----------
+    sequence : np.array
+        One period of the maximum length sequence, as bits.
+    order : int
+        Order of the sequence.
+    
+    Returns
+    -------
+    columns : np.array
+        Hadamard index c[j] of every sample j.
+    rows : np.array
+        Hadamard index r[i] of every shift i.
+    
+    """
+    
+    length = len(sequence)
+    index = np.arange(length)
+    weights = 2**np.arange(order)
+    
+    columns = np.zeros(length, dtype=int)
+    for k in range(order):
+        columns += sequence[(index + k) % length].astype(int) * weights[k]
+    
+    where = np.empty(length + 1, dtype=int)
+    where[columns] = index
+    unit_columns = where[weights]
+    
+    rows = np.zeros(length, dtype=int)
+    for k in range(order):
+        rows += sequence[(index + unit_columns[k]) % length].astype(int) * weights[k]
+    
+    return columns, rows
+
+def mls_response(recording, mls, periods=None):
+    """Gets the impulse response from a recorded maximum length sequence.
+    
+    Whole periods of the recording, counted from its start, are averaged
+    and circularly cross-correlated with the sequence by means of a fast 
+    Hadamard transform. Response includes whatever delay there is 
+    between playback and recording.
+    
+    Parameters
+    ----------
+    recording : np.array
+        Recorded signal (one channel), taken while the sequence was being
+        played on loop.
+    mls : wavemaker.MLS
+        Played sequence.
+    periods : int or None optional
+        Number of periods to average. If None, all whole periods in the 
+        recording are used but the first one, which holds the system's 
+        transient (unless it is the only one). Default: None.
+    
+    Returns
+    -------
+    time : np.array
+        Time of the impulse response, in seconds.
+    impulse : np.array
+        Impulse response, one sequence period long.
+    
+    Raises
+    ------
+    "Recording should hold at least one whole sequence period" : ValueError
+        If recording is too short.
+    
+    """
+    
+    recording = np.asarray(recording, dtype=float)
+    length = len(mls.sequence)
+    
+    available = len(recording) // length
+    if periods is None:
+        periods = max(1, available - 1)
+    if periods < 1 or periods > available:
+        raise ValueError("Recording should hold at least one whole sequence period")
+    
+    start = (available - periods) * length
+    averaged = recording[start:start + periods*length]
+    averaged = averaged.reshape(periods, length).mean(axis=0)
+    
+    columns, rows = mls_permutations(mls.sequence, mls.order)
+    permuted = np.zeros(length + 1)
+    permuted[columns] = averaged
+    transformed = fast_hadamard(permuted)
+    
+    #Correlation at lag t is found on the row of shift -t
+    correlation = transformed[rows[(-np.arange(length)) % length]]
+    
+    #MLS autocorrelation is L at lag 0 and -1 elsewhere
+    impulse = (correlation + correlation.sum()) / (mls.amplitude * (length + 1))
+    time = np.arange(length) / mls.samplerate
+    
+    return time, impulse
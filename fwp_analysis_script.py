@@ -413,10 +413,13 @@ direc = os.path.join(os.getcwd(),
                      'Measurements',
                      'Inv_Amp_x1')
 file = os.path.join(direc, 'Inv_Amp_x1.txt')
+aligned = False # True if recorded with align=True and settling
 datos = np.loadtxt(file)
 
-# First I drop the initial silence of the measurement
-datos = datos[int(len(datos)*2/5):]
+# Older files weren't aligned, so I drop their initial silence and 
+# transient. Aligned files have none
+if not aligned:
+    datos = datos[int(len(datos)*2/5):]
 
 # Then I calibrate it
 datos[:,0] = (22+15) * cal.signal_rec_cal_left(datos[:,0]) / 15
@@ -459,6 +462,7 @@ savedir = os.path.join(os.getcwd(),
                        name)
 filename = os.path.join(savedir, name)
 makefile = lambda freq: '{}_{:.2f}_Hz.txt'.format(filename, freq)
+aligned = False # True if recorded in a MeasurementSession with settling
 
 rms = []
 for freq in frequencies:
@@ -468,7 +472,8 @@ for freq in frequencies:
     data = np.loadtxt(makefile(freq))
     data[:,0] = cal.signal_rec_cal_left(data[:,0])*ampMIC1
     data[:,1] = cal.signal_rec_cal_right(data[:,1])*ampMIC2
-    data = data[int(2*len(data[:,0])/5):,:]
+    if not aligned: # Older files start with silence and a transient
+        data = data[int(2*len(data[:,0])/5):,:]
     ndata = len(data)
     rms.append(anly.rms(data[:,0]), anly.rms[data[:,1]])
     
@@ -15,25 +15,51 @@ It contains the following functions:
 
 decode : 
     Coverts a PyAudio byte stream into a Numpy array.  
+pyaudio_format :
+    Returns the PyAudio format for a pyaudiowave sample format.
+close_stream :
+    Stops a stream and gives it back to the shared pool.
 play :
     Returns a stream that plays on blocking mode.   
+play_source :
+    Returns a playback callback for a signal generator.
 play_callback : 
     Takes a signal generator and returns a stream that plays it on callback.   
+play_rec_callback :
+    Returns a single full duplex stream that plays and records.
 rec : 
 	Returns a PyAudio stream that records a signal.	
 play_rec :  
 	Plays a signal and records another one at the same time.	
 just_play : 
 	Plays a signal.	
+correlation_delay :
+    Returns the delay of a played signal within a recording.
+measure_latency :
+    Measures round trip latency once per device configuration.
 just_rec :
 	Records a signal.	
 signal_plot : 
 	Takes an audio signal and plots it as a function of time.
 
-It also includes the following class:
+It also includes the following classes:
+
+AudioContext :
+    Shared PyAudio instance, reference counted, with a pool of open 
+    streams. The module's audio_context is used by every function; use it
+    as a context manager (with fwp.audio_context: ...) to keep PortAudio
+    and its streams open across many calls.
 
 AfterRecording :
 	Has paramaters to decide what actions to take after recording.
+Prerender :
+    Renders a signal generator ahead on a background thread.
+Recorder :
+    Records on callback straight into a preallocated float32 array or 
+    ring buffer, readable while recording.
+MeasurementSession :
+    Keeps input and output streams running across many measurements,
+    swapping the played signal and recording right after each swap.
 	
 @date: 05/09/2018
 @author: Vall
@@ -43,7 +69,9 @@ AfterRecording :
 import fwp_save as sav
 import matplotlib.pyplot as plt
 import numpy as np
-import os, time, pyaudio
+import os, queue, threading, time, pyaudio
+import pyaudiowave
+import wavemaker
 
 #%%
 
@@ -73,7 +101,7 @@ def decode(in_data, channels):
         
     """
     
-    result = np.fromstring(in_data, dtype=np.float32)
+    result = np.frombuffer(in_data, dtype=np.float32)
 
     chunk_length = len(result) / channels
     assert chunk_length == int(chunk_length)
@@ -86,13 +114,240 @@ def decode(in_data, channels):
 
 #%%
 
+PYAUDIO_FORMATS = {'float32': pyaudio.paFloat32,
+                   'int16': pyaudio.paInt16,
+                   'int24': pyaudio.paInt24,
+                   'int32': pyaudio.paInt32}
+
+def pyaudio_format(sampleformat):
+    
+    """Returns the PyAudio format for a pyaudiowave sample format.
+    
+    Parameters
+    ---------
+    sampleformat : str {'float32', 'int16', 'int24', 'int32'}
+        Sample format, as in PyAudioWave's sample_format attribute.
+    
+    Returns
+    -------
+    PyAudio format
+        i.e. pyaudio.paInt16 for 'int16'.
+    
+    """
+    
+    return PYAUDIO_FORMATS[sampleformat]
+
+#%%
+
+class Trampoline:
+    """Stream callback that forwards to a replaceable target.
+    
+    PortAudio binds a callback when a stream is opened, so pooled callback
+    streams get a trampoline instead, pointed to each new user's callback.
+    
+    Attributes
+    ----------
+    target : callable or None
+        Callback to forward to. If None, the stream completes.
+    
+    """
+    
+    def __init__(self):
+        
+        self.target = None
+    
+    def __call__(self, in_data, frame_count, time_info, status):
+        
+        target = self.target
+        if target is None:
+            return (None, pyaudio.paComplete)
+        return target(in_data, frame_count, time_info, status)
+
+class AudioContext:
+    """Shared PyAudio instance, reference counted, with a pool of streams.
+    
+    PortAudio is initialized when the first reference is taken and 
+    terminated, closing every pooled stream, when the last one is given 
+    back. Every open stream holds a reference, and so does every with 
+    block, so within one all streams stay open and are reused.
+    
+    Streams are pooled by (device, channels, format, rate, direction), by
+    frames per buffer and by whether they use a callback. 
+    
+    Attributes
+    ----------
+    pyaudio : PyAudio instance or None
+        Shared instance, while referenced.
+    references : int
+        Number of references taken.
+    pool : dict
+        Lists of idle streams by key.
+    
+    Methods
+    ----------
+    acquire
+        takes a reference and returns the PyAudio instance.
+    release
+        gives a reference back.
+    open
+        returns a started stream, from the pool if possible.
+    close
+        stops a stream and puts it back in the pool.
+    
+    """
+    
+    def __init__(self):
+        
+        self.pyaudio = None
+        self.references = 0
+        self.pool = {}
+        self.lock = threading.RLock()
+    
+    def acquire(self):
+        
+        """Takes a reference and returns the PyAudio instance."""
+        
+        with self.lock:
+            if self.references == 0:
+                self.pyaudio = pyaudio.PyAudio()
+            self.references += 1
+            return self.pyaudio
+    
+    def release(self):
+        
+        """Gives a reference back. Terminates PortAudio on the last one."""
+        
+        with self.lock:
+            self.references -= 1
+            if self.references == 0:
+                for streams in self.pool.values():
+                    for stream in streams:
+                        stream.close()
+                self.pool.clear()
+                self.pyaudio.terminate()
+                self.pyaudio = None
+    
+    def __enter__(self):
+        
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exception):
+        
+        self.release()
+    
+    def open(self, direction, channels, sampleformat, rate, device=None, 
+             callback=None, frames=None):
+        
+        """Returns a started stream, taken from the pool if possible.
+        
+        Parameters
+        ---------
+        direction : str {'input', 'output', 'duplex'}
+            Stream direction. A duplex stream both plays and records, with
+            the same channels and format, on a single callback.
+        channels : int
+            Number of channels.
+        sampleformat : PyAudio format
+            i.e. pyaudio.paFloat32.
+        rate : int
+            Sampling rate.
+        device : int, tuple or None optional
+            Device index, or (input, output) indexes for a duplex stream.
+            If None, the default device. Default: None.
+        callback : callable or None optional
+            Stream callback. If None, the stream is blocking. 
+            Default: None.
+        frames : int or None optional
+            Frames per buffer. If None, PortAudio picks it. Default: None.
+        
+        Returns
+        -------
+        PyAudio stream object
+            Started stream. Give it back with close.
+        
+        """
+        
+        key = (device, channels, sampleformat, rate, direction, frames,
+               callback is not None)
+        
+        with self.lock:
+            p = self.acquire()
+            idle = self.pool.get(key)
+            if idle:
+                stream = idle.pop()
+            else:
+                if direction == 'duplex':
+                    directions, devices = ('input', 'output'), device
+                else:
+                    directions, devices = (direction,), (device,)
+                options = {}
+                for name, index in zip(directions, devices or (None,)*2):
+                    options[name] = True
+                    if index is not None:
+                        options[name + '_device_index'] = index
+                if frames is not None:
+                    options['frames_per_buffer'] = frames
+                trampoline = None
+                if callback is not None:
+                    trampoline = Trampoline()
+                    options['stream_callback'] = trampoline
+                try:
+                    stream = p.open(format=sampleformat, channels=channels,
+                                    rate=rate, start=False, **options)
+                except:
+                    #The stream would have held this reference
+                    self.release()
+                    raise
+                stream.pool_key = key
+                stream.trampoline = trampoline
+        
+        if stream.trampoline is not None:
+            stream.trampoline.target = callback
+        stream.start_stream()
+        return stream
+    
+    def close(self, stream):
+        
+        """Stops a stream and puts it back in the pool for reuse."""
+        
+        if not stream.is_stopped():
+            stream.stop_stream()
+        if stream.trampoline is not None:
+            stream.trampoline.target = None
+        with self.lock:
+            self.pool.setdefault(stream.pool_key, []).append(stream)
+            self.release()
+
+audio_context = AudioContext()
+
+def close_stream(stream):
+    
+    """Stops a stream and gives it back to the shared pool.
+    
+    Streams made by play, play_callback or rec should be closed with this
+    function, so that they can be reused.
+    
+    Parameters
+    ---------
+    stream : PyAudio stream object
+        Stream made by play, play_callback or rec.
+    
+    """
+    
+    audio_context.close(stream)
+
+#%%
+
 def play(nchannelsplay=1, 
          formatplay=pyaudio.paFloat32,
-         samplerate=44100):
+         samplerate=44100,
+         device=None):
     
     """Returns a stream that plays on blocking mode.
     
-    This function returns a PyAudio stream that plays in blocking mode.
+    This function returns a PyAudio stream that plays in blocking mode. 
+    It's taken from the shared pool (see AudioContext) if possible.
     
     Parameters
     ---------
@@ -102,35 +357,209 @@ def play(nchannelsplay=1,
         Signal's format. Default: paFloat32	
     samplerate : int, float optional
         Sampling rate at which the signal should be played. Default: 44100
+    device : int or None optional
+        Output device index. If None, the default one. Default: None.
     
     Returns
     -------
     PyAudio stream object
-        Object to be called to play the signal.
+        Object to be called to play the signal. Close it with 
+        close_stream.
     """
-   
-    p = pyaudio.PyAudio()
     
-    streamplay = p.open(format=formatplay,
-                        channels=nchannelsplay,
-                        rate=samplerate,
-                        output=True)
+    streamplay = audio_context.open('output', nchannelsplay, formatplay,
+                                    samplerate, device)
     
     return streamplay
 
     
 #%%
 
+class Prerender:
+    """Renders a signal generator ahead on a background thread.
+    
+    Chunks are copied into a bounded queue as soon as they are yielded, 
+    so whoever consumes them (i.e. a PortAudio callback) only has to take
+    them out. The thread blocks while the queue is full.
+    
+    If the generator raises, rendering ends as if it had run out, and the
+    exception is raised again by stop, on the caller's thread.
+    
+    Rendering starts on construction. Call prime before starting the 
+    stream, so that its first callbacks find the queue full.
+    
+    Parameters
+    ----------
+    generator : generator
+        Yields chunks to be played (i.e. from a SignalMaker instance).
+    depth : int optional
+        Maximum number of chunks rendered ahead. Default: 8.
+    
+    Attributes
+    ----------
+    underruns : int
+        Times a chunk was requested but none was ready.
+    error : Exception or None
+        Exception raised by the generator, if any.
+    
+    Methods
+    ----------
+    prime
+        waits until the queue is full or the generator run out.
+    get
+        returns next chunk as bytes, or None once the generator run out.
+    stop
+        stops rendering and raises the generator's exception, if any.
+    
+    """
+    
+    def __init__(self, generator, depth=8):
+        
+        self.generator = generator
+        self.queue = queue.Queue(maxsize=depth)
+        self.underruns = 0
+        self.finished = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.primed = threading.Event()
+        self.thread = threading.Thread(target=self.render, daemon=True)
+        self.thread.start()
+    
+    def render(self):
+        
+        """Puts copies of the generator's chunks in the queue until it 
+        runs out or rendering is stopped."""
+        
+        chunks = iter(self.generator)
+        chunk = b''
+        while chunk is not None and not self.stopped.is_set():
+            try:
+                chunk = next(chunks).tobytes()
+            except StopIteration:
+                chunk = None
+            except Exception as error:
+                #Kept for stop to raise; the callback just sees the end
+                self.error = error
+                chunk = None
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(chunk, timeout=.1)
+                    break
+                except queue.Full:
+                    pass
+            if chunk is None or self.queue.full():
+                self.primed.set()
+        self.primed.set()
+    
+    def prime(self, timeout=None):
+        
+        """Blocks until depth chunks are queued or the generator run out,
+        or until timeout seconds have passed. Returns True if primed."""
+        
+        return self.primed.wait(timeout)
+    
+    def get(self):
+        
+        """Returns next chunk, b'' if none is ready or None if done.
+        
+        Never blocks. If no chunk is ready, underruns is increased."""
+        
+        if self.finished:
+            return None
+        try:
+            chunk = self.queue.get_nowait()
+        except queue.Empty:
+            self.underruns += 1
+            return b''
+        if chunk is None:
+            self.finished = True
+        return chunk
+    
+    def stop(self):
+        
+        """Stops rendering and waits for the thread to end. Raises the 
+        generator's exception, if it raised one."""
+        
+        self.stopped.set()
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+#%%
+
+def play_source(signalplaygen,
+                nchannelsplay=1, 
+                formatplay=pyaudio.paFloat32,
+                repeat=False,
+                readahead=0):
+    
+    """Returns a playback callback for a generator, and its Prerender.
+    
+    Parameters are those of play_callback. The callback returns 
+    (None, paComplete) once the generator runs out. The Prerender is None 
+    unless readahead is given, in which case it's primed before returning.
+    
+    """
+    
+    if repeat and readahead:
+        raise ValueError("readahead can't be used with repeat, which " +
+                         "plays a single chunk")
+    
+    prerender = None
+    
+    if repeat:
+        #retains behaviour of other play_callback_gen function
+        signalplay = next(signalplaygen)
+        def callback(in_data, frame_count, time_info, status):
+             return (signalplay, pyaudio.paContinue)
+            
+    else: #Still needs checks to see if generator run out
+        def callback(in_data, frame_count, time_info, status):
+            try:
+                signalplay = next(signalplaygen) 
+                return (signalplay, pyaudio.paContinue)
+                #If generator run out
+                
+            except StopIteration:
+                return (None, pyaudio.paComplete)
+    
+    if readahead and not repeat:
+        prerender = Prerender(signalplaygen, readahead)
+        prerender.prime()
+        frame_bytes = nchannelsplay * pyaudio.get_sample_size(formatplay)
+        silences = {}
+        
+        def callback(in_data, frame_count, time_info, status):
+            signalplay = prerender.get()
+            if signalplay is None:
+                return (None, pyaudio.paComplete)
+            if not signalplay: #Underrun
+                if frame_count not in silences:
+                    silences[frame_count] = bytes(frame_count * frame_bytes)
+                signalplay = silences[frame_count]
+            return (signalplay, pyaudio.paContinue)
+    
+    return callback, prerender
+
+#%%
+
 def play_callback(signalplaygen,
                   nchannelsplay=1, 
                   formatplay=pyaudio.paFloat32,
                   samplerate=44100, 
-                  repeat=False):
+                  repeat=False,
+                  readahead=0,
+                  device=None):
     
     """Takes a generator and returns a stream that plays it on callback.
     
     This function takes a signal and returns a PyAudio stream that plays 
-    it in non-blocking mode.
+    it in non-blocking mode. It's taken from the shared pool (see 
+    AudioContext) if possible.
+    
+    If readahead is given, the signal is rendered on a background thread
+    (see Prerender) and the callback only takes ready chunks out of a 
+    queue. If none is ready, it plays silence and counts an underrun.
     
     Parameters
     ---------
@@ -146,38 +575,29 @@ def play_callback(signalplaygen,
         Decides wether the callback funtion should repeat the first
         it yields or keep yielding new arrays, if for some reason you
         should want that behaviour. Default: False.
+    readahead : int optional
+        Number of chunks to render ahead on a background thread. They are
+        all rendered before the stream is returned. If 0, chunks are 
+        rendered inside the callback. Can't be used with repeat, which 
+        plays a single chunk. Default: 0.
+    device : int or None optional
+        Output device index. If None, the default one. Default: None.
     
     Returns
     -------
     PyAudio stream object
-        Object to be called to play the signal.
+        Object to be called to play the signal. Close it with 
+        close_stream. If readahead is used, its prerender attribute holds
+        the Prerender instance (i.e. to check underruns or stop it).
     
     """
    
-    p = pyaudio.PyAudio()
+    callback, prerender = play_source(signalplaygen, nchannelsplay, 
+                                      formatplay, repeat, readahead)
     
-    if repeat:
-        #retains behaviour of other play_callback_gen function
-        signalplay = next(signalplaygen)
-        def callback(in_data, frame_count, time_info, status):
-             return (signalplay, pyaudio.paContinue)
-            
-    else: #Still needs checks to see if generator run out
-        def callback(in_data, frame_count, time_info, status):
-            try:
-                signalplay = next(signalplaygen) 
-                return (signalplay, pyaudio.paContinue)
-                #If generator run out
-                
-            except StopIteration:
-                return (None, pyaudio.paComplete)
-                
-            
-    streamplay = p.open(format=formatplay,
-                        channels=nchannelsplay,
-                        rate=samplerate,
-                        output=True,
-                        stream_callback=callback)
+    streamplay = audio_context.open('output', nchannelsplay, formatplay,
+                                    samplerate, device, callback)
+    streamplay.prerender = prerender
     
     return streamplay
 
@@ -185,7 +605,8 @@ def play_callback(signalplaygen,
 
 def rec(nchannelsrec=1,
         formatrec=pyaudio.paFloat32,
-        samplerate=44100):
+        samplerate=44100,
+        device=None):
     
     """Returns a PyAudio stream that records a signal.
     
@@ -203,25 +624,308 @@ def rec(nchannelsrec=1,
     samplerate: int, float optional
         Sampling rate at which the signal should be recorded. 
         Default: 44100.
+    device : int or None optional
+        Input device index. If None, the default one. Default: None.
     
     Returns
     -------
     PyAudio stream object
-        Object to be called to record a signal.
+        Object to be called to record a signal. Close it with 
+        close_stream.
     
     """
     
-    p = pyaudio.PyAudio()
-
-    streamrec = p.open(format=formatrec,
-                       channels=nchannelsrec,
-                       rate=samplerate,
-                       input=True)
+    streamrec = audio_context.open('input', nchannelsrec, formatrec, 
+                                   samplerate, device)
     
     return streamrec   
 
 #%%
 
+class Recorder:
+    """Records on callback straight into a preallocated float32 array.
+    
+    Each incoming block is copied once, into a (frames, channels) float32 
+    buffer, so there's no intermediate byte string to decode afterwards.
+    With a duration, the stream completes when the buffer is full. Without
+    it, the buffer is a ring holding the last ring_duration seconds and it
+    records until stopped. Frames captured so far can be read while 
+    recording.
+    
+    Parameters
+    ----------
+    duration : int, float or None optional
+        Duration of the recording, in seconds. If None, records into a 
+        ring buffer until stopped. Default: None.
+    nchannelsrec : int optional
+        Recorded signal's number of channels. Default: 1.
+    samplerate : int, float optional
+        Sampling rate. Default: 44100.
+    ring_duration : int, float optional
+        Ring buffer's length, in seconds, when duration is None. 
+        Default: 10.
+    device : int or None optional
+        Input device index. If None, the default one. Default: None.
+    streamchannels : int or None optional
+        Number of channels in the incoming blocks, if more than 
+        nchannelsrec (i.e. on a duplex stream); only the first nchannelsrec
+        are kept. If None, nchannelsrec. Default: None.
+    
+    Attributes
+    ----------
+    buffer : numpy array
+        Preallocated (frames, channels) float32 buffer.
+    recorded : int
+        Number of frames captured since started.
+    done : threading.Event
+        Set when the buffer is full (only with a duration).
+    
+    Methods
+    ----------
+    start
+        opens the stream and starts recording.
+    wait
+        blocks until the recording is done and returns it.
+    stop
+        stops recording and gives the stream back.
+    available
+        returns the frames captured so far.
+    latest
+        returns the last frames captured.
+    
+    """
+    
+    def __init__(self, duration=None, nchannelsrec=1, samplerate=44100, 
+                 ring_duration=10, device=None, streamchannels=None):
+        
+        self.ring = duration is None
+        if self.ring:
+            duration = ring_duration
+        frames = int(round(samplerate * duration))
+        
+        self.nchannelsrec = nchannelsrec
+        self.streamchannels = streamchannels or nchannelsrec
+        self.samplerate = samplerate
+        self.device = device
+        self.buffer = np.zeros((frames, nchannelsrec), dtype=np.float32)
+        self.recorded = 0
+        self.done = threading.Event()
+        self.streamrec = None
+    
+    def callback(self, in_data, frame_count, time_info, status):
+        
+        block = np.frombuffer(in_data, dtype=np.float32).reshape(
+                -1, self.streamchannels)[:, :self.nchannelsrec]
+        size = len(self.buffer)
+        
+        if self.ring:
+            #Frames that wouldn't fit are overwritten by the rest anyway
+            skipped = max(len(block) - size, 0)
+            block = block[skipped:]
+            start = (self.recorded + skipped) % size
+            first = min(len(block), size - start)
+            self.buffer[start:start+first] = block[:first]
+            self.buffer[:len(block)-first] = block[first:]
+            self.recorded += frame_count
+            return (None, pyaudio.paContinue)
+        
+        frames = min(len(block), size - self.recorded)
+        self.buffer[self.recorded:self.recorded+frames] = block[:frames]
+        self.recorded += frames
+        if self.recorded < size:
+            return (None, pyaudio.paContinue)
+        self.done.set()
+        return (None, pyaudio.paComplete)
+    
+    def start(self):
+        
+        """Opens an input stream on callback and starts recording."""
+        
+        self.recorded = 0
+        self.done.clear()
+        self.streamrec = audio_context.open(
+                'input', self.nchannelsrec, pyaudio.paFloat32, 
+                self.samplerate, self.device, self.callback)
+        return self
+    
+    def stop(self):
+        
+        """Stops recording and gives the stream back to the shared pool."""
+        
+        if self.streamrec is not None:
+            close_stream(self.streamrec)
+            self.streamrec = None
+    
+    def wait(self, timeout=None):
+        
+        """Blocks until the buffer is full, stops and returns the recording.
+        
+        Parameters
+        ---------
+        timeout : int, float or None optional
+            Maximum time to wait, in seconds. If None, waits as long as 
+            needed. Default: None.
+        
+        Returns
+        -------
+        numpy array
+            Recorded signal (see available).
+        
+        """
+        
+        if self.ring:
+            raise ValueError('A ring buffer records until stopped.')
+        if not self.done.wait(timeout):
+            raise TimeoutError('Recording took too long.')
+        self.stop()
+        return self.available()
+    
+    def available(self):
+        
+        """Returns the frames captured so far, in order.
+        
+        Without a duration, returns the ring buffer's content (see latest).
+        
+        Returns
+        -------
+        numpy array
+            A view of the buffer, with shape (frames, channels), or 
+            (frames,) if there's only one channel.
+        
+        """
+        
+        if self.ring:
+            return self.latest()
+        return self.squeeze(self.buffer[:self.recorded])
+    
+    def latest(self, frames=None):
+        
+        """Returns a copy of the last frames captured, in order.
+        
+        Parameters
+        ---------
+        frames : int or None optional
+            Number of frames. If None, as many as have been captured and 
+            the buffer holds. Default: None.
+        
+        Returns
+        -------
+        numpy array
+            Shaped (frames, channels), or (frames,) if there's only one 
+            channel.
+        
+        """
+        
+        recorded = self.recorded
+        size = len(self.buffer)
+        if frames is None:
+            frames = recorded
+        frames = min(frames, recorded, size)
+        
+        if self.ring:
+            index = np.arange(recorded - frames, recorded) % size
+            return self.squeeze(self.buffer[index])
+        return self.squeeze(self.buffer[recorded-frames:recorded].copy())
+    
+    def squeeze(self, signal):
+        
+        if self.nchannelsrec == 1:
+            return signal[:, 0]
+        return signal
+
+#%%
+
+def play_rec_callback(signalplaygen, recorder,
+                      nchannelsplay=1,
+                      repeat=False,
+                      readahead=0,
+                      device=None,
+                      buffersize=None):
+    
+    """Returns a single stream that plays a generator and feeds a Recorder.
+    
+    Opens one full duplex stream, in float32 format, whose callback 
+    fills each output block and captures the matching input block in the
+    same cycle, so playback and recording are locked to the sample. The
+    stream has as many channels as the larger of both sides: extra output
+    channels are silent and extra input channels are dropped. Silence is 
+    played after the generator runs out and the stream completes when the
+    recorder is full.
+    
+    The stream is opened with buffersize frames per buffer, but chunks are
+    not assumed to match PortAudio's blocks: frames left over from a chunk
+    are played first in the next block.
+    
+    Parameters
+    ---------
+    signalplaygen : generator
+        Yields float32 chunks to be played.
+    recorder : Recorder instance
+        Recorder with a duration, not started. Its streamchannels must be 
+        the stream's number of channels.
+    nchannelsplay : int optional
+        Number of channels signal should be played at. Default: 1.
+    repeat : bool optional
+        See play_callback. Default: False.
+    readahead : int optional
+        See play_callback. Default: 0.
+    device : tuple or None optional
+        (input, output) device indexes. If None, the default ones. 
+        Default: None.
+    buffersize : int or None optional
+        Frames per buffer, i.e. the generator's chunk length. If None, 
+        PortAudio picks it. Default: None.
+    
+    Returns
+    -------
+    PyAudio stream object
+        Started duplex stream. Close it with close_stream. Its prerender 
+        attribute works as play_callback's.
+    
+    """
+    
+    channels = recorder.streamchannels
+    source, prerender = play_source(signalplaygen, nchannelsplay, 
+                                    pyaudio.paFloat32, repeat, readahead)
+    blocks = {}
+    leftover = np.zeros((0, nchannelsplay), dtype=np.float32)
+    
+    def callback(in_data, frame_count, time_info, status):
+        
+        nonlocal leftover
+        if frame_count not in blocks:
+            blocks[frame_count] = np.zeros((frame_count, channels), 
+                                           dtype=np.float32)
+        block = blocks[frame_count]
+        
+        #Chunks are only requested once the previous one was played whole
+        filled = 0
+        while filled < frame_count:
+            if not len(leftover):
+                signalplay, flag = source(None, frame_count, time_info, 
+                                          status)
+                if signalplay is None or flag == pyaudio.paComplete:
+                    break
+                leftover = np.frombuffer(signalplay, dtype=np.float32
+                                         ).reshape(-1, nchannelsplay)
+            frames = min(len(leftover), frame_count - filled)
+            block[filled:filled+frames, :nchannelsplay] = leftover[:frames]
+            leftover = leftover[frames:]
+            filled += frames
+        block[filled:] = 0
+        
+        return (block.tobytes(), 
+                recorder.callback(in_data, frame_count, time_info, status)[1])
+    
+    stream = audio_context.open('duplex', channels, pyaudio.paFloat32,
+                                recorder.samplerate, device, callback, 
+                                buffersize)
+    stream.prerender = prerender
+    
+    return stream
+
+#%%
+
 class AfterRecording:
     """Has paramaters to decide what actions to take after recording.
     
@@ -238,6 +942,9 @@ class AfterRecording:
         If True, the script will save a .txt with recorded signal .
     filename : str
         Name with which to save output files produced by the script.
+    plotlegend : None or list of strings
+        Channels' names for the plot. If None, they are named left and 
+        right if there are two, and numbered otherwise.
     
     
     Methods
@@ -250,13 +957,15 @@ class AfterRecording:
     
     def __init__(self, savewav=False, showplot=True, 
                  saveplot=False, savetext=False, 
-                 filename=os.path.join(os.getcwd(),'Output')):
+                 filename=os.path.join(os.getcwd(),'Output'),
+                 plotlegend=None):
         
         self.savewav=savewav
         self.showplot=showplot
         self.saveplot=saveplot
         self.savetext=savetext
         self.filename=filename
+        self.plotlegend=plotlegend
 
 	
     def act(self, signalrec, nchannelsrec, samplerate, filename=None):
@@ -295,7 +1004,7 @@ class AfterRecording:
         signalrec = decode(signalrec, nchannelsrec)
         
         if self.showplot:
-            signal_plot(signalrec)
+            signal_plot(signalrec, samplerate, plotlegend=self.plotlegend)
             
             if self.saveplot:
                 sav.saveplot((filename+'.pdf'))
@@ -310,15 +1019,20 @@ def play_rec(signal_setup, #1st column left
               recording_duration=None,
               nchannelsrec=1,
               after_recording=None,
-              repeat=False):
+              repeat=False,
+              readahead=0,
+              duplex=False,
+              align=False,
+              settling=0,
+              device=None):
     
     """Plays a signal and records another one at the same time.
     
     This function plays an audio signal with a certain number of 
     channels. At the same time, it records another signal with a given 
     number of channels. It runs for a given time. And it plays and 
-    records using the same sampling rate and the same pyaudio.paFloat32 
-    format.
+    records using the same sampling rate. It plays with the signal's 
+    sample format and records with pyaudio.paFloat32 format.
     
     Parameters
     ---------
@@ -336,12 +1050,32 @@ def play_rec(signal_setup, #1st column left
 		  Decides wether the callback funtion should repeat the first
         array it yields or keep yielding new arrays, if for some
         reason you should want that behaviour. Default: False.
+    readahead : int optional
+        Number of chunks to render ahead on a background thread (see
+        play_callback). Default: 0.
+    duplex : bool optional
+        If True, plays and records on a single full duplex stream (see 
+        play_rec_callback), so the recording is locked to the playback 
+        to the sample. Needs the float32 sample format. Default: False.
+    align : bool optional
+        If True, returns only the window that starts when the played 
+        signal reaches the input, after settling. Round trip latency is 
+        measured once per configuration (see measure_latency). It forces 
+        duplex, since only a single stream keeps that latency fixed, so 
+        it also needs the float32 sample format. Default: False.
+    settling : int, float optional
+        Time skipped after the played signal reaches the input when 
+        aligning, in seconds, so that transients are left out. Default: 0.
+    device : tuple or None optional
+        (input, output) device indexes. If None, the default ones. 
+        Default: None.
 		
     
     Returns
     -------
-    PyAudio byte stream
-        Recorded signal.
+    numpy array
+        Recorded float32 signal, shaped (frames, channels) if there's more
+        than one channel.
     
     """
 	
@@ -352,34 +1086,169 @@ def play_rec(signal_setup, #1st column left
             recording_duration = signal_setup.duration
         
     samplerate = signal_setup.parent.sampling_rate
-    streamplay = play_callback(signal_setup.generator,
-                               nchannelsplay=signal_setup.parent.nchannels,
-                               formatplay=pyaudio.paFloat32,
-                               samplerate=samplerate,
-                               repeat=repeat)
-    
-    streamrec = rec(nchannelsrec=nchannelsrec,
-                    formatrec=pyaudio.paFloat32,
-                    samplerate=samplerate)
+    buffersize = signal_setup.parent.buffer_size
+    nchannelsplay = signal_setup.parent.nchannels
+    inputdevice, outputdevice = device or (None, None)
+    
+    if (duplex or align) and signal_setup.parent.sample_format != 'float32':
+        raise ValueError('A duplex stream, as used by align, needs float32 '
+                         'sample format.')
+    
+    skip = 0
+    if align:
+        duplex = True
+        skip = measure_latency(samplerate, buffersize,
+                               nchannelsplay, nchannelsrec, device)
+        skip += int(round(settling * samplerate))
+        frames = int(round(recording_duration * samplerate))
+        recording_duration = (skip + frames) / samplerate
+    
+    if duplex:
+        recorder = Recorder(recording_duration, nchannelsrec, samplerate, 
+                            streamchannels=max(nchannelsplay, nchannelsrec))
+        print("* Recording")
+        streamplay = play_rec_callback(signal_setup.generator, recorder,
+                                       nchannelsplay=nchannelsplay,
+                                       repeat=repeat,
+                                       readahead=readahead,
+                                       device=device,
+                                       buffersize=buffersize)
     
-    streamplay.start_stream()
-    print("* Recording")
-    streamrec.start_stream()
-    signalrec = streamrec.read(int(samplerate * recording_duration))
+    else:
+        streamplay = play_callback(signal_setup.generator,
+                                   nchannelsplay=nchannelsplay,
+                                   formatplay=pyaudio_format(
+                                           signal_setup.parent.sample_format),
+                                   samplerate=samplerate,
+                                   repeat=repeat,
+                                   readahead=readahead,
+                                   device=outputdevice)
+        recorder = Recorder(recording_duration, nchannelsrec, samplerate,
+                            device=inputdevice)
+        print("* Recording")
+        recorder.start()
+    
+    signalrec = recorder.wait()[skip:]
     print("* Done recording")
 
-    streamrec.stop_stream()
     streamplay.stop_stream()
+    close_stream(streamplay)
     
-    streamrec.close()
-    streamplay.close()
+    if streamplay.prerender is not None:
+        streamplay.prerender.stop()
+        if streamplay.prerender.underruns:
+            print("* {} underruns".format(streamplay.prerender.underruns))
     
     if after_recording is None:
         after_recording = AfterRecording()
     
     after_recording.act(signalrec, nchannelsrec, samplerate)
     
-    return decode(signalrec, channels=nchannelsrec)
+    return signalrec
+
+#%%
+
+latencies = {}
+
+def correlation_delay(recording, reference):
+    
+    """Returns the delay of a reference signal within a recording.
+    
+    Takes the lag that maximizes their cross-correlation, computed with 
+    FFTs. If the recording has more than one channel, the one with the 
+    largest peak is used.
+    
+    Parameters
+    ---------
+    recording : numpy array
+        Recorded signal, shaped (frames,) or (frames, channels).
+    reference : numpy array
+        Played signal, shaped (frames,).
+    
+    Returns
+    -------
+    delay : int
+        Number of samples by which the reference is delayed.
+    channel : int
+        Channel where the delay was found.
+    
+    """
+    
+    recording = np.asarray(recording, dtype=float).reshape(len(recording), 
+                                                           -1)
+    reference = np.asarray(reference, dtype=float)
+    
+    #Zero padding makes circular correlation a linear one
+    size = 1 << int(len(recording) + len(reference) - 1).bit_length()
+    spectrum = np.conj(np.fft.rfft(reference, size))
+    correlation = np.fft.irfft(np.fft.rfft(recording, size, axis=0) * 
+                               spectrum[:, None], size, axis=0)
+    correlation = np.abs(correlation[:len(recording)])
+    
+    delay, channel = np.unravel_index(np.argmax(correlation), 
+                                      correlation.shape)
+    return int(delay), int(channel)
+
+def measure_latency(samplerate=44100, buffersize=1024, nchannelsplay=1, 
+                    nchannelsrec=1, device=None, order=14, remeasure=False):
+    
+    """Returns round trip latency between playback and recording.
+    
+    Plays a maximum length sequence once on a duplex stream (see 
+    play_rec_callback), while recording for twice its length, and finds it
+    in the recording by cross-correlation (see correlation_delay). Inputs
+    and outputs must be connected in loop, at least on one channel.
+    
+    Results are cached in the module's latencies dict by configuration, 
+    (device, samplerate, buffersize, nchannelsplay, nchannelsrec), so 
+    that each one is measured only once.
+    
+    Parameters
+    ---------
+    samplerate : int optional
+        Sampling rate. Default: 44100.
+    buffersize : int optional
+        Chunk length. Default: 1024.
+    nchannelsplay : int optional
+        Played signal's number of channels. Default: 1.
+    nchannelsrec : int optional
+        Recorded signal's number of channels. Default: 1.
+    device : tuple or None optional
+        (input, output) device indexes. If None, the default ones. 
+        Default: None.
+    order : int optional
+        Order of the played sequence, which is 2**order - 1 samples long. 
+        Default: 14.
+    remeasure : bool optional
+        If True, measures again even if there's a cached value. 
+        Default: False.
+    
+    Returns
+    -------
+    int
+        Latency in samples.
+    
+    """
+    
+    key = (device, samplerate, buffersize, nchannelsplay, nchannelsrec)
+    if key in latencies and not remeasure:
+        return latencies[key]
+    
+    mls = wavemaker.MLS(order, samplerate, amplitude=.5)
+    signalmaker = pyaudiowave.PyAudioWave(samplerate, buffersize, 
+                                          nchannels=nchannelsplay, cache=None)
+    signal_setup = signalmaker.generator_setup(mls, mls.period, loop=False)
+    
+    recording = play_rec(signal_setup, 2 * mls.period, nchannelsrec,
+                         after_recording=AfterRecording(showplot=False),
+                         duplex=True, device=device)
+    reference = mls.evaluate(np.arange(len(mls.sequence)) / samplerate)
+    latency = correlation_delay(recording, reference)[0]
+    
+    latencies[key] = latency
+    print("* Latency: {} samples ({:.2f} ms)".format(
+            latency, 1e3 * latency / samplerate))
+    return latency
 
 #%%
 
@@ -388,8 +1257,8 @@ def just_play(signal_setup, exceptions = True):
     """Plays a signal in blocking mode.
     
     This function plays an audio signal with a certain number of 
-    channels and a certain sampling rate, with pyaudio.paFloat32 format in
-    blocking mode.
+    channels and a certain sampling rate, with the signal's sample format 
+    in blocking mode.
     
     Parameters
     ---------
@@ -402,7 +1271,7 @@ def just_play(signal_setup, exceptions = True):
     """
     
     streamplay = play(nchannelsplay=signal_setup.parent.nchannels,
-                  formatplay=pyaudio.paFloat32,
+                  formatplay=pyaudio_format(signal_setup.parent.sample_format),
                   samplerate=signal_setup.parent.sampling_rate)
 
 
@@ -412,22 +1281,24 @@ def just_play(signal_setup, exceptions = True):
     print("* Playing")
 
     for data in signal_setup.generator:
-        streamplay.write(data)
+        #Chunks are numpy arrays, whose len is in frames, not bytes
+        streamplay.write(data, num_frames=len(data))
 
     
     streamplay.stop_stream()
     print("* Done playing")
-    streamplay.close()
+    close_stream(streamplay)
 
 #%%
     
-def just_play_NB(signal_setup, do_while_playing, wait_time=0, *args, **kwargs):
+def just_play_NB(signal_setup, do_while_playing, wait_time=0, *args, 
+                 readahead=0, **kwargs):
      
     """Plays a signal in and calls a function while playing.
     
     This function plays an audio signal with a certain number of 
-    channels and a certain sampling rate, with pyaudio.paFloat32 format in
-    non blocking mode. Can call a given function while playing.
+    channels and a certain sampling rate, with the signal's sample format 
+    in non blocking mode. Can call a given function while playing.
     
     Parameters
     ---------
@@ -439,12 +1310,17 @@ def just_play_NB(signal_setup, do_while_playing, wait_time=0, *args, **kwargs):
         sholud be passed to *args and **kwargs
     wait_time : float (Optional)
         Time to wait before calling do_while_playing in seconds. Default: 0.
+    readahead : int (Optional, keyword only)
+        Number of chunks to render ahead on a background thread (see
+        play_callback). Default: 0.
     """
     
     streamplay = play_callback(signal_setup.generator,
                           nchannelsplay=signal_setup.parent.nchannels, 
-                          formatplay=pyaudio.paFloat32,
-                          samplerate=signal_setup.parent.sampling_rate)
+                          formatplay=pyaudio_format(
+                                  signal_setup.parent.sample_format),
+                          samplerate=signal_setup.parent.sampling_rate,
+                          readahead=readahead)
     
     if signal_setup.duration is None:
         raise ValueError("Signal would play forever (don't let it).")
@@ -460,7 +1336,10 @@ def just_play_NB(signal_setup, do_while_playing, wait_time=0, *args, **kwargs):
     
     streamplay.stop_stream()
     print("* Done playing")
-    streamplay.close()
+    close_stream(streamplay)
+    
+    if streamplay.prerender is not None:
+        streamplay.prerender.stop()
     
     return result
 
@@ -490,29 +1369,309 @@ def just_rec(recording_duration, #1st column left
 		
     Returns
     -------
-    PyAudio byte stream
-        Recorded signal.
+    numpy array
+        Recorded float32 signal, shaped (frames, channels) if there's more
+        than one channel.
     
     """
 
-    streamrec = rec(nchannelsrec=nchannelsrec,
-                    formatrec=pyaudio.paFloat32,
-                    samplerate=samplerate)
+    recorder = Recorder(recording_duration, nchannelsrec, samplerate)
     
     print("* Recording")
-    streamrec.start_stream()
-    signalrec = streamrec.read(int(samplerate * recording_duration))
+    signalrec = recorder.start().wait()
     print("* Done recording")
-
-    streamrec.stop_stream()
-    streamrec.close()
     
     if after_recording is None:
         after_recording = AfterRecording()
     
     after_recording.act(signalrec, nchannelsrec, samplerate)
     
-    return decode(signalrec, nchannelsrec)
+    return signalrec
+
+#%%
+
+class MeasurementSession:
+    """Keeps input and output streams running across many measurements.
+    
+    Both streams are opened once, in callback mode, and keep running. Each
+    play call swaps the played generator at the start of the next output
+    block, and the time that block reaches the converter is taken from 
+    PortAudio's time_info. Recorded blocks are time stamped the same way, 
+    so record returns frames captured from the switch on, located to the 
+    sample. Silence is played while no signal is set or after it ends.
+    
+    It can be used as a context manager, which opens and closes it.
+    
+    Parameters
+    ----------
+    signalmaker : PyAudioWave instance
+        Sets sampling rate, buffer size, output channels and sample format.
+        Every played SignalMaker should come from an instance with the 
+        same settings.
+    nchannelsrec : int optional
+        Recorded signal's number of channels. Default: 1.
+    inputdevice : int or None optional
+        Input device index. If None, the default one. Default: None.
+    outputdevice : int or None optional
+        Output device index. If None, the default one. Default: None.
+    history : int, float optional
+        Seconds of recorded signal kept. Older blocks are dropped, as are 
+        blocks from before the last switch, so memory stays bounded while
+        the session runs. Default: 60.
+    
+    Attributes
+    ----------
+    switch_time : float or None
+        Stream time at which the last signal started playing.
+    
+    Methods
+    ----------
+    open
+        opens and starts both streams.
+    play
+        swaps the played signal.
+    record
+        returns frames recorded from the last switch on.
+    close
+        gives both streams back.
+    
+    """
+    
+    def __init__(self, signalmaker, nchannelsrec=1, inputdevice=None, 
+                 outputdevice=None, history=60):
+        
+        self.samplerate = signalmaker.sampling_rate
+        self.buffersize = signalmaker.buffer_size
+        self.nchannelsplay = signalmaker.nchannels
+        self.sampleformat = signalmaker.sample_format
+        self.nchannelsrec = nchannelsrec
+        self.inputdevice = inputdevice
+        self.outputdevice = outputdevice
+        self.history = history
+        
+        self.frame_bytes = self.nchannelsplay * pyaudio.get_sample_size(
+                pyaudio_format(self.sampleformat))
+        self.generator = None
+        self.pending = None
+        self.switch_time = None
+        self.switched = threading.Event()
+        self.silences = {}
+        
+        self.lock = threading.Lock()
+        self.captured = threading.Condition(self.lock)
+        self.blocks = []
+        self.block_times = []
+        self.nframes = 0
+        self.discarded = None #End time of the last dropped block
+        
+        self.streamplay = None
+        self.streamrec = None
+    
+    def open(self):
+        
+        """Opens and starts both streams."""
+        
+        self.streamrec = audio_context.open(
+                'input', self.nchannelsrec, pyaudio.paFloat32, 
+                self.samplerate, self.inputdevice, self.input_callback)
+        self.streamplay = audio_context.open(
+                'output', self.nchannelsplay, 
+                pyaudio_format(self.sampleformat), self.samplerate, 
+                self.outputdevice, self.output_callback)
+        return self
+    
+    def close(self):
+        
+        """Stops both streams and gives them back to the shared pool."""
+        
+        for stream in (self.streamplay, self.streamrec):
+            if stream is not None:
+                close_stream(stream)
+        self.streamplay = self.streamrec = None
+    
+    def __enter__(self):
+        
+        return self.open()
+    
+    def __exit__(self, *exception):
+        
+        self.close()
+    
+    def output_callback(self, in_data, frame_count, time_info, status):
+        
+        pending = self.pending
+        if pending is not None:
+            self.pending = None
+            self.generator = pending
+            self.switch_time = stream_time(time_info, 'output_buffer_dac_time')
+            self.switched.set()
+        
+        chunk = None
+        if self.generator is not None:
+            try:
+                chunk = next(self.generator).tobytes()
+            except StopIteration:
+                self.generator = None
+        
+        nbytes = frame_count * self.frame_bytes
+        if chunk is None:
+            if frame_count not in self.silences:
+                self.silences[frame_count] = bytes(nbytes)
+            chunk = self.silences[frame_count]
+        elif len(chunk) < nbytes:
+            chunk += bytes(nbytes - len(chunk))
+        return (chunk, pyaudio.paContinue)
+    
+    def input_callback(self, in_data, frame_count, time_info, status):
+        
+        block = decode(in_data, self.nchannelsrec)
+        with self.captured:
+            self.blocks.append(block)
+            self.block_times.append(stream_time(time_info, 
+                                                'input_buffer_adc_time'))
+            self.nframes += len(block)
+            
+            #Only history seconds are kept, and never blocks that ended 
+            #before the current switch, as those are never returned
+            oldest = self.block_end(-1) - self.history
+            if self.switch_time is not None:
+                oldest = max(oldest, self.switch_time)
+            while len(self.blocks) > 1 and self.block_end(0) <= oldest:
+                self.discarded = self.block_end(0)
+                self.nframes -= len(self.blocks.pop(0))
+                self.block_times.pop(0)
+            
+            self.captured.notify_all()
+        return (None, pyaudio.paContinue)
+    
+    def block_end(self, index):
+        
+        """Returns the stream time right after a recorded block's last 
+        frame."""
+        
+        return (self.block_times[index] + 
+                len(self.blocks[index]) / self.samplerate)
+    
+    def play(self, signal_setup):
+        
+        """Swaps the played signal at the start of the next output block.
+        
+        Parameters
+        ---------
+        signal_setup: SignalMaker instance form pyaudiowave module
+            Signal to play, made with the session's settings.
+        
+        """
+        
+        parent = signal_setup.parent
+        settings = (parent.sampling_rate, parent.buffer_size, 
+                    parent.nchannels, parent.sample_format)
+        if settings != (self.samplerate, self.buffersize, 
+                        self.nchannelsplay, self.sampleformat):
+            raise ValueError("Signal's settings don't match the session's.")
+        
+        with self.lock:
+            #Frames captured before the switch will never be returned
+            self.blocks, self.block_times, self.nframes = [], [], 0
+            self.discarded = None
+        self.switched.clear()
+        self.pending = signal_setup.generator
+    
+    def record(self, duration, delay=0, timeout=None):
+        
+        """Returns frames recorded from the last switch on.
+        
+        Blocks until they are all captured.
+        
+        Parameters
+        ---------
+        duration : int, float
+            Duration of the recording, in seconds.
+        delay : int, float optional
+            Time to skip after the switch, in seconds. Default: 0.
+        timeout : int, float or None optional
+            Maximum time to wait for both the switch and the recording, in
+            seconds. If None, waits as long as needed. Default: None.
+        
+        Returns
+        -------
+        numpy array
+            Recorded float32 signal, shaped (frames, channels) if there is
+            more than one channel.
+        
+        """
+        
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        if not self.switched.wait(timeout):
+            raise TimeoutError('Signal never started playing.')
+        
+        start_time = self.switch_time + delay
+        frames = int(round(duration * self.samplerate))
+        
+        def located():
+            #Block holding start_time, its first frame at or after 
+            #start_time and the number of frames in previous blocks
+            if not self.blocks or self.block_end(-1) <= start_time:
+                return None
+            before = 0
+            for index, block in enumerate(self.blocks):
+                if self.block_end(index) > start_time:
+                    offset = ((start_time - self.block_times[index]) * 
+                              self.samplerate)
+                    return index, max(int(np.ceil(offset - 1e-6)), 0), before
+                before += len(block)
+        
+        def complete():
+            location = located()
+            if location is None:
+                return False
+            index, offset, before = location
+            return self.nframes - before >= offset + frames
+        
+        with self.captured:
+            remaining = (None if timeout is None 
+                         else max(deadline - time.monotonic(), 0))
+            if not self.captured.wait_for(complete, remaining):
+                raise TimeoutError('Recording took too long.')
+            if self.discarded is not None and start_time < self.discarded:
+                raise ValueError('Recording started more than history '
+                                 'seconds ago.')
+            
+            #Join only the blocks the recording spans
+            index, offset, before = located()
+            needed = []
+            count = -offset
+            while count < frames or not needed:
+                needed.append(self.blocks[index])
+                count += len(self.blocks[index])
+                index += 1
+            recording = np.concatenate(needed)[offset:offset + frames]
+        
+        return recording
+
+def stream_time(time_info, key):
+    
+    """Returns a time from a callback's time_info.
+    
+    Falls back to current_time if the host API doesn't give the requested
+    one (i.e. it's 0).
+    
+    Parameters
+    ---------
+    time_info : dict
+        time_info given to a PyAudio callback.
+    key : str
+        'input_buffer_adc_time' or 'output_buffer_dac_time'.
+    
+    Returns
+    -------
+    float
+        Stream time in seconds.
+    
+    """
+    
+    return time_info.get(key) or time_info.get('current_time', 0)
 
 #%%
 
@@ -536,7 +1695,8 @@ def signal_plot(signal, samplerate=44100,
         Signal's units as they would appear in Y-axis. Default: none.
     plotlegend : None or list of strings optional
         Signals' channels' names if there's more than one channel. 
-		Default: none.
+		Default: none, which names them left and right if there are two 
+        and numbers them otherwise.
     
     """
     
@@ -560,5 +1720,7 @@ def signal_plot(signal, samplerate=44100,
     if m != 1:
         if plotlegend is not None:
             plt.legend(plotlegend)
-        else:
+        elif m == 2:
             plt.legend(['Izquierda','Derecha'])
+        else:
+            plt.legend(['Canal {}'.format(k+1) for k in range(m)])
@@ -286,11 +286,10 @@ def savewav(datapyaudio,
     datalist = []
     datalist.append(datapyaudio)
     
-    p = pyaudio.PyAudio()
     wf = wave.open(file, 'wb')
     
     wf.setnchannels(data_nchannels)
-    wf.setsampwidth(p.get_sample_size(data_format))
+    wf.setsampwidth(pyaudio.get_sample_size(data_format))
     wf.setframerate(data_samplerate)
     wf.writeframes(b''.join(datalist))
     
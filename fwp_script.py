@@ -7,6 +7,7 @@ Created on Wed Sep 12 12:48:15 2018
 """
 
 from fwp_analysis import rms
+import fwp_analysis as anly
 import fwp_lab_instruments as ins
 import fwp_pyaudio as fwp
 import fwp_save as sav
@@ -103,21 +104,23 @@ makefile = lambda freq : '{}_{:.0f}_Hz'.format(filename, freq)
 
 signalrms = []
 
-for freq, dur in zip(frequencies, durations):
-    
-    # Set up stuff for this frequency
-    seno.frequency = freq
-    signal_to_play = signalmaker.generator_setup(seno)
-    after_record_do.filename = makefile(freq)
-    
-    # Play, record and process
-    thesignal = fwp.play_rec(
-                        signal_to_play, 
-                        recording_duration=dur,
-                        nchannelsrec=nchannelsrec,
-                        after_recording=after_record_do)
-    
-    signalrms.append(rms.rms(thesignal))
+# Keep both streams running during the whole sweep; each frequency starts
+# at the next output block and is recorded from the moment it is heard
+with fwp.MeasurementSession(signalmaker, nchannelsrec) as session:
+    for freq, dur in zip(frequencies, durations):
+        
+        # Set up stuff for this frequency
+        seno.frequency = freq
+        signal_to_play = signalmaker.generator_setup(seno)
+        after_record_do.filename = makefile(freq)
+        
+        # Play, record and process
+        session.play(signal_to_play)
+        thesignal = session.record(dur)
+        after_record_do.act(thesignal, nchannelsrec, 
+                            signalmaker.sampling_rate)
+        
+        signalrms.append(rms(thesignal))
 
 signalrms = np.array(signalrms)
 signaldec = 10*np.log10(signalrms/max(signalrms))
@@ -134,6 +137,201 @@ sav.savetext(
         np.transpose(np.array([frequencies, signalrms, signaldec])),
         '{}_Data.txt'.format(filename))
 
+#%% Stepped frequency sweep played as a single stream
+
+freq_start = 50
+freq_stop = 22000
+freq_step = 50
+step_duration = .1 # in seconds
+crossfade = .005 # in seconds, glide between steps
+settle = .02 # in seconds, discarded at the start of each step
+
+# Some configurations
+after_record_do = fwp.AfterRecording(savewav = False, showplot = False,
+                                     saveplot = False, savetext = False)
+nchannelsrec = 2
+nchannelsplay = 2 # Cause of cable issues
+samplerate = 44100
+name = 'Freq_Sweep_Stream'
+
+seno = wmaker.Wave('sine') # Frequency is given by the schedule
+signalmaker = paw.PyAudioWave(nchannels=nchannelsplay,
+                              samplingrate=samplerate)
+
+frequencies = np.arange(freq_start, freq_stop, freq_step)
+steps = paw.Steps(frequencies, step_duration, crossfade)
+
+savedir = sav.new_dir(os.path.join(os.getcwd(), 'Measurements', name))
+filename = os.path.join(savedir, name)
+
+# Play every frequency in one stream, with continuous phase, and record
+# from the moment it comes back, so steps start where they were played
+thesignal = fwp.play_rec(signalmaker.generator_setup(seno, frequency=steps),
+                         recording_duration=steps.duration,
+                         nchannelsrec=nchannelsrec,
+                         after_recording=after_record_do,
+                         align=True)
+
+# Split recording into steps and keep the settled part of each one
+starts = np.round((steps.starts + settle) * samplerate).astype(int)
+stops = np.round((steps.starts + step_duration) * samplerate).astype(int)
+signalrms = np.array([[anly.rms(thesignal[start:stop, channel])
+                       for channel in range(nchannelsrec)]
+                      for start, stop in zip(starts, stops)])
+signaldec = 20*np.log10(signalrms/signalrms.max(axis=0)) # RMS amplitudes
+
+plt.figure()
+plt.plot(frequencies, signaldec, '-')
+plt.legend(['Canal {}'.format(k+1) for k in range(nchannelsrec)])
+plt.ylabel('Decibels')
+plt.xlabel('Frequency (Hz)')
+plt.grid()
+plt.show()
+
+sav.saveplot('{}_Plot.pdf'.format(filename))
+sav.savetext(np.column_stack((frequencies, signalrms, signaldec)),
+             '{}_Data.txt'.format(filename))
+
+#%% Exponential sweep to measure transference function in one shot
+
+freq_start = 50
+freq_stop = 22000
+sweep_duration = 3
+
+# Some configurations
+after_record_do = fwp.AfterRecording(savewav = False, showplot = False,
+                                     saveplot = False, savetext = True) 
+nchannelsrec = 2
+nchannelsplay = 2 # Cause of cable issues
+samplerate = 44100
+name = 'Sweep_Response'
+
+sweep = wmaker.Sweep(freq_start, freq_stop, sweep_duration)
+signalmaker = paw.PyAudioWave(nchannels=nchannelsplay, 
+                              samplingrate=samplerate)
+
+savedir = sav.new_dir(os.path.join(os.getcwd(), 'Measurements', name))
+filename = os.path.join(savedir, name)
+after_record_do.filename = filename
+
+# Record two sweeps and analyse the last whole one
+thesignal = fwp.play_rec(signalmaker.generator_setup(sweep), 
+                         recording_duration=2*sweep.period,
+                         nchannelsrec=nchannelsrec,
+                         after_recording=after_record_do)
+
+time_ir, impulse, frequencies, response, distortion = anly.sweep_response(
+        thesignal[:,0], sweep, samplerate)
+
+plt.figure()
+plt.semilogx(frequencies, 20*np.log10(np.abs(response)), 'b-',
+             label='Lineal')
+for order, d in enumerate(distortion, 2):
+    plt.semilogx(frequencies, 20*np.log10(np.abs(d)), '-',
+                 label='Armónico {}'.format(order))
+plt.ylabel('Decibels')
+plt.xlabel('Frequency (Hz)')
+plt.xlim(freq_start, freq_stop)
+plt.legend()
+plt.grid()
+plt.show() 
+
+sav.saveplot('{}_Plot.pdf'.format(filename))
+sav.savetext(np.transpose(np.array([frequencies, np.abs(response), 
+                                    np.angle(response)])),
+             '{}_Data.txt'.format(filename))
+
+#%% Multisine to measure transference function in one shot
+
+freq_start = 50
+freq_stop = 20000
+periods = 8
+
+# Some configurations
+nchannelsrec = 2
+nchannelsplay = 2 # Cause of cable issues
+samplerate = 44100
+name = 'Multisine_Response'
+
+multiseno = wmaker.Multisine(freq_start, freq_stop, samples=2**15,
+                             samplerate=samplerate)
+signalmaker = paw.PyAudioWave(nchannels=nchannelsplay, 
+                              samplingrate=samplerate)
+
+savedir = sav.new_dir(os.path.join(os.getcwd(), 'Measurements', name))
+filename = os.path.join(savedir, name)
+
+# One extra period is recorded, so the transient can be left out
+thesignal = fwp.play_rec(signalmaker.generator_setup(multiseno), 
+                         recording_duration=(periods+1)*multiseno.period,
+                         nchannelsrec=nchannelsrec,
+                         after_recording=fwp.AfterRecording(showplot=False))
+
+frequencies, amplitude, phase = anly.multisine_response(thesignal[:,0], 
+                                                        multiseno)
+
+plt.figure()
+plt.semilogx(frequencies, 20*np.log10(amplitude), 'b-')
+plt.ylabel('Decibels')
+plt.xlabel('Frequency (Hz)')
+plt.grid()
+plt.show() 
+
+sav.saveplot('{}_Plot.pdf'.format(filename))
+sav.savetext(np.transpose(np.array([frequencies, amplitude, phase])),
+             '{}_Data.txt'.format(filename))
+
+#%% Maximum length sequence to measure impulse response
+
+order = 15
+periods = 4
+
+# Some configurations
+nchannelsrec = 2
+nchannelsplay = 2 # Cause of cable issues
+samplerate = 44100
+
+mls = wmaker.MLS(order, samplerate=samplerate, amplitude=.5)
+signalmaker = paw.PyAudioWave(nchannels=nchannelsplay, 
+                              samplingrate=samplerate)
+
+# One extra period is recorded, so the transient can be left out
+thesignal = fwp.play_rec(signalmaker.generator_setup(mls), 
+                         recording_duration=(periods+1)*mls.period,
+                         nchannelsrec=nchannelsrec,
+                         after_recording=fwp.AfterRecording(showplot=False))
+
+time_ir, impulse = anly.mls_response(thesignal[:,0], mls)
+
+plt.figure()
+plt.plot(time_ir, impulse, 'b-')
+plt.ylabel('Respuesta al impulso')
+plt.xlabel('Tiempo (s)')
+plt.grid()
+plt.show() 
+
+#%% Play an excitation from a file while recording
+
+filename = os.path.join(os.getcwd(), 'Excitation.wav')
+gain = .5
+
+# Some configurations
+after_record_do = fwp.AfterRecording(savewav = False, showplot = True,
+                                     saveplot = False, savetext = False)
+nchannelsrec = 2
+nchannelsplay = 2
+
+# File is read through a memory map, block by block, whatever its size
+excitation = (wmaker.AudioFile(filename, channel=0, gain=gain),
+              wmaker.AudioFile(filename, channel=0, gain=gain))
+signalmaker = paw.PyAudioWave(nchannels=nchannelsplay,
+                              samplingrate=excitation[0].samplerate)
+
+thesignal = fwp.play_rec(signalmaker.generator_setup(excitation),
+                         recording_duration=excitation[0].period,
+                         nchannelsrec=nchannelsrec,
+                         after_recording=after_record_do)
+
 #%% Calibrate playing
 
 amp_start = 1
@@ -163,14 +361,17 @@ def measure():
     result_right = osci.measure('pk2', 2, print_result=True)
     return result_left, result_right
 
-for amp in amplitude:
-    
-    seno = wmaker.Wave('sine', frequency=freq, amplitude=amp)
-    #seno.amplitude = amp #update signals ampitude
-    signal_to_play = signalmaker.generator_setup((seno,seno), duration=1 ) 
-    
-    result = fwp.just_play_NB(signal_to_play, measure, wait_time=.3)
-    amp_osci.append(list(result))
+# Keep PortAudio open and reuse the same stream for every amplitude
+with fwp.audio_context:
+    for amp in amplitude:
+        
+        seno = wmaker.Wave('sine', frequency=freq, amplitude=amp)
+        #seno.amplitude = amp #update signals ampitude
+        signal_to_play = signalmaker.generator_setup((seno,seno), 
+                                                     duration=1) 
+        
+        result = fwp.just_play_NB(signal_to_play, measure, wait_time=.3)
+        amp_osci.append(list(result))
 
 amp_osci = np.array(amp_osci)
 osci.osci.close()
@@ -217,18 +418,20 @@ gen.re_config_output(1, frequency=freq) # 1 output, 2 audio recording CH
 
 amp_rec = []
                   
-for amp in amplitude:
-    
-    after_record_do.filename = makefile(amp)
-    
-    gen.output(True, 1, amplitude=amp)
-    
-    signal_rec = fwp.just_rec(duration,
-                              nchannelsrec=nchannelsrec,
-                              after_recording=after_record_do)
-    
-    amp_rec.append([max(signal_rec[:,0])-min(signal_rec[:,0]), # Left
-                    max(signal_rec[:,1])-min(signal_rec[:,1])]) # Right
+# Keep PortAudio open and reuse the same stream for every amplitude
+with fwp.audio_context:
+    for amp in amplitude:
+        
+        after_record_do.filename = makefile(amp)
+        
+        gen.output(True, 1, amplitude=amp)
+        
+        signal_rec = fwp.just_rec(duration,
+                                  nchannelsrec=nchannelsrec,
+                                  after_recording=after_record_do)
+        
+        amp_rec.append([max(signal_rec[:,0])-min(signal_rec[:,0]), # Left
+                        max(signal_rec[:,1])-min(signal_rec[:,1])]) # Right
 
 gen.output(0)
 gen.gen.close()
@@ -325,7 +528,8 @@ if after_record_do.showplot:
 #%% One measure inverting amplifier (A=-1)
 
 # Some configurations
-duration = .5
+duration = .1 #40 periods, all of them recorded after settling
+settling = .05 #time the amplifier takes to settle
 nchannelsrec = 2
 nchannelsplay = 1
 signal_freq = 400
@@ -341,13 +545,15 @@ after_record_do.filename = filename
 # Generate a sine
 seno = wmaker.Wave('sine', frequency=signal_freq)
 signalmaker = paw.PyAudioWave(nchannels=nchannelsplay)
-signal_generator = signalmaker.generator_setup(seno1)
+signal_generator = signalmaker.generator_setup(seno)
 
-# Play and record
+# Play and record only once the signal comes back and has settled
 thesignal = fwp.play_rec(signal_generator, 
                           recording_duration=duration,
                           nchannelsrec=nchannelsrec,
-                          after_recording=after_record_do)
+                          after_recording=after_record_do,
+                          align=True,
+                          settling=settling)
 
 #%% Frequency Sweep Inverting Amplifier
 
@@ -363,15 +569,16 @@ freq_end = 20e3
 freq_step = 100
 frequencies = np.arange(freq_start, freq_end, freq_step)
 
-duration = 50/freq_start #play 50 periods of slowest wave
+duration = 10/freq_start #record 10 periods of slowest wave
+settling = .05 #time the amplifier takes to settle
 nchannelsrec = 2
 nchannelsplay = 1
 signal_freq = 400
 
 # First I print how much time it will take
 print("It will take at least {} sec ({:.2f} hs and {} values)".format(
-        duration*len(frequencies),
-        duration*len(frequencies)/3600,
+        (duration+settling)*len(frequencies),
+        (duration+settling)*len(frequencies)/3600,
         len(frequencies)))
 
 # Now I check whether I need to change rMIC
@@ -392,14 +599,16 @@ name = 'Amp_Freq_{}_{}_Ohms'.format(rIN, rMIC)
 # Next I make a sine of minimum frequency
 seno = wmaker.Wave('sine', frequency=freq_start)
 signalmaker = paw.PyAudioWave(nchannels=nchannelsplay)
-signal_generator = signalmaker.generator_setup(seno1)
+signal_generator = signalmaker.generator_setup(seno)
 
 # Now I plot it and wait, to check whether it is OK or not
 thesignal = fwp.play_rec(signal_generator, 
                           recording_duration=duration,
-                          nchannelsrec=nchannelsrec)
+                          nchannelsrec=nchannelsrec,
+                          align=True,
+                          settling=settling)
 plt.show(0)
-time.sleep(duration+3)
+plt.pause(.5) #play_rec already waited for the recording
 
 # If the graph is a nice one, I start the frequency sweep
 if bool(int(input("OK? Write '1' if 'YES' or '0' if 'NO'"))):
@@ -413,13 +622,16 @@ if bool(int(input("OK? Write '1' if 'YES' or '0' if 'NO'"))):
     filename = os.path.join(savedir, name)
     makefile = lambda freq: '{}_{:.2f}_Hz.txt'.format(filename, freq)
     
-    for freq in frequencies:
-        
-        seno.frequency = freq
-        signal_to_play = signalmaker.generator_setup(seno)
-        after_record_do.filename = makefile(freq)
-        
-        signal_rec = fwp.play_rec(signal_generator, 
-                                  recording_duration=duration,
-                                  nchannelsrec=nchannelsrec,
-                                  after_recording=after_record_do)
\ No newline at end of file
+    # Keep both streams running during the whole sweep; each frequency is
+    # recorded once it comes back and has settled
+    with fwp.MeasurementSession(signalmaker, nchannelsrec) as session:
+        for freq in frequencies:
+            
+            seno.frequency = freq
+            signal_to_play = signalmaker.generator_setup(seno)
+            after_record_do.filename = makefile(freq)
+            
+            session.play(signal_to_play)
+            signal_rec = session.record(duration, delay=settling)
+            after_record_do.act(signal_rec, nchannelsrec, 
+                                signalmaker.sampling_rate)
\ No newline at end of file
@@ -4,9 +4,712 @@ A module containing a main class (Pyauadiowave) that takes in Wave objects from
 the wavemaker module and outputs a variety of signals from the given wave(s). It
 also contains a helper class (SignalMaker) to pass to fwp_pyaudiowave playback
 functions tu properly setup parameters.
+
+Rendered loops are kept in a bounded least-recently-used cache (LoopCache),
+shared by default among all PyAudioWave instances, so repeating a signal
+setup skips synthesis. Frequency and amplitude can follow schedules (Ramp,
+Steps) applied sample by sample inside one continuous stream.
 """
 
+from collections import OrderedDict
+from fractions import Fraction
+from time import perf_counter
 import numpy as np
+import wavemaker
+
+#%% Cache of rendered loops
+
+class LoopCache:
+    """ A bounded least-recently-used cache of rendered loop buffers.
+    
+    Parameters
+    ----------
+    max_bytes : int (optional)
+        Memory cap for all cached loops, in bytes. Default: 64 MiB.
+    max_entries : int (optional)
+        Maximum number of cached loops. Default: 128.
+        
+    Attributes
+    ----------
+    loops : OrderedDict
+        Cached loops, from least to most recently used.
+    nbytes : int
+        Memory currently used by cached loops, in bytes.
+    hits, misses, evictions : int
+        Cache statistics since creation or last clear.
+    """
+    
+    def __init__(self, max_bytes=64*2**20, max_entries=128):
+        
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.clear()
+        
+    def clear(self):
+        """Empties the cache and resets statistics."""
+        
+        self.loops = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    def get(self, key):
+        """ Returns cached loop for given key, or None if it isn't cached.
+        
+        Parameters
+        ----------
+        key : hashable or None
+            Key of the loop. None is always a miss.
+        """
+        
+        if key is None or key not in self.loops:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self.loops.move_to_end(key)
+        return self.loops[key]
+    
+    def put(self, key, loop):
+        """ Stores a loop, evicting least recently used ones if needed.
+        
+        Loops bigger than max_bytes and None keys are not stored.
+        
+        Parameters
+        ----------
+        key : hashable or None
+            Key of the loop.
+        loop : numpy array
+            Rendered loop.
+        """
+        
+        if key is None or loop.nbytes > self.max_bytes:
+            return
+        
+        if key in self.loops:
+            self.nbytes -= self.loops.pop(key).nbytes
+        self.loops[key] = loop
+        self.nbytes += loop.nbytes
+        
+        while self.nbytes > self.max_bytes or len(self.loops) > self.max_entries:
+            _, evicted = self.loops.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+            
+    def stats(self):
+        """Returns a dict with cache statistics."""
+        
+        return dict(hits=self.hits, misses=self.misses, 
+                    evictions=self.evictions, entries=len(self.loops),
+                    nbytes=self.nbytes)
+    
+loop_cache = LoopCache()
+
+#Bits per sample of every supported output format
+SAMPLE_FORMATS = {'float32': 32, 'int16': 16, 'int24': 24, 'int32': 32}
+
+#%% Parameter schedules
+
+class Ramp:
+    """ A parameter going from start to stop in a given duration.
+    
+    Value is held at stop once duration has passed.
+    
+    Parameters
+    ----------
+    start : int or float
+        Value at time 0.
+    stop : int or float
+        Value at time duration.
+    duration : int or float
+        Ramp duration in seconds.
+    scale : str {'linear', 'log'} optional
+        If 'log', value changes exponentially, i.e. as in a logarithmic 
+        frequency sweep. Default: 'linear'.
+        
+    Methods
+    ----------
+    values(first, frames, sampling_rate, out=None)
+        returns the parameter at given samples
+    """
+    
+    def __init__(self, start, stop, duration, scale='linear'):
+        
+        if scale not in ('linear', 'log'):
+            raise ValueError("scale must be 'linear' or 'log'")
+        if scale == 'log' and start * stop <= 0:
+            raise ValueError('log ramps need start and stop of equal sign')
+            
+        self.start = start
+        self.stop = stop
+        self.duration = duration
+        self.scale = scale
+        
+    def values(self, first, frames, sampling_rate, out=None):
+        """Returns parameter values from sample first, for frames samples.
+        
+        Parameters
+        ----------
+        first : int
+            Index of first sample, counted from stream's start.
+        frames : int
+            Number of samples.
+        sampling_rate : int or float
+            Sampling rate.
+        out : numpy array optional
+            Array of length frames to write into.
+            
+        Returns
+        ----------
+        numpy array
+            Parameter values.
+        """
+        
+        if out is None:
+            out = np.empty(frames)
+        np.add(np.arange(frames), first, out=out)
+        out *= 1 / (self.duration * sampling_rate)
+        np.clip(out, 0, 1, out=out)
+        
+        if self.scale == 'log':
+            out *= np.log(self.stop / self.start)
+            np.exp(out, out=out)
+            out *= self.start
+        else:
+            out *= self.stop - self.start
+            out += self.start
+        return out
+
+class Steps:
+    """ A parameter taking a list of values, one after the other.
+    
+    Each step starts with a linear crossfade from the previous value. Last
+    value is held once all steps have passed.
+    
+    Parameters
+    ----------
+    values : array_like
+        Value for each step.
+    durations : int, float or array_like
+        Duration of each step in seconds. If a number is given, all steps
+        last the same.
+    crossfade : int or float optional
+        Transition duration in seconds at the start of each step. If 0, 
+        value jumps. Default: 0.
+        
+    Attributes
+    ----------
+    duration : float
+        total duration of all steps
+    starts : numpy array
+        start time of each step in seconds
+        
+    Methods
+    ----------
+    values(first, frames, sampling_rate, out=None)
+        returns the parameter at given samples
+    """
+    
+    def __init__(self, values, durations, crossfade=0):
+        
+        self.steps = np.atleast_1d(np.asarray(values, dtype=float))
+        durations = np.broadcast_to(durations, self.steps.shape)
+        if np.any(durations <= 0):
+            raise ValueError('step durations must be positive')
+        if np.any(crossfade > durations):
+            raise ValueError('crossfade must not be longer than steps')
+            
+        self.starts = np.concatenate(([0], np.cumsum(durations)[:-1]))
+        self.duration = float(np.sum(durations))
+        self.crossfade = crossfade
+        
+    def values(self, first, frames, sampling_rate, out=None):
+        """Returns parameter values from sample first, for frames samples.
+        
+        Parameters
+        ----------
+        first : int
+            Index of first sample, counted from stream's start.
+        frames : int
+            Number of samples.
+        sampling_rate : int or float
+            Sampling rate.
+        out : numpy array optional
+            Array of length frames to write into.
+            
+        Returns
+        ----------
+        numpy array
+            Parameter values.
+        """
+        
+        if out is None:
+            out = np.empty(frames)
+        time = (np.arange(frames) + first) / sampling_rate
+        step = np.searchsorted(self.starts, time, side='right') - 1
+        out[:] = self.steps[step]
+        
+        if self.crossfade > 0:
+            fade = (time - self.starts[step]) / self.crossfade
+            fading = (fade < 1) & (step > 0)
+            previous = self.steps[step[fading] - 1]
+            out[fading] = previous + (out[fading] - previous) * fade[fading]
+        return out
+
+#%% Channel engines
+
+class LoopChannel:
+    """ Streams one channel out of a rendered loop, keeping its own cursor.
+    
+    Parameters
+    ----------
+    loop : numpy array
+        Rendered one-dimensional loop.
+        
+    Methods
+    ----------
+    fill(out)
+        writes next len(out) samples into out
+    """
+    
+    def __init__(self, loop):
+        
+        self.loop = loop
+        self.cursor = 0
+        
+    def fill(self, out):
+        """Writes next len(out) samples of the loop into out."""
+        
+        length = len(self.loop)
+        filled = 0
+        while filled < len(out):
+            n = min(len(out) - filled, length - self.cursor)
+            out[filled:filled + n] = self.loop[self.cursor:self.cursor + n]
+            filled += n
+            self.cursor = (self.cursor + n) % length
+    
+class PhaseChannel:
+    """ Streams one channel evaluating its wave from a phase accumulator.
+    
+    Phase is kept in periods and wrapped into [0, 1), so it never loses
+    precision no matter how long the stream runs. Period is read on every
+    fill, so frequency may be changed while streaming. Basic waveforms of
+    wavemaker.Wave are evaluated in place into preallocated buffers, so 
+    after the first fill nothing is allocated.
+    
+    Frequency and amplitude may also follow schedules (i.e. Ramp or Steps),
+    which are evaluated sample by sample on every fill. Phase is then 
+    integrated from the scheduled frequency, so the wave stays continuous
+    through glides and steps.
+    
+    Parameters
+    ----------
+    wave : wave object
+        Object created by wavemaker class with desired function.
+    sampling_rate : int or float
+        Sampling rate.
+    buffer_size : int
+        Maximum number of samples per fill.
+    frequency : schedule or None optional
+        Schedule for the wave's frequency in Hz. If None, wave's own 
+        frequency is used. Default: None.
+    amplitude : schedule or None optional
+        Schedule for a factor multiplying the wave. Default: None.
+        
+    Methods
+    ----------
+    fill(out)
+        writes next len(out) samples into out
+    """
+    
+    def __init__(self, wave, sampling_rate, buffer_size, frequency=None, 
+                 amplitude=None):
+        
+        self.wave = wave
+        self.sampling_rate = sampling_rate
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.phase = 0
+        self.frame = 0
+        self.ramp = np.arange(buffer_size) / sampling_rate
+        self.time = np.empty(buffer_size)
+        self.values = np.empty(buffer_size)
+        self.work = None
+        if isinstance(wave, wavemaker.Wave):
+            self.work = np.empty(buffer_size)
+        
+    def fill(self, out):
+        """Writes next len(out) samples of the wave into out."""
+        
+        frames = len(out)
+        period = self.wave.period
+        time = self.time[:frames]
+        
+        if self.frequency is None:
+            np.add(self.ramp[:frames], self.phase * period, out=time)
+            self.phase += frames / (period * self.sampling_rate)
+        else:
+            increments = self.frequency.values(self.frame, frames, 
+                                               self.sampling_rate,
+                                               out=self.values[:frames])
+            increments /= self.sampling_rate
+            np.cumsum(increments, out=time)
+            end = time[-1]
+            time -= increments
+            time += self.phase
+            time *= period
+            self.phase += end
+        self.phase %= 1
+        
+        if self.work is None:
+            self.wave.evaluate(time, out=out)
+        else:
+            self.wave.evaluate(time, out=out, work=self.work[:frames])
+        if self.amplitude is not None:
+            out *= self.amplitude.values(self.frame, frames, 
+                                         self.sampling_rate,
+                                         out=self.values[:frames])
+        self.frame += frames
+
+class BurstChannel:
+    """ Streams one channel of a tone burst, evaluating only its on parts.
+    
+    Samples are counted from the stream's start, and every burst is 
+    evaluated with time measured from its own start, so precision doesn't
+    degrade on long streams. Off parts are just zeroed, and whole silent
+    chunks can be skipped.
+    
+    Parameters
+    ----------
+    burst : wavemaker.Burst
+        Burst to stream.
+    sampling_rate : int or float
+        Sampling rate.
+        
+    Methods
+    ----------
+    fill(out)
+        writes next len(out) samples into out
+    silent(frames)
+        tells if next frames samples are all silent
+    skip(frames)
+        moves forward frames samples without writing them
+    """
+    
+    def __init__(self, burst, sampling_rate):
+        
+        self.burst = burst
+        self.sampling_rate = sampling_rate
+        self.frame = 0
+        
+    def segments(self, frames):
+        """Yields (burst, start, stop) sample ranges that are on within next
+        frames samples. Ranges are counted from the stream's start."""
+        
+        period = self.burst.period * self.sampling_rate
+        on_frames = self.burst.on_duration * self.sampling_rate
+        first = self.frame
+        last = first + frames
+        
+        count = int(first // period)
+        while count * period < last:
+            if self.burst.repeats is not None and count >= self.burst.repeats:
+                return
+            start = max(int(np.ceil(count * period)), first)
+            stop = min(int(np.ceil(count * period + on_frames)), last)
+            if start < stop:
+                yield count, start, stop
+            count += 1
+            
+    def silent(self, frames):
+        """Returns True if next frames samples are all off."""
+        
+        return next(self.segments(frames), None) is None
+    
+    def skip(self, frames):
+        """Moves forward frames samples."""
+        
+        self.frame += frames
+        
+    def fill(self, out):
+        """Writes next len(out) samples of the burst into out."""
+        
+        frames = len(out)
+        period = self.burst.period * self.sampling_rate
+        wave = self.burst.wave
+        
+        out[:] = 0
+        for count, start, stop in self.segments(frames):
+            time = (np.arange(start, stop) - count * period) / self.sampling_rate
+            on = out[start - self.frame:stop - self.frame]
+            wave.evaluate(time, out=on)
+            on *= self.burst.envelope(time)
+        self.frame += frames
+
+class SilentChannel:
+    """ Streams silence on a channel that has no wave.
+        
+    Methods
+    ----------
+    fill(out)
+        writes len(out) zeros into out
+    silent(frames)
+        always True
+    skip(frames)
+        does nothing
+    """
+    
+    def fill(self, out):
+        """Writes len(out) zeros into out."""
+        
+        out[:] = 0
+        
+    def silent(self, frames):
+        """Returns True, as next frames samples are always silent."""
+        
+        return True
+    
+    def skip(self, frames):
+        """Moves forward frames samples."""
+        
+        pass
+
+class FileChannel:
+    """ Streams one channel of an audio file, block by block.
+    
+    Samples are read from the file's memory map as they are needed, so 
+    memory use doesn't depend on the file's size.
+    
+    Parameters
+    ----------
+    source : wavemaker.AudioFile
+        File to stream, at its own sampling rate.
+        
+    Methods
+    ----------
+    fill(out)
+        writes next len(out) samples into out
+    silent(frames)
+        tells if next frames samples are past the end of the file
+    skip(frames)
+        moves forward frames samples without reading them
+    """
+    
+    def __init__(self, source):
+        
+        self.source = source
+        self.frame = 0
+        
+    def fill(self, out):
+        """Writes next len(out) samples of the file into out."""
+        
+        self.source.read(self.frame, len(out), out=out)
+        self.frame += len(out)
+        
+    def silent(self, frames):
+        """Returns True if the file has ended and doesn't loop."""
+        
+        return not self.source.loop and self.frame >= self.source.frames
+    
+    def skip(self, frames):
+        """Moves forward frames samples."""
+        
+        self.frame += frames
+
+class ResampledFileChannel:
+    """ Streams one channel of an audio file at another rate, block by block.
+    
+    Position is counted in file samples, not as a phase, so a file that
+    doesn't loop plays once and is followed by silence. Samples are 
+    linearly interpolated, and each fill reads only the consecutive run of
+    samples it needs through AudioFile.read, which wraps looping files.
+    
+    Frequency, if scheduled, is how many times per second the whole file 
+    would be played (as for PhaseChannel), so it sets the playback speed.
+    
+    Parameters
+    ----------
+    source : wavemaker.AudioFile
+        File to stream.
+    sampling_rate : int or float
+        Sampling rate of the stream.
+    buffer_size : int
+        Maximum number of samples per fill.
+    frequency : schedule or None optional
+        Schedule for the file's repetition frequency in Hz. If None, the 
+        file plays at its own sampling rate. Default: None.
+    amplitude : schedule or None optional
+        Schedule for a factor multiplying the file. Default: None.
+        
+    Methods
+    ----------
+    fill(out)
+        writes next len(out) samples into out
+    silent(frames)
+        tells if next frames samples are past the end of the file
+    skip(frames)
+        moves forward frames samples without reading them
+    """
+    
+    def __init__(self, source, sampling_rate, buffer_size, frequency=None,
+                 amplitude=None):
+        
+        self.source = source
+        self.sampling_rate = sampling_rate
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.position = 0 #In file samples
+        self.frame = 0
+        self.ramp = np.arange(buffer_size, dtype=float)
+        self.positions = np.empty(buffer_size)
+        self.values = np.empty(buffer_size)
+        self.span = np.empty(0, dtype=np.float32)
+        self.grid = np.empty(0)
+        
+    def fill(self, out):
+        """Writes next len(out) samples of the file into out."""
+        
+        frames = len(out)
+        positions = self.positions[:frames]
+        
+        if self.frequency is None:
+            step = self.source.samplerate / self.sampling_rate
+            np.multiply(self.ramp[:frames], step, out=positions)
+            advance = frames * step
+        else:
+            increments = self.frequency.values(self.frame, frames,
+                                               self.sampling_rate,
+                                               out=self.values[:frames])
+            increments *= self.source.frames / self.sampling_rate
+            np.cumsum(increments, out=positions)
+            advance = positions[-1]
+            positions -= increments
+        positions += self.position
+        
+        #Read only the run of samples between the first and last positions
+        first = int(positions[0])
+        size = int(positions[-1]) - first + 2
+        if len(self.span) < size:
+            self.span = np.empty(size, dtype=np.float32)
+            self.grid = np.arange(size, dtype=float)
+        span = self.source.read(first, size, out=self.span[:size])
+        positions -= first
+        out[:] = np.interp(positions, self.grid[:size], span)
+        
+        if self.amplitude is not None:
+            out *= self.amplitude.values(self.frame, frames, 
+                                         self.sampling_rate,
+                                         out=self.values[:frames])
+        
+        self.position += advance
+        if self.source.loop and self.source.frames:
+            self.position %= self.source.frames
+        self.frame += frames
+        
+    def silent(self, frames):
+        """Returns True if the file has ended and doesn't loop."""
+        
+        return (not self.source.loop and 
+                self.position >= self.source.frames)
+    
+    def skip(self, frames):
+        """Moves forward frames samples, which are past the file's end."""
+        
+        self.frame += frames
+
+class ChunkEncoder:
+    """ Encodes the chunks of one stream into a sample format.
+    
+    Scaling, dither and integer samples are written into buffers allocated
+    once, so encoding a chunk allocates nothing. Encoded chunks are 
+    read-only views of them, valid until the next chunk is encoded. Silent
+    chunks are encoded once per length and reused.
+    
+    Parameters
+    ----------
+    sample_format : str
+        One of SAMPLE_FORMATS.
+    shape : tuple
+        Shape (frames, channels) of the longest chunk.
+    dither : bool optional
+        If True, integer formats get TPDF dither. Default: False.
+    rng : numpy Generator or None optional
+        Source of dither. If None, a new one is made. Default: None.
+        
+    Methods
+    ----------
+    encode(signal, dither=None)
+        returns signal encoded in sample_format
+    silence(frames)
+        returns an encoded chunk of frames zeros
+    """
+    
+    def __init__(self, sample_format, shape, dither=False, rng=None):
+        
+        self.sample_format = sample_format
+        self.bits = SAMPLE_FORMATS[sample_format]
+        self.full_scale = 2.**(self.bits - 1)
+        self.shape = shape
+        self.dither = dither
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.silences = {}
+        
+        if sample_format != 'float32':
+            #float64 keeps every bit of int24 and int32 samples
+            self.scaled = np.empty(shape)
+            self.noise = np.empty(shape) if dither else None
+            self.samples = np.empty(shape, dtype=np.int16 if self.bits == 16
+                                    else '<i4')
+            if self.bits == 24:
+                self.packed = np.empty((shape[0], shape[1] * 3), 
+                                       dtype=np.uint8)
+        
+    def encode(self, signal, dither=None):
+        """Returns signal encoded in sample_format. See PyAudioWave.encode.
+        """
+        
+        if self.sample_format == 'float32':
+            return np.ascontiguousarray(signal, dtype=np.float32)
+        
+        if dither is None:
+            dither = self.dither
+        frames = len(signal)
+        scaled = self.scaled[:frames]
+        np.copyto(scaled, signal) #A mixed dtype multiply would allocate
+        scaled *= self.full_scale
+        if dither:
+            if self.noise is None:
+                self.noise = np.empty(self.shape)
+            noise = self.noise[:frames]
+            scaled += self.rng.random(out=noise)
+            scaled -= self.rng.random(out=noise)
+        np.rint(scaled, out=scaled)
+        np.clip(scaled, -self.full_scale, self.full_scale - 1, out=scaled)
+        
+        samples = self.samples[:frames]
+        np.copyto(samples, scaled, casting='unsafe')
+        if self.bits == 24:
+            #Keep the three lower bytes of each little endian int32
+            packed = self.packed[:frames]
+            packed.reshape(frames, -1, 3)[...] = samples.view(
+                    np.uint8).reshape(frames, -1, 4)[..., :3]
+            samples = packed
+        samples = samples.view()
+        samples.flags.writeable = False
+        return samples
+    
+    def silence(self, frames):
+        """Returns an encoded chunk of frames zeros, encoded only once."""
+        
+        chunk = self.silences.get(frames)
+        if chunk is None:
+            zeros = np.zeros((frames,) + tuple(self.shape[1:]), 
+                             dtype=np.float32)
+            chunk = np.array(self.encode(zeros, dither=False))
+            chunk.flags.writeable = False
+            self.silences[frames] = chunk
+        return chunk
 
 #%% The class
 
@@ -25,8 +728,21 @@ class PyAudioWave:
         Sampling (or playback) rate.
     buffersize : int
         Writing buffer size
-    nchannels : {1, 2}
+    nchannels : int
         Number of channels.
+    cache : LoopCache or None
+        Cache for rendered loops. Default: module's loop_cache, shared 
+        among instances. If None, loops are not cached.
+    looptolerance : float
+        Maximum relative frequency error allowed to fit a whole number of
+        periods in a loop. Default: 1e-6.
+    maxloopduration : float
+        Loops longer than this, in seconds, are not rendered. Default: 10.
+    sampleformat : str {'float32', 'int16', 'int24', 'int32'}
+        Sample format of yielded chunks. Default: 'float32'.
+    dither : bool
+        If True, integer formats get triangular (TPDF) dither of 1 LSB 
+        before rounding. Default: False.
 
 
     Attributes
@@ -35,10 +751,20 @@ class PyAudioWave:
         Sampling rate for data adquisition
     buffer_size : int or float
         Buffer size por data adquisition
-    nchannels : {1,2}
+    nchannels : int
         number of channels used for recording and playing
     debugmode : bool
         if true, activates prints along the code to find bugs
+    cache : LoopCache or None
+        cache for rendered loops
+    loop_tolerance : float
+        maximum relative frequency error allowed when fitting loops
+    max_loop_duration : float
+        maximum loop duration in seconds
+    sample_format : str
+        sample format of yielded chunks
+    dither : bool
+        if True, integer formats are dithered
         
     
     Methods (public)
@@ -55,12 +781,24 @@ class PyAudioWave:
         the signal arrays.
     """
         
-    def __init__(self, samplingrate=44100, buffersize=1024, nchannels=1, debugmode=False):
+    def __init__(self, samplingrate=44100, buffersize=1024, nchannels=1, debugmode=False,
+                 cache=loop_cache, looptolerance=1e-6, maxloopduration=10,
+                 sampleformat='float32', dither=False):
+        
+        if sampleformat not in SAMPLE_FORMATS:
+            raise ValueError('sampleformat must be one of {}'.format(
+                    list(SAMPLE_FORMATS)))
         
         self.sampling_rate = samplingrate
         self.buffer_size = buffersize
         self.nchannels = nchannels
         self.debugmode = debugmode
+        self.cache = cache
+        self.loop_tolerance = looptolerance
+        self.max_loop_duration = maxloopduration
+        self.sample_format = sampleformat
+        self.dither = dither
+        self.rng = np.random.default_rng()
 
     def debugprint(self, printable):
         """
@@ -99,45 +837,65 @@ class PyAudioWave:
             Time array
         """
         
-        period = 1/wave.frequency
+        period = wave.period
         time = np.linspace(start = 0, stop = period * periods_per_chunk, 
-                           num = period * periods_per_chunk * self.sampling_rate,
+                           num = int(round(period * periods_per_chunk * self.sampling_rate)),
                            endpoint = False)
         return time
     
     
-    def encode(self,signal):
+    def encode(self, signal, dither=None):
         """
-        Formats desired signal for pyaudio stream. Deals with one- and 
-        two-channel signals.
+        Formats desired signal for pyaudio stream. Deals with any number
+        of channels.
+        
+        For float32, a C-contiguous float32 array is already interleaved, 
+        and pyaudio reads it through the buffer protocol just as it reads
+        bytes, so such a signal is returned as is, without copying. 
+        Anything else is converted once.
+        
+        For integer formats, signal is scaled so that 1 is full scale, 
+        optionally dithered, rounded and clipped. 24 bit samples are packed
+        as three little endian bytes.
         
         Parameters
         ----------
         signal : numpy array
             Signal to be played. Must be numpy array with shape (chunk_size, channels)
+        dither : bool or None optional
+            If None, uses the instance's dither. Default: None.
             
         Returns
         -------
-        str
-            Byte stream signal formatted as is needed by pyaudio to play  
+        numpy array
+            C-contiguous interleaved signal in sample_format, ready for 
+            pyaudio to play. Call its tobytes method if actual bytes are 
+            needed.
+            
+        Streams encode through a ChunkEncoder instead, which reuses its 
+        buffers from chunk to chunk.
         """
         
-        if self.nchannels == 2:
-            #Two channel signal requires some extra handling
-            signal = np.transpose(np.array(signal))
-        
-        interleaved = signal.flatten()
-        out_data = interleaved.astype(np.float32).tostring()
-        return out_data
+        signal = np.asarray(signal)
+        encoder = ChunkEncoder(self.sample_format, signal.shape, self.dither,
+                               self.rng)
+        return np.array(encoder.encode(signal, dither))
         
     def resolve_nchannels(self, wave, display_warnings):
         """
-        Resolve wave or wave tuple for given channel ammount. Return a tuple.
+        Resolve wave, wave tuple or wave dict for given channel ammount. 
+        Return a tuple holding one wave (or None, for silence) per channel.
+        
+        A single wave is played on every channel. A tuple (or list) gives
+        one wave per channel, in order; missing channels are silent and 
+        extra waves are dropped. A dict maps channel indexes (starting at
+        0) to waves; missing channels are silent. None may be used for a 
+        silent channel.
         
         Parameters
         ----------
-        wave : wave object
-            Object created by wavemaker class with desired function
+        wave : wave object, tuple or dict
+            Object(s) created by wavemaker class with desired function
             
         display_warning : bool
             If True displays warnings regarding number of channels and wave incompatibilities
@@ -146,41 +904,36 @@ class PyAudioWave:
         ----------
 
         tuple
-            tuple containing wave object(s)
+            tuple containing nchannels wave objects or None
         """
         
-        if self.nchannels == 1:
-            #If user passed one wave objects and requested single-channel signal:
-            if not isinstance(wave,tuple):
-                if display_warnings: print('Requested a one channel signal but provided more than one wave. Will precede using the first wave.')
-                return (wave,)
+        if isinstance(wave, dict):
+            wrong = [k for k in wave if k not in range(self.nchannels)]
+            if wrong:
+                raise ValueError('Channels {} out of range for {} channels'.format(
+                        wrong, self.nchannels))
+            return tuple(wave.get(k) for k in range(self.nchannels))
         
-        else:
-            # Ahora mismo hay un probema de diseño con escrir en dos canales
-            # y loopear sobre un únic array, porque lo que se quiere escribir en
-            # los dos canales pede no tener frecuencias compatibles y una de
-            # ellas queda cortada en cada iteración. Para solucionarlo, habría 
-            # que rehacer play_callback para que llame a algo que le de una señal
-            # en cada iteración. Por ahora, devuelve los cachos cortados.
-            
-            #If user passed one wave object, but requested two-channel signal
-            if not isinstance(wave,tuple): #should rewrite as warning
-                if display_warnings: print('''Requested two channel signal, but only provided one wave object. Will write same signal in both channels.''')
-                return (wave,wave)
-          
-            else: #should rewrite as warning
-                if display_warnings: print('''Requested two channel signal. If frequencies are not compatible, second channel wave will be cut off.''')
-    
-        #If no correction was needed, return as input
-        return wave
+        if not isinstance(wave, (tuple, list)):
+            #If user passed one wave object, but requested more channels
+            if display_warnings and self.nchannels > 1: 
+                print('Requested {} channel signal, but only provided one wave object. Will write same signal in all channels.'.format(self.nchannels))
+            return (wave,) * self.nchannels
+        
+        if display_warnings and len(wave) != self.nchannels:
+            print('Requested {} channel signal, but provided {} waves. Missing channels will be silent and extra waves dropped.'.format(
+                    self.nchannels, len(wave)))
+        wave = tuple(wave[:self.nchannels])
+        return wave + (None,) * (self.nchannels - len(wave))
         
     def eval_wave(self, wave, time):
         """Simple method evaluating the given wave(s) according to channels.
               
         Parameters
         ----------
-        wave : wave object
-            Object created by wavemaker class with desired function
+        wave : tuple
+            Object(s) created by wavemaker class with desired function, 
+            one per channel (or None, for silence)
             
         time : numpy array
             Time in which to evaluate given waveform function
@@ -188,138 +941,351 @@ class PyAudioWave:
         Returns
         ----------
         numpy array
-            Evaluated given wave
+            Evaluated given wave, with shape (nchannels, len(time))
         """
         
-        #Could also be implemented as [wave[i] for i in range(nchannels)]
-        if self.nchannels == 1:
-            #list is used to have an array of shape (1,N), instad of (N,)
-            signal = np.array([np.transpose(wave[0].evaluate(time))])
-        else:
-            signal = np.array([np.transpose(w.evaluate(time)) for w in wave])
-            
+        signal = np.zeros((len(wave), len(time)))
+        for channel, w in enumerate(wave):
+            if w is not None:
+                signal[channel] = w.evaluate(time)
         return signal
     
-    def yield_a_bit(self, signal):
-        """Yield chunck of the given signal of lenght buffer_size. 
-       
+    def chunk_lengths(self, total_frames):
+        """Yields the length of every chunk in a stream of given length.
+        
         Parameters
-        ----------         
-        signal : numpy array
-            Signal to be played. Should be an array of shape (samples, nchannels).
+        ----------
+        total_frames : int or None
+            Total number of frames. If None, yields buffer_size forever.
             
         Yields
         ----------
-        str
-            Byte stream signal formatted as is needed by pyaudio to play 
+        int
+            Number of frames in next chunk
+        """
+        
+        written = 0
+        while total_frames is None or written < total_frames:
+            if total_frames is None:
+                frames = self.buffer_size
+            else:
+                frames = min(self.buffer_size, total_frames - written)
+            written += frames
+            yield frames
+    
+    def loop_fraction(self, frequency):
+        """Finds the shortest whole number of periods that fits in a whole
+        number of samples, allowing a relative frequency error of up to
+        loop_tolerance.
+        
+        Parameters
+        ----------
+        frequency : float
+            Repetition frequency of the wave (inverse of its period).
+            
+        Returns
+        ----------
+        Fraction
+            cycles/samples, a rational approximation of 
+            frequency/sampling_rate
+        """
+        
+        ratio = Fraction(frequency) / Fraction(self.sampling_rate)
+        is_close = lambda approx: abs(approx - ratio) <= self.loop_tolerance * ratio
+        
+        #Find a big enough denominator limit, then the smallest one
+        limit = 1
+        while not is_close(ratio.limit_denominator(limit)):
+            limit *= 2
+        low = limit // 2
+        while limit - low > 1:
+            middle = (low + limit) // 2
+            if is_close(ratio.limit_denominator(middle)):
+                limit = middle
+            else:
+                low = middle
+                
+        return ratio.limit_denominator(limit)
+    
+    def render_loop(self, wave):
+        """Renders the given wave on the shortest loop that holds a whole
+        number of its periods, so that it can be repeated without 
+        discontinuities.
+        
+        The wave's repetition frequency (inverse of its period) is 
+        approximated by a rational number of cycles per sample (see 
+        loop_fraction) and the wave is rendered at exactly that frequency.
+        The loop is repeated until it is at least buffer_size samples long.
+        It is rendered block by block straight into float32.
+        
+        Parameters
+        ----------
+        wave : wave object
+            Object created by wavemaker class with desired function
+            
+        Returns
+        ----------
+        numpy array or None
+            Read-only one-dimensional float32 loop, or None if it would be
+            longer than max_loop_duration.
+        """
+        
+        fraction = self.loop_fraction(1 / wave.period)
+        length = fraction.denominator * -(-self.buffer_size // fraction.denominator)
+        self.debugprint('Loop length: {}'.format(length))
+        
+        if length > self.max_loop_duration * self.sampling_rate:
+            self.debugprint('Loop too long, will not render it')
+            return None
+        
+        #Warp time so that the wave has exactly the rational frequency
+        warp = float(fraction * self.sampling_rate) * wave.period
+        step = warp / self.sampling_rate
+        
+        #Render by blocks, so no full-length float64 array is ever built
+        loop = np.empty(length, dtype=np.float32)
+        for start in range(0, length, self.buffer_size):
+            stop = min(start + self.buffer_size, length)
+            wave.evaluate(np.arange(start, stop) * step, out=loop[start:stop])
+        
+        loop.flags.writeable = False
+        return loop
+    
+    def get_loop(self, wave):
+        """Returns the loop for given wave, from cache if possible.
+        
+        Loops are cached by wave specification, sampling_rate, 
+        buffer_size, loop_tolerance and max_loop_duration. Waves without a
+        specification are rendered every time.
+        
+        Parameters
+        ----------
+        wave : wave object
+            Object created by wavemaker class with desired function
+            
+        Returns
+        ----------
+        numpy array or None
+            Read-only one-dimensional float32 loop, or None if it would be 
+            too long.
+        """
+        
+        if self.cache is None:
+            return self.render_loop(wave)
+        
+        spec = getattr(wave, 'spec', None)
+        if spec is None:
+            key = None
+        else:
+            key = (spec, self.sampling_rate, self.buffer_size, 
+                   self.loop_tolerance, self.max_loop_duration)
+            
+        loop = self.cache.get(key)
+        if loop is None:
+            loop = self.render_loop(wave)
+            if loop is not None:
+                self.cache.put(key, loop)
+        return loop
+    
+    def channel_engine(self, wave, loop=True, frequency=None, amplitude=None):
+        """Returns an engine that streams the given wave on one channel.
+        
+        Parameters
+        ----------
+        wave : wave object or None
+            Object created by wavemaker class with desired function. If 
+            None, the channel is silent.
+        loop : bool optional
+            If True, try to stream from a rendered loop. Ignored if any
+            schedule is given. Default: True.
+        frequency : schedule or None optional
+            Schedule for the wave's frequency. Default: None.
+        amplitude : schedule or None optional
+            Schedule for a factor multiplying the wave. Default: None.
+            
+        Returns
+        ----------
+        LoopChannel, PhaseChannel, BurstChannel, FileChannel, 
+        ResampledFileChannel or SilentChannel
+            Object with a fill(out) method
+        """
+        
+        if wave is None:
+            return SilentChannel()
+        
+        if isinstance(wave, wavemaker.AudioFile):
+            if (frequency is None and amplitude is None and 
+                    wave.samplerate == self.sampling_rate):
+                return FileChannel(wave)
+            return ResampledFileChannel(wave, self.sampling_rate, 
+                                        self.buffer_size, frequency, 
+                                        amplitude)
+        
+        if frequency is not None or amplitude is not None:
+            return PhaseChannel(wave, self.sampling_rate, self.buffer_size,
+                                frequency, amplitude)
+        
+        if isinstance(wave, wavemaker.Burst):
+            return BurstChannel(wave, self.sampling_rate)
         
+        rendered = self.get_loop(wave) if loop else None
+        if rendered is not None:
+            return LoopChannel(rendered)
+        return PhaseChannel(wave, self.sampling_rate, self.buffer_size)
+    
+    def channel_schedules(self, schedule, nchannels):
+        """Returns a list with one schedule (or None) per channel.
+        
+        Parameters
+        ----------
+        schedule : schedule, tuple or None
+            A single schedule is used on every channel. A tuple gives one
+            schedule (or None) per channel.
+        nchannels : int
+            Number of channels.
+            
+        Returns
+        ----------
+        list
+            Schedules per channel
+        """
+        
+        if not isinstance(schedule, (tuple, list)):
+            return [schedule] * nchannels
+        if len(schedule) < nchannels:
+            raise ValueError('Expected one schedule per channel')
+        return list(schedule[:nchannels])
+        
+    def stream_channels(self, engines, total_frames):
+        """Yields interleaved chunks filled by one engine per channel.
+        
+        If every engine can tell its next chunk is silent (i.e. bursts 
+        while off), a block of zeros, encoded once, is yielded instead.
+        
+        Parameters
+        ----------
+        engines : list
+            Channel engines, each with a fill(out) method
+        total_frames : int or None
+            Total number of frames. If None, yields forever.
+            
+        Yields
+        ----------
+        numpy array
+            Interleaved chunk of shape (frames, channels), encoded in 
+            sample_format
         """
-        #Since buffers_per_arrray might be smaller than 
-        #len(signal)//self.buffer_size, I'll use the latter:
-        self.debugprint('Entered yield_a_bit')
-        for i in range(int(signal.shape[1]/self.buffer_size)):
+        
+        block = np.zeros((self.buffer_size, len(engines)), dtype=np.float32)
+        output = block.view()
+        output.flags.writeable = False
+        encoder = ChunkEncoder(self.sample_format, block.shape, self.dither,
+                               self.rng)
+        
+        for frames in self.chunk_lengths(total_frames):
+            if all(hasattr(engine, 'silent') and engine.silent(frames)
+                   for engine in engines):
+                for engine in engines:
+                    engine.skip(frames)
+                yield encoder.silence(frames)
+                continue
             
-#            self.debugprint('Engaged its for loop. Iteration {} of {}'.format(i, int(signal.shape[1]/self.buffer_size)))
-            yield self.encode(signal[:,self.buffer_size * i:self.buffer_size * (i+1)])
+            for channel, engine in enumerate(engines):
+                engine.fill(block[:frames, channel])
+            yield encoder.encode(output[:frames])
     
 #% The actual useful methods
     
-    def write_generator(self, wave, duration=None, buffers_per_array=100, display_warnings=False):
+    def write_generator(self, wave, duration=None, buffers_per_array=100, display_warnings=False,
+                        loop=True, frequency=None, amplitude=None):
         """Creates a generator to yield chunks of length buffer_size of the 
         generated wave for a total time equal to duration. If duration is
         None, it will generate samples forever.
         
+        Every channel is streamed by its own engine and channels are only
+        interleaved when writing each chunk, so waves with unrelated 
+        frequencies play without glitches. If loop is True, each wave is 
+        rendered once into a seamless loop (or taken from cache) and read
+        with a cursor. If its loop would be longer than max_loop_duration,
+        or loop is False, the channel keeps a phase accumulator and every
+        chunk is evaluated, which allows changing frequencies while 
+        streaming. Frequency and amplitude may also follow schedules (Ramp 
+        or Steps), applied sample by sample with continuous phase, so a 
+        whole stepped sweep plays in a single stream. Bursts 
+        (wavemaker.Burst) are never looped: only their on parts are 
+        evaluated, and chunks where every channel is off are yielded from a
+        preallocated block of zeros. Chunks are written into a preallocated
+        float32 block, and exactly duration*sampling_rate frames are 
+        yielded (the last chunk may be shorter than buffer_size).
+        
+        Yielded chunks are read-only views, so each one is only valid until
+        the next one is requested. Copy them (i.e. with tobytes) to keep 
+        them.
         
         Parameters
         ----------
-        wave : wave object
-            Object created by wavemaker class with desired function
+        wave : wave object, tuple or dict
+            Object(s) created by wavemaker class with desired function. See
+            resolve_nchannels for how they are mapped to channels.
             
         duration : int or float optional
             Desired time lenght of signal in seconds. Default: none.
             
         buffers_per_array : int optional
-            How many buffer sized "blocks" should be fitted in the 
-            array. Default: 100.
+            Unused, kept for backwards compatibility. Default: 100.
             
         display_warning : bool
             If True displays warnings regarding number of channels
             and wave incompatibilities. Default= False.
+            
+        loop : bool optional
+            If True, stream from rendered loops when possible. If False, 
+            stream from phase accumulators. Default: True.
+            
+        frequency : Ramp, Steps, tuple or None optional
+            Frequency schedule in Hz. A tuple gives one schedule (or None)
+            per channel. Default: None.
+            
+        amplitude : Ramp, Steps, tuple or None optional
+            Schedule for a factor multiplying each wave. A tuple gives one 
+            schedule (or None) per channel. Default: None.
           
             
         Yields
         ----------
-        str
-            Byte stream signal formatted as is needed by pyaudio to play 
+        numpy array
+            Interleaved chunk of shape (frames, nchannels), encoded in 
+            sample_format as is needed by pyaudio to play 
         
         """
         
         wave = self.resolve_nchannels(wave, display_warnings)
         self.debugprint('Wave tuple lentgh: {}'.format(len(wave)))
         
-        #Get whole number of periods bigger than given buffer_size
-        required_periods = self.buffer_size * wave[0].frequency // self.sampling_rate + 1
-        
-        #Create a time vector just greater than buffers_per_array*buffer_size
-        time = self.create_time(wave[0],
-                                periods_per_chunk = required_periods * buffers_per_array)
-        self.debugprint('Time length: {}'.format(len(time)))
-
-        signal = self.eval_wave(wave, time)
-        self.debugprint('Signal = {}'.format(signal))
-        self.debugprint('Signal shape: {}'.format(signal.shape))
-#        yield signal
-        
-        yield_signal = signal
-        
-        #Handle different duration values:
-        
         if duration is None:
             self.debugprint('Mode engaged: Indefinitely')
-            # Yield samples indefinitely
-            while True:
-                
-                yield from self.yield_a_bit(yield_signal)
-                
-                last_place = yield_signal.shape[1]//self.buffer_size
-                yield_signal = np.concatenate((yield_signal[:,last_place:],signal), axis=1)
-                        
-        elif duration < signal.shape[1] / self.sampling_rate:
-            self.debugprint('Mode engaged: Short')
-            total_length = duration * self.sampling_rate
-            yield from self.yield_a_bit(signal[:,:total_length])
-            yield self.encode(signal[:,total_length:]) #yield last bit
-            
-        else: 
-            self.debugprint('Mode engaged: Long')
-            
-            iterations = duration * wave[0].frequency // (required_periods * buffers_per_array)
-            self.debugprint('Number of full iterations to run: {}'.format(iterations))
+            total_frames = None
+        else:
+            total_frames = int(round(duration * self.sampling_rate))
+            self.debugprint('Frames to yield: {}'.format(total_frames))
             
-            for _ in range(int(iterations)):
-                
-                yield from self.yield_a_bit(yield_signal)
-                
-                last_place = int(yield_signal.shape[1]/self.buffer_size)
-                self.debugprint(''' Array sizes:
-                    yield_signal[:,last_place:]: {}
-                    signal: {}'''.format(
-                    yield_signal[:,last_place:].shape, signal.shape))
-                yield_signal = np.concatenate((yield_signal[:,last_place:],signal), axis=1)
-            #Missing line to get exact duration
-                
+        frequency = self.channel_schedules(frequency, len(wave))
+        amplitude = self.channel_schedules(amplitude, len(wave))
+        engines = [self.channel_engine(w, loop, f, a) 
+                   for w, f, a in zip(wave, frequency, amplitude)]
+        yield from self.stream_channels(engines, total_frames)
                
     def plot_signal(self, wave, periods_per_chunk=1):
         """ Returns time and signal arrays ready to plot. If only one wave is
         given, output will be the same as write_signal, but will also return
-        time. If a tuple of waves is given, output will be time and a list of
-        the signal arrays.
+        time. If a tuple or dict of waves is given, output will be time and 
+        a list of the signal arrays, one per channel.
         
         
         Parameters
         ----------
-        wave : wave object
-            Object created by wavemaker class with desired function
+        wave : wave object, tuple or dict
+            Object(s) created by wavemaker class with desired function
             
        periods_per_chunk : int or float optional
             Amount of periods to be sent to audio output. Default: 1.
@@ -332,20 +1298,24 @@ class PyAudioWave:
         
         """
         
-        if not isinstance(wave,tuple):
+        if not isinstance(wave, (tuple, list, dict)):
             time = self.create_time(wave, periods_per_chunk)
             
             return time, wave.evaluate(time)
       
         else: 
-            time = self.create_time(wave[0], periods_per_chunk)
-            signal_list = [w.evaluate(time) for w in wave]
+            wave = self.resolve_nchannels(wave, False)
+            first = next(w for w in wave if w is not None)
+            time = self.create_time(first, periods_per_chunk)
+            signal_list = list(self.eval_wave(wave, time))
             
             return time, signal_list
 
-    def generator_setup(self, wave, duration=None, buffers_per_array=100, display_warnings=False):
+    def generator_setup(self, wave, duration=None, buffers_per_array=100, display_warnings=False,
+                        loop=True, frequency=None, amplitude=None):
         si = SignalMaker(wave, duration, self)
-        si.generator = self.write_generator( wave, duration, buffers_per_array, display_warnings)
+        si.generator = self.write_generator( wave, duration, buffers_per_array, display_warnings,
+                                            loop, frequency, amplitude)
         return si
         
         
@@ -357,6 +1327,64 @@ class SignalMaker(PyAudioWave):
         self.duration = duration
         self.parent = parent
         
+#%% Benchmark of the float32 pipeline
+
+def stream_benchmark(wave, duration=10, samplingrate=44100, buffersize=1024,
+                     nchannels=1, loop=True):
+    """Streams a wave as fast as possible and returns timing and traffic,
+    next to those of a float64 baseline.
+    
+    The baseline evaluates the same blocks at the same times, but into a 
+    float64 block, as the stream did before samples were kept in float32.
+    
+    Parameters
+    ----------
+    wave : wave object or tuple
+        Object created by wavemaker class with desired function
+    duration : int or float optional
+        Streamed time in seconds. Default: 10.
+    samplingrate : int optional
+        Sampling rate. Default: 44100.
+    buffersize : int optional
+        Chunk length. Default: 1024.
+    nchannels : int optional
+        Number of channels. Default: 1.
+    loop : bool optional
+        If True, stream from rendered loops. Default: True.
+        
+    Returns
+    ----------
+    dict
+        seconds taken, realtime factor (streamed over elapsed time) and 
+        bytes yielded, for the stream and for the float64 baseline.
+    """
+    
+    maker = PyAudioWave(samplingrate, buffersize, nchannels, cache=None)
+    nbytes = 0
+    start = perf_counter()
+    for chunk in maker.write_generator(wave, duration, loop=loop):
+        nbytes += chunk.nbytes
+    seconds = perf_counter() - start
+    
+    waves = maker.resolve_nchannels(wave, False)
+    block = np.zeros((buffersize, nchannels))
+    float64_nbytes = 0
+    first = 0
+    start = perf_counter()
+    for frames in maker.chunk_lengths(int(round(duration * samplingrate))):
+        for channel, w in enumerate(waves):
+            if w is not None:
+                time = np.arange(first, first + frames) / samplingrate
+                block[:frames, channel] = w.evaluate(np.mod(time, w.period))
+        float64_nbytes += block[:frames].nbytes
+        first += frames
+    float64_seconds = perf_counter() - start
+    
+    return dict(seconds=seconds, realtime=duration/seconds, nbytes=nbytes,
+                float64_seconds=float64_seconds, 
+                float64_realtime=duration/float64_seconds,
+                float64_nbytes=float64_nbytes)
+
 #%% example to try everything out
             
 #import wavemaker
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""Lets tests import the modules at the repository's root.
+
+PyAudio is replaced by a loopback test double (see fakepyaudio), so tests
+neither need it installed nor touch any sound card.
+"""
+
+import os, sys
+
+import matplotlib
+matplotlib.use('Agg')
+
+import fakepyaudio
+sys.modules['pyaudio'] = fakepyaudio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""A loopback test double for the parts of PyAudio used by fwp_pyaudio.
+
+Channel 0 of every output stream is mixed into a shared signal (the air),
+which input streams read back LOUT + LIN samples later, scaled by GAIN.
+Callback streams are run by a background thread that advances a shared
+sample clock STEP frames at a time, several times faster than real time.
+Each stream is called back with blocks of its frames_per_buffer (1024 if
+not given), unless BLOCK forces every frame_count.
+
+Blocking streams keep what they are given in written, counting frames the
+way PyAudio's Stream.write does.
+"""
+
+import threading, time
+import numpy as np
+
+paFloat32 = 1
+paInt32 = 2
+paInt24 = 4
+paInt16 = 8
+paContinue = 0
+paComplete = 1
+paAbort = 2
+
+SIZES = {paFloat32: 4, paInt32: 4, paInt24: 3, paInt16: 2}
+SCALES = {paFloat32: ('<f4', 1), paInt32: ('<i4', 2.**-31),
+          paInt16: ('<i2', 2.**-15)}
+
+LOUT = 300 #Output latency, in samples
+LIN = 200 #Input latency, in samples
+GAIN = .5
+STEP = 256
+
+lock = threading.RLock()
+
+def reset():
+    """Silences the air, rewinds the clock and forgets every stream."""
+
+    global BLOCK, FAIL_OPEN, instances, streams, air, clock
+    with lock:
+        BLOCK = None #If given, frame_count of every callback
+        FAIL_OPEN = False #If True, PyAudio.open raises OSError
+        instances = 0 #PyAudio instances not terminated
+        streams = []
+        air = np.zeros(2**22, dtype=np.float32)
+        clock = 0
+
+reset()
+
+def get_sample_size(sampleformat):
+
+    return SIZES[sampleformat]
+
+class Stream:
+
+    def __init__(self, rate, channels, format, input=False, output=False,
+                 input_device_index=None, output_device_index=None,
+                 frames_per_buffer=None, start=True, stream_callback=None):
+
+        self.rate = rate
+        self.channels = channels
+        self.format = format
+        self.input = input
+        self.output = output
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = stream_callback
+        self.active = False
+        self.closed = False
+        self.error = None
+        self.written = []
+        self.frame_counts = []
+        if start:
+            self.start_stream()
+
+    def block(self):
+
+        return BLOCK or self.frames_per_buffer or 1024
+
+    def cycle(self, now):
+
+        frames = self.block()
+        first = now - LIN - frames
+        in_data = None
+        if self.input:
+            signal = np.zeros(frames, dtype=np.float32)
+            if first + frames > 0:
+                start = max(first, 0)
+                signal[start-first:] = air[start:first+frames]
+            signal *= GAIN
+            in_data = np.repeat(signal[:, None], self.channels, 1).tobytes()
+
+        time_info = {'input_buffer_adc_time': first / self.rate,
+                     'output_buffer_dac_time': (now + LOUT) / self.rate,
+                     'current_time': now / self.rate}
+        self.frame_counts.append(frames)
+        try:
+            out_data, flag = self.callback(in_data, frames, time_info, 0)
+        except Exception as error:
+            self.error = error
+            out_data, flag = None, paAbort
+
+        if self.output and out_data is not None and self.format in SCALES:
+            dtype, scale = SCALES[self.format]
+            samples = np.frombuffer(bytes(out_data), dtype=dtype)
+            samples = samples.reshape(-1, self.channels)[:frames, 0] * scale
+            air[now+LOUT:now+LOUT+len(samples)] += samples
+        if flag != paContinue:
+            self.active = False
+
+    def start_stream(self):
+
+        with lock:
+            self.active = True
+            self.due = clock
+
+    def stop_stream(self):
+
+        with lock:
+            self.active = False
+
+    def is_active(self):
+
+        return self.active
+
+    def is_stopped(self):
+
+        return not self.active
+
+    def close(self):
+
+        with lock:
+            self.active = False
+            self.closed = True
+
+    def write(self, frames, num_frames=None, exception_on_underflow=False):
+
+        width = self.channels * SIZES[self.format]
+        if num_frames is None:
+            num_frames = int(len(frames) / width)
+        self.written.append(bytes(frames)[:num_frames * width])
+
+    def read(self, num_frames, exception_on_overflow=True):
+
+        return bytes(num_frames * self.channels * SIZES[self.format])
+
+class PyAudio:
+
+    def __init__(self):
+
+        global instances
+        instances += 1
+
+    def open(self, **options):
+
+        if FAIL_OPEN:
+            raise OSError('Invalid number of channels')
+        stream = Stream(**options)
+        with lock:
+            streams.append(stream)
+        return stream
+
+    def terminate(self):
+
+        global instances
+        instances -= 1
+
+def tick():
+    """Advances the clock one STEP, calling back every due stream."""
+
+    global clock
+    with lock:
+        clock += STEP
+        for stream in streams:
+            while (stream.active and stream.callback is not None and
+                   stream.due <= clock):
+                stream.cycle(stream.due)
+                stream.due += stream.block()
+
+def run():
+
+    while True:
+        time.sleep(.001)
+        tick()
+
+threading.Thread(target=run, daemon=True).start()
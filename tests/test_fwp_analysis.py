@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Tests for the fwp_analysis module."""
+
+import numpy as np
+import pytest
+import fwp_analysis as anly
+import wavemaker as wm
+
+#%% Sweep deconvolution
+
+def looped(wave, periods, samplerate=44100):
+    """Returns a float64 wave sampled over a number of its periods."""
+    
+    time = np.arange(int(round(periods * wave.period * samplerate)))
+    time = np.mod(time / samplerate, wave.period)
+    return np.asarray(wave.evaluate(time), dtype=float)
+
+def test_sweep_inverse_filter_has_unit_gain_in_band():
+    """Sweep convolved with its inverse filter is flat within 1 dB."""
+    
+    sweep = wm.Sweep(50, 10000, duration=1, silence=.5)
+    inverse = anly.sweep_inverse_filter(sweep)
+    played = sweep.evaluate(np.arange(len(inverse)) / 44100)
+    
+    nfft = 2**17
+    gain = np.abs(np.fft.rfft(played, nfft) * np.fft.rfft(inverse, nfft))
+    frequencies = np.fft.rfftfreq(nfft, 1/44100)
+    band = (frequencies >= 100) & (frequencies <= 5000)
+    assert np.all(np.abs(20 * np.log10(gain[band])) < 1)
+
+def test_sweep_response_separates_harmonics():
+    """A quadratic distortion shows up as the 2nd harmonic only."""
+    
+    sweep = wm.Sweep(50, 10000, duration=1, silence=.5)
+    played = looped(sweep, 2)
+    recording = played + .1 * played**2 #2nd harmonic at half of .1
+    
+    time, impulse, frequencies, response, distortion = anly.sweep_response(
+            recording, sweep, harmonics=2)
+    band = (frequencies >= 200) & (frequencies <= 2000)
+    np.testing.assert_allclose(np.abs(response[band]), 1, atol=.1)
+    np.testing.assert_allclose(np.abs(distortion[0][band]), .05, atol=.01)
+
+def test_sweep_response_needs_a_whole_period():
+    
+    sweep = wm.Sweep(50, 10000, duration=1, silence=.5)
+    with pytest.raises(ValueError):
+        anly.sweep_response(np.zeros(1000), sweep)
+
+#%% Multisine response
+
+def test_multisine_response_reads_gain_and_delay():
+    """A gain and a delay give flat amplitude and linear phase on every 
+    excited bin."""
+    
+    multisine = wm.Multisine(100, 5000, samples=2**14)
+    recording = .5 * np.roll(looped(multisine, 3), 7) #7 samples late
+    
+    frequencies, amplitude, phase = anly.multisine_response(recording, 
+                                                            multisine)
+    np.testing.assert_allclose(amplitude, .5, atol=1e-6)
+    error = np.angle(np.exp(1j * (phase + 2*np.pi * frequencies * 7/44100)))
+    np.testing.assert_allclose(error, 0, atol=1e-6)
+
+def test_multisine_response_needs_a_whole_period():
+    
+    multisine = wm.Multisine(100, 5000, samples=2**14)
+    with pytest.raises(ValueError):
+        anly.multisine_response(np.zeros(1000), multisine)
+    with pytest.raises(ValueError):
+        anly.multisine_response(looped(multisine, 2), multisine, periods=3)
+
+#%% Maximum length sequences
+
+def test_fast_hadamard_matches_sylvester_matrix():
+    
+    from scipy.linalg import hadamard
+    data = np.random.RandomState(0).randn(64)
+    np.testing.assert_allclose(anly.fast_hadamard(data), hadamard(64) @ data,
+                               atol=1e-12)
+
+def test_mls_response_recovers_impulse_response():
+    """A filtered sequence gives back the filter's taps, and zeros after."""
+    
+    mls = wm.MLS(order=12, amplitude=.8)
+    played = looped(mls, 3, mls.samplerate)
+    taps = np.zeros(50)
+    taps[[2, 3, 10]] = 1, -.5, .25
+    recording = np.convolve(played, taps)[:len(played)]
+    
+    time, impulse = anly.mls_response(recording, mls)
+    assert len(impulse) == 2**12 - 1
+    np.testing.assert_allclose(impulse[:50], taps, atol=1e-9)
+    np.testing.assert_allclose(impulse[50:], 0, atol=1e-9)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Tests for the fwp_pyaudio module, on a loopback PyAudio double."""
+
+import time
+import numpy as np
+import pytest
+import fakepyaudio
+import fwp_pyaudio as fwp
+import pyaudiowave as paw
+import wavemaker as wm
+
+@pytest.fixture
+def loopback():
+    """Resets the PyAudio double, and checks every reference to PortAudio
+    was given back."""
+    
+    fakepyaudio.reset()
+    yield fakepyaudio
+    assert fwp.audio_context.references == 0
+    assert fakepyaudio.instances == 0
+
+#%% Shared PortAudio
+
+def test_audio_context_terminates_on_last_reference(loopback):
+    """PortAudio is initialized once for nested references, and terminated
+    when the last one is given back."""
+    
+    with fwp.audio_context:
+        stream = fwp.play()
+        assert loopback.instances == 1
+        fwp.close_stream(stream)
+        assert fwp.audio_context.references == 1
+        assert loopback.instances == 1
+    assert fwp.audio_context.pyaudio is None
+    assert loopback.instances == 0
+    assert stream.closed
+
+def test_audio_context_reuses_streams_within_a_block(loopback):
+    """Within a with block, a closed stream is reused by the next one with
+    the same settings, and not by one with other settings."""
+    
+    with fwp.audio_context:
+        first = fwp.play(2)
+        fwp.close_stream(first)
+        second = fwp.play(2)
+        other = fwp.play(1)
+        fwp.close_stream(second)
+        fwp.close_stream(other)
+    assert second is first
+    assert other is not first
+    assert len(loopback.streams) == 2
+
+def test_audio_context_releases_streams_that_fail_to_open(loopback):
+    """A stream PortAudio refuses to open holds no reference."""
+    
+    loopback.FAIL_OPEN = True
+    with pytest.raises(OSError):
+        fwp.play()
+    assert fwp.audio_context.references == 0
+    
+    with fwp.audio_context:
+        with pytest.raises(OSError):
+            fwp.rec()
+        assert fwp.audio_context.references == 1
+
+#%% Blocking playback
+
+@pytest.mark.parametrize('sampleformat', ['float32', 'int16', 'int24'])
+def test_just_play_writes_whole_chunks(loopback, sampleformat):
+    """Every frame of every chunk is written, whatever the sample size."""
+    
+    waves = (wm.Wave('sine', 440), wm.Wave('triangular', 220))
+    maker = paw.PyAudioWave(44100, 256, nchannels=2, cache=None,
+                            sampleformat=sampleformat)
+    expected = b''.join(chunk.tobytes() for chunk in 
+                        maker.write_generator(waves, .1))
+    
+    fwp.just_play(maker.generator_setup(waves, .1))
+    assert b''.join(loopback.streams[-1].written) == expected
+
+#%% Prerendered playback
+
+def slow_chunks(count, frames=1024, delay=.005):
+    """Yields count float32 chunks numbered from 0, taking a while each."""
+    
+    for number in range(count):
+        time.sleep(delay)
+        yield np.full(frames, number, dtype=np.float32)
+
+def test_prerender_keeps_order_and_raises_generator_error():
+    """Chunks come out in order until the generator fails, and its error is
+    raised by stop."""
+    
+    def failing():
+        yield from slow_chunks(3, frames=4)
+        raise RuntimeError('render failed')
+    
+    prerender = fwp.Prerender(failing(), depth=8)
+    assert prerender.prime(timeout=5)
+    
+    chunks = []
+    while True:
+        chunk = prerender.get()
+        if chunk is None:
+            break
+        chunks.append(np.frombuffer(chunk, dtype=np.float32)[0])
+    assert chunks == [0, 1, 2]
+    assert prerender.underruns == 0
+    with pytest.raises(RuntimeError, match='render failed'):
+        prerender.stop()
+
+def test_prerender_primes_a_full_queue():
+    """prime waits for depth chunks, even if rendering each one is slow."""
+    
+    prerender = fwp.Prerender(slow_chunks(10), depth=4)
+    assert prerender.prime(timeout=5)
+    assert prerender.queue.full()
+    prerender.stop()
+
+def test_play_callback_readahead_starts_without_underruns(loopback):
+    """The stream only starts once readahead chunks are ready, so a slow
+    generator doesn't leave its first callbacks silent."""
+    
+    stream = fwp.play_callback(slow_chunks(6), readahead=6)
+    deadline = time.time() + 5
+    while stream.is_active() and time.time() < deadline:
+        time.sleep(.01)
+    fwp.close_stream(stream)
+    stream.prerender.stop()
+    
+    assert stream.prerender.underruns == 0
+    start = stream.due - sum(stream.frame_counts) + loopback.LOUT
+    played = loopback.air[start:start + 6 * 1024]
+    np.testing.assert_array_equal(played, np.repeat(np.arange(6), 1024))
+
+def test_readahead_rejects_repeat():
+    """repeat plays a single chunk, so there's nothing to render ahead."""
+    
+    with pytest.raises(ValueError):
+        fwp.play_source(slow_chunks(1), repeat=True, readahead=4)
+
+#%% Recording
+
+def numbered_blocks(sizes, channels=2):
+    """Yields float32 blocks as bytes, numbering frames from 0 on."""
+    
+    first = 0
+    for size in sizes:
+        frames = np.arange(first, first + size, dtype=np.float32)
+        yield np.repeat(frames[:, None], channels, 1).tobytes()
+        first += size
+
+def test_recorder_fills_its_buffer_and_completes():
+    """With a duration, blocks are copied in order until the buffer is full,
+    and the stream is then completed."""
+    
+    recorder = fwp.Recorder(1, 2, samplerate=1000)
+    flags = [recorder.callback(block, len(block) // 8, {}, 0)[1]
+             for block in numbered_blocks([300, 450, 400])]
+    
+    assert flags == [fakepyaudio.paContinue] * 2 + [
+            fakepyaudio.paComplete]
+    assert recorder.done.is_set()
+    np.testing.assert_array_equal(recorder.available()[:, 1], 
+                                  np.arange(1000))
+    np.testing.assert_array_equal(recorder.latest(10)[:, 0], 
+                                  np.arange(990, 1000))
+
+def test_recorder_ring_keeps_the_latest_frames():
+    """Without a duration, the last ring_duration seconds are kept, even
+    when a block is longer than the ring."""
+    
+    recorder = fwp.Recorder(None, 1, samplerate=1000, ring_duration=1, 
+                            streamchannels=2)
+    for block in numbered_blocks([700, 600]):
+        recorder.callback(block, len(block) // 8, {}, 0)
+    np.testing.assert_array_equal(recorder.latest(), np.arange(300, 1300))
+    np.testing.assert_array_equal(recorder.latest(5), np.arange(1295, 1300))
+    
+    recorder.callback(next(numbered_blocks([2500])), 2500, {}, 0)
+    np.testing.assert_array_equal(recorder.available(), np.arange(1500, 2500))
+    with pytest.raises(ValueError):
+        recorder.wait()
+
+def test_recorder_records_the_loopback(loopback):
+    """A recording of a given duration is returned once captured, and its
+    stream is given back."""
+    
+    stream = fwp.play_callback(paw.PyAudioWave(44100, 1024).generator_setup(
+            wm.Wave('sine', 441)).generator)
+    recording = fwp.Recorder(.1, 2).start().wait(timeout=5)
+    fwp.close_stream(stream)
+    
+    assert recording.shape == (4410, 2)
+    np.testing.assert_array_equal(recording[:, 0], recording[:, 1])
+    assert np.abs(recording).max() == pytest.approx(loopback.GAIN, abs=1e-3)
+
+#%% Full duplex
+
+def ramp_chunks(count, frames=1024):
+    """Yields count float32 chunks of a slow ramp, in one channel."""
+    
+    for number in range(count):
+        ramp = np.arange(number * frames, (number + 1) * frames) / 2**14
+        yield ramp.astype(np.float32)[:, None]
+
+@pytest.mark.parametrize('block', [None, 1000, 1500])
+def test_duplex_plays_every_frame_whatever_the_block(loopback, block):
+    """Chunks are played whole and in order even if PortAudio's blocks 
+    don't match them, and recorded a fixed latency later."""
+    
+    loopback.BLOCK = block
+    recorder = fwp.Recorder(10240 / 44100, 1)
+    stream = fwp.play_rec_callback(ramp_chunks(5), recorder, 
+                                   buffersize=1024)
+    recording = recorder.wait(timeout=5)
+    fwp.close_stream(stream)
+    
+    assert stream.frames_per_buffer == 1024
+    latency = loopback.LOUT + loopback.LIN + (block or 1024)
+    played = np.concatenate(list(ramp_chunks(5)))[:, 0]
+    np.testing.assert_array_equal(recording[:latency], 0)
+    np.testing.assert_allclose(recording[latency:latency + len(played)], 
+                               loopback.GAIN * played)
+    np.testing.assert_array_equal(recording[latency + len(played):], 0)
+
+#%% Measurement sessions
+
+def test_measurement_session_records_from_the_switch(loopback):
+    """Each recording starts delay seconds after its signal was heard, to
+    the sample, whatever the latency."""
+    
+    maker = paw.PyAudioWave(44100, 1024, cache=None)
+    waves = (wm.Wave('sine', 441), wm.Wave('triangular', 630, .5))
+    
+    with fwp.MeasurementSession(maker, 2) as session:
+        for wave in waves:
+            reference = paw.PyAudioWave(44100, 1024, cache=None)
+            played = np.concatenate([chunk[:, 0].copy() for chunk in 
+                                     reference.write_generator(wave, .2)])
+            session.play(maker.generator_setup(wave))
+            recording = session.record(.1, delay=.01, timeout=5)
+            
+            assert recording.shape == (4410, 2)
+            np.testing.assert_allclose(recording[:, 0], recording[:, 1])
+            np.testing.assert_allclose(recording[:, 0], 
+                                       loopback.GAIN * played[441:4851], 
+                                       atol=1e-6)
+
+def test_measurement_session_rejects_other_settings(loopback):
+    """Signals must be made with the session's settings."""
+    
+    maker = paw.PyAudioWave(44100, 1024, cache=None)
+    other = paw.PyAudioWave(48000, 1024, cache=None)
+    with fwp.MeasurementSession(maker) as session:
+        with pytest.raises(ValueError):
+            session.play(other.generator_setup(wm.Wave('sine')))
+
+def test_measurement_session_times_out_without_a_signal(loopback):
+    """Recording waits for a signal to start only as long as asked."""
+    
+    maker = paw.PyAudioWave(44100, 1024, cache=None)
+    with fwp.MeasurementSession(maker) as session:
+        with pytest.raises(TimeoutError):
+            session.record(.1, timeout=.05)
+
+def test_measurement_session_keeps_only_its_history(loopback):
+    """Frames older than history seconds can't be recorded anymore."""
+    
+    maker = paw.PyAudioWave(44100, 1024, cache=None)
+    with fwp.MeasurementSession(maker, history=.05) as session:
+        session.play(maker.generator_setup(wm.Wave('sine')))
+        session.record(.01, timeout=5)
+        time.sleep(.1) #Some .5 s of stream time
+        with pytest.raises(ValueError):
+            session.record(.01, timeout=5)
+
+#%% Latency
+
+def test_correlation_delay_finds_a_shifted_reference():
+    """The delay and channel of a reference buried in noise are found."""
+    
+    rng = np.random.default_rng(0)
+    reference = rng.uniform(-1, 1, 2000)
+    recording = .1 * rng.standard_normal((8000, 2))
+    recording[1234:3234, 1] += .3 * reference
+    
+    assert fwp.correlation_delay(recording, reference) == (1234, 1)
+    assert fwp.correlation_delay(recording[:, 1], reference) == (1234, 0)
+
+@pytest.mark.parametrize('block', [None, 1000])
+def test_measure_latency_on_the_loopback(loopback, monkeypatch, block):
+    """Round trip latency is that of the converters plus one block, and it 
+    is measured once."""
+    
+    monkeypatch.setattr(fwp, 'latencies', {})
+    loopback.BLOCK = block
+    expected = loopback.LOUT + loopback.LIN + (block or 1024)
+    
+    assert fwp.measure_latency(order=12) == expected
+    opened = len(loopback.streams)
+    assert fwp.measure_latency(order=12) == expected
+    assert len(loopback.streams) == opened
+
+def test_aligned_recording_starts_with_the_signal(loopback, monkeypatch):
+    """play_rec with align returns what was played, after settling."""
+    
+    monkeypatch.setattr(fwp, 'latencies', {})
+    wave = wm.Wave('sine', 441)
+    maker = paw.PyAudioWave(44100, 1024, cache=None)
+    played = np.concatenate([chunk[:, 0].copy() for chunk in 
+                             maker.write_generator(wave, .2)])
+    
+    recording = fwp.play_rec(maker.generator_setup(wave, .2), .1, 
+                             after_recording=fwp.AfterRecording(
+                                     showplot=False),
+                             align=True, settling=.01)
+    np.testing.assert_allclose(recording, 
+                               loopback.GAIN * played[441:4851], atol=1e-6)
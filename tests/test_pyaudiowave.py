@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Tests for the pyaudiowave module."""
+
+import numpy as np
+import pyaudiowave as paw
+import wavemaker as wm
+
+#%% Accuracy of the float32 pipeline
+
+def stream_error(wave, duration=2, samplingrate=44100, buffersize=1024):
+    """Returns the maximum difference between a streamed float32 wave and 
+    a float64 reference evaluated at every sample's exact time."""
+    
+    maker = paw.PyAudioWave(samplingrate, buffersize, cache=None)
+    error = 0
+    first = 0
+    for chunk in maker.write_generator(wave, duration, loop=False):
+        samples = np.arange(first, first + len(chunk))
+        time = np.mod(samples / samplingrate, wave.period)
+        reference = np.asarray(wave.evaluate(time), dtype=float)
+        error = max(error, np.abs(chunk[:, 0] - reference).max())
+        first += len(chunk)
+    return error
+
+def test_float32_stream_accuracy():
+    """Streamed samples are within float32 resolution of float64 ones."""
+    
+    waves = [wm.Wave('sine', 997.3), 
+             wm.Wave('triangular', 441, .8),
+             wm.Wave('sine', 12345.6, wavetable=True),
+             wm.Fourier('sawtooth', 220, 40),
+             wm.Multisine(100, 5000, samplerate=44100)]
+    for wave in waves:
+        assert stream_error(wave) < 1e-6
+    
+def test_benchmark_measures_baseline():
+    """The float64 baseline is measured, and takes twice the bytes."""
+    
+    result = paw.stream_benchmark(wm.Wave('sine'), duration=.5, nchannels=2)
+    assert result['float64_nbytes'] == 2 * result['nbytes']
+    assert result['float64_seconds'] > 0
+
+#%% Audio files
+
+def write_raw(tmp_path, samples):
+    filename = str(tmp_path / 'samples.raw')
+    np.asarray(samples, dtype='<f4').tofile(filename)
+    return filename
+
+def stream(wave, duration, samplingrate, buffersize=256, **kwargs):
+    maker = paw.PyAudioWave(samplingrate, buffersize, cache=None)
+    return np.concatenate([chunk[:, 0].copy() for chunk in 
+                           maker.write_generator(wave, duration, **kwargs)])
+
+def test_resampled_file_plays_once(tmp_path):
+    """A file at another rate is interpolated and then followed by silence,
+    instead of wrapping around."""
+    
+    samples = np.linspace(0, 1, 1000, endpoint=False)
+    wave = wm.AudioFile(write_raw(tmp_path, samples), raw=True, 
+                        samplerate=22050)
+    played = stream(wave, .2, 44100)
+    
+    np.testing.assert_allclose(played[:1998], np.arange(1998) / 2000, 
+                               atol=1e-6)
+    assert not played[2000:].any()
+
+def test_resampled_file_loops(tmp_path):
+    """A looping file at another rate keeps its count of samples."""
+    
+    samples = np.sin(2 * np.pi * np.arange(1000) / 100)
+    wave = wm.AudioFile(write_raw(tmp_path, samples), raw=True, 
+                        samplerate=22050, loop=True)
+    played = stream(wave, .2, 44100)
+    
+    time = np.arange(len(played)) / 44100
+    np.testing.assert_allclose(played, np.sin(2 * np.pi * 220.5 * time), 
+                               atol=2e-3)
+
+def test_file_evaluate_reads_runs(tmp_path):
+    """Evaluating times that wrap around a looping file gives its samples."""
+    
+    samples = np.arange(1000, dtype=float)
+    wave = wm.AudioFile(write_raw(tmp_path, samples), raw=True, 
+                        samplerate=1000, loop=True)
+    time = np.array([.990, .995, .999, 1.000, 1.002, .5])
+    np.testing.assert_array_equal(wave.evaluate(time), 
+                                  [990, 995, 999, 0, 2, 500])
+
+#%% Encoding
+
+def test_integer_chunks_reuse_buffers():
+    """Integer chunks are encoded into the same buffer, and silent chunks
+    are encoded only once."""
+    
+    burst = wm.Burst(wm.Wave('sine', 100), 2, 10)
+    maker = paw.PyAudioWave(44100, 256, cache=None, sampleformat='int24')
+    addresses = {}
+    for chunk in maker.write_generator(burst, .5):
+        silent = not chunk.any()
+        addresses.setdefault(silent, set()).add(
+                chunk.__array_interface__['data'][0])
+        assert chunk.shape[1] == 3 and not chunk.flags.writeable
+    assert len(addresses[True]) == 1
+    assert len(addresses[False]) == 1
+
+def test_int24_packs_three_low_bytes():
+    """int24 frames are the three lower bytes of little endian int32
+    samples, rounded and clipped to full scale."""
+
+    signal = np.random.default_rng(0).uniform(-1, 1, (500, 2))
+    signal[:3, 0] = 1, -1, 0
+    encoder = paw.ChunkEncoder('int24', signal.shape)
+    packed = encoder.encode(signal)
+
+    expected = np.clip(np.rint(signal * 2**23), -2**23, 2**23 - 1)
+    assert packed.shape == (500, 6) and packed.dtype == np.uint8
+    assert packed.tobytes() == b''.join(
+            int(sample).to_bytes(3, 'little', signed=True)
+            for sample in expected.ravel())
+
+def test_tpdf_dither_stays_within_one_step():
+    """Dither spreads a constant over the nearest integer steps, within
+    one step of it, differently every time but without any offset."""
+
+    level = .3 / 2**15
+    signal = np.full((100000, 1), level)
+    encoder = paw.ChunkEncoder('int16', signal.shape, dither=True)
+
+    first = np.array(encoder.encode(signal))
+    second = np.array(encoder.encode(signal))
+    assert not np.array_equal(first, second)
+    assert set(np.unique(first)) <= {-1, 0, 1}
+    assert abs(first.mean() - .3) < .01
+    assert not encoder.encode(signal, dither=False).any()
+
+    seeded = [paw.ChunkEncoder('int16', signal.shape, dither=True,
+                               rng=np.random.default_rng(1)).encode(signal)
+              for attempt in range(2)]
+    np.testing.assert_array_equal(*seeded)
+
+#%% Loop cache
+
+def test_loop_cache_keeps_makers_settings_apart():
+    """Makers sharing a cache get loops fitted to their own tolerance and
+    maximum duration."""
+    
+    cache = paw.LoopCache()
+    wave = wm.Wave('sine', 441.123456)
+    loose = paw.PyAudioWave(44100, 256, cache=cache, looptolerance=1e-2)
+    tight = paw.PyAudioWave(44100, 256, cache=cache, looptolerance=1e-6)
+    short = paw.PyAudioWave(44100, 256, cache=cache, looptolerance=1e-6,
+                            maxloopduration=.01)
+    
+    assert len(loose.get_loop(wave)) == 297
+    assert len(tight.get_loop(wave)) == 10697
+    assert short.get_loop(wave) is None
+    assert len(cache.loops) == 2
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Tests for the wavemaker module."""
+
+import numpy as np
+import pytest
+import wavemaker as wm
+
+#%% In place evaluation
+
+@pytest.mark.parametrize('waveform, args', [
+        ('sine', ()), ('sawtoothup', ()), ('sawtoothdown', ()), 
+        ('triangular', ()), ('square', ()), ('square', (.3,))])
+def test_in_place_evaluation_matches(waveform, args):
+    """Given out and work, basic waveforms are written into a strided 
+    float32 channel, with the same samples as when evaluated plainly."""
+    
+    wave = wm.Wave(waveform, 997.3, .7, *args)
+    time = np.arange(4096) / 44100
+    block = np.zeros((4096, 2), dtype=np.float32)
+    
+    result = wave.evaluate(time, out=block[:, 1], work=np.empty(4096))
+    assert np.shares_memory(result, block)
+    np.testing.assert_allclose(block[:, 1], wave.evaluate(time), atol=1e-7)
+    assert not block[:, 0].any()
+
+#%% Extra arguments
+
+def test_square_takes_duty_cycle():
+    """Extra arguments are unpacked, so a square's duty cycle is used."""
+    
+    time = np.arange(1000) / 100000
+    for wavetable in (False, True):
+        square = wm.Wave('square', 100, 1, .25, wavetable=wavetable)
+        assert np.mean(square.evaluate(time) > 0) == .25
+
+def test_custom_function_gets_parameters():
+    """A custom function gets each extra parameter on its own."""
+    
+    def line(time, freq, slope, offset):
+        return slope * time + offset
+    
+    wave = wm.Wave('custom', 1, 1, 2, 3, line)
+    np.testing.assert_array_equal(wave.evaluate(np.arange(3)), [3, 5, 7])
+
+#%% Fourier series
+
+def custom_amplitudes(order):
+    random = np.random.RandomState(0)
+    return random.uniform(-1, 1, order), random.uniform(-1, 1, order)
+
+def test_custom_fourier_paths_match():
+    """Summed sines and the inverse FFT period give the same series."""
+
+    amps = custom_amplitudes(32)
+    summed = wm.Fourier('custom', 110, 0, amps, ifft_order=None)
+    table = wm.Fourier('custom', 110, 0, amps, ifft_order=32)
+
+    time = np.arange(2000) / 44100
+    np.testing.assert_allclose(table.evaluate(time), summed.evaluate(time),
+                               atol=1e-3)
+
+def test_custom_fourier_matches_at_threshold():
+    """A series doesn't change when an empty partial moves it past
+    ifft_order."""
+
+    cosines, sines = custom_amplitudes(31)
+    below = wm.Fourier('custom', 110, 0, (cosines, sines), ifft_order=32)
+    above = wm.Fourier('custom', 110, 0,
+                       (np.append(cosines, 0), np.append(sines, 0)),
+                       ifft_order=32)
+
+    time = np.arange(2000) / 44100
+    np.testing.assert_allclose(above.evaluate(time), below.evaluate(time),
+                               atol=1e-3)
+
+def test_custom_fourier_amplitudes_are_cosines_then_sines():
+    """Custom amplitudes are (cosine terms, sine terms), each series 
+    normalized by its amplitudes' sum and weighted by half."""
+    
+    time = np.arange(200) / 10000
+    omega = 2 * np.pi * 50 * time
+    cosines = wm.Fourier('custom', 50, 0, ([1, 3], [0, 0]))
+    sines = wm.Fourier('custom', 50, 0, ([0], [1]))
+    
+    np.testing.assert_allclose(cosines.evaluate(time),
+                               (np.cos(omega) + 3 * np.cos(2 * omega)) / 8,
+                               atol=1e-12)
+    np.testing.assert_allclose(sines.evaluate(time), np.sin(omega) / 2,
+                               atol=1e-12)
+
+def test_fourier_reads_inverse_fft_period_from_32_partials():
+    """By default, series of 32 partials or more are read from a float32 
+    period, within 1e-3 of summed sines."""
+    
+    time = np.arange(2000) / 44100
+    below = wm.Fourier('square', 50, 31)
+    above = wm.Fourier('square', 50, 32)
+    summed = wm.Fourier('square', 50, 32, ifft_order=None)
+    
+    assert below.ifft_order == 32
+    assert below.evaluate(time).dtype == np.float64
+    assert above.evaluate(time).dtype == np.float32
+    np.testing.assert_allclose(above.evaluate(time), summed.evaluate(time),
+                               atol=1e-3)
+
+#%% Sample precision
+
+def test_tables_are_float32():
+    """Wavetables and tabulated periods are kept in float32, the precision
+    they are played with, while directly evaluated waves stay float64."""
+
+    time = np.arange(4410) / 44100
+    multisine = wm.Multisine(100, 5000, samples=2**12)
+
+    assert wm.SAMPLE_DTYPE == np.float32
+    assert wm.wavetable(wm.create_sine).dtype == np.float32
+    assert multisine.period_table().dtype == np.float32
+    assert wm.Fourier('square', 50, 64).period_table().dtype == np.float32
+
+    tabulated = wm.Wave('sine', 440, wavetable=True).evaluate(time)
+    direct = wm.Wave('sine', 440).evaluate(time)
+    assert tabulated.dtype == np.float32
+    assert direct.dtype == np.float64
+    np.testing.assert_allclose(tabulated, direct, atol=1e-4)
+
+#%% Band-limited waveforms
+
+def aliasing(wave, samplerate=44100):
+    """Returns energy off the harmonics of an integer frequency wave, 
+    relative to energy on them, in dB."""
+    
+    spectrum = np.abs(np.fft.rfft(wave.evaluate(
+            np.arange(samplerate) / samplerate)))**2
+    harmonics = np.zeros(len(spectrum), dtype=bool)
+    harmonics[wave.frequency::wave.frequency] = True
+    return 10 * np.log10(spectrum[~harmonics].sum() / 
+                         spectrum[harmonics].sum())
+
+@pytest.mark.parametrize('waveform', ['sawtoothup', 'square'])
+def test_band_limited_waveforms_alias_less(waveform):
+    """At 3.1 kHz, polyBLEP cuts aliased energy by more than 15 dB."""
+    
+    plain = aliasing(wm.Wave(waveform, 3100))
+    band_limited = aliasing(wm.Wave(waveform + '_bl', 3100))
+    assert band_limited < plain - 15
+
+def test_band_limited_waveforms_ignore_wavetable():
+    """polyBLEP is applied at the playback step even if a table is asked."""
+
+    time = np.arange(4410) / 44100
+    for waveform in ('sawtoothup_bl', 'triangular_bl', 'square_bl'):
+        direct = wm.Wave(waveform, 1234.5).evaluate(time)
+        tabulated = wm.Wave(waveform, 1234.5, wavetable=True).evaluate(time)
+        np.testing.assert_array_equal(tabulated, direct)
+
+#%% Operators
+
+def test_fm_reads_integral_over_modulator_period():
+    """A modulator repeating slower than its frequency (a sweep followed by
+    silence) still deviates the carrier by its own integral."""
+    
+    modulator = wm.Sweep(2, 8, duration=.5, silence=.25)
+    time = np.arange(int(round(modulator.period * 44100))) / 44100
+    
+    values = np.asarray(modulator.evaluate(time), dtype=float)
+    values -= values.mean()
+    integral = np.concatenate(([0], np.cumsum(values[:-1] + values[1:]))) 
+    integral /= 2 * 44100
+    expected = np.sin(2 * np.pi * (1000 * time + 50 * integral))
+    
+    modulated = wm.Wave('sine', 1000).fm(modulator, 50)
+    np.testing.assert_allclose(modulated.evaluate(time), expected, atol=.02)
+
+def test_operators_reject_arrays():
+    """Only waves and numbers combine with waves."""
+    
+    wave = wm.Wave('sine', 100)
+    for operand in (np.ones(3), 'sine', [1, 2]):
+        for operation in (lambda: wave + operand, lambda: operand + wave,
+                          lambda: wave - operand, lambda: wave * operand,
+                          lambda: operand * wave, lambda: wave / operand):
+            with pytest.raises(TypeError):
+                operation()
+    assert isinstance(wave + np.float32(1), wm.Offset)
+    assert isinstance(2 * wave, wm.Gain)
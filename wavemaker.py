@@ -5,12 +5,28 @@ It includes:
 Defined functions for several waveforms incorporating a switcher to make choosing easier.
 A class for evaluating the multiple waveforms
 A class for calculating fourier partial sums and evaluating it.
+A class for exponential sine sweeps, used to measure transfer functions.
+A class for low crest factor multisines, used to measure transfer functions.
+A class for maximum length sequences, used to measure impulse responses.
+A class for gated tone bursts.
+A class for playing WAV or raw float32 files through a memory map.
+Classes for lazy expressions combining waves: sums, products, gain, offset,
+delay, AM and FM.
+
+Every class has an evaluate(time) method, and frequency and period
+attributes used by pyaudiowave to stream them.
 """
 
 import numpy as np
-from scipy.signal import sawtooth, square
+import os, struct
+from fractions import Fraction
+from functools import reduce
+from math import gcd
+from scipy.signal import max_len_seq, sawtooth, square
+
+SUM_BLOCK_ELEMENTS = 2**18
     
-def create_sine(time, freq, *args):
+def create_sine(time, freq, *args, out=None, work=None):
     """ Creates sine wave 
     
     Parameters
@@ -23,6 +39,11 @@ def create_sine(time, freq, *args):
     
     args : dummy 
         used to give compatibility with other functions
+        
+    out, work : arrays (optional)
+        if both are given, the wave is written into out, using work (a 
+        float64 array shaped like time) as scratch space, and nothing is
+        allocated
     
     Returns
     -------
@@ -30,10 +51,27 @@ def create_sine(time, freq, *args):
     Evaluated sine wave of given frequency
     """
     
+    if out is not None and work is not None:
+        np.multiply(time, 2 * np.pi * freq, out=work)
+        np.sin(work, out=work)
+        np.copyto(out, work)
+        return out
+    
     wave =np.sin(2 * np.pi * time * freq)
     return wave        
     
-def create_ramps(time, freq, type_of_ramp=1):
+def wrapped_phase(time, freq, work):
+    """ Writes time*freq, wrapped into [0, 1), into work and returns it.
+    
+    Used by the waveforms evaluated in place. They work on float64 and 
+    only cast into out at the end, since ufuncs casting into a strided out
+    (i.e. one channel of an interleaved block) allocate a buffer.
+    """
+    
+    np.multiply(time, freq, out=work)
+    return np.mod(work, 1, out=work)
+    
+def create_ramps(time, freq, type_of_ramp=1, out=None, work=None):
     """ Creates ascending and descending sawtooth wave,
     or a tringle wave, depending on the value of type_of_ramp,
     using the function 'sawtooth' from scypy signal module.
@@ -48,10 +86,15 @@ def create_ramps(time, freq, type_of_ramp=1):
     freq : int or float
         expected frequency of created wave
     
-    type_of_ramp : {0, 1, 2}
-        0 returns a sawtooth waveform with positive slope
-        1 returns a sawtooth waveform with negative slope
-        0 returns a triangle waveform
+    type_of_ramp : {0, 1, .5}
+        1 returns a sawtooth waveform with positive slope
+        0 returns a sawtooth waveform with negative slope
+        .5 returns a triangle waveform
+        
+    out, work : arrays (optional)
+        if both are given, the wave is written into out, using work (a 
+        float64 array shaped like time) as scratch space, and nothing is
+        allocated
     
     Returns
     -------
@@ -59,10 +102,24 @@ def create_ramps(time, freq, type_of_ramp=1):
     Evaluated sawtooth or triangle wave of given frequency
     """
     
+    if out is not None and work is not None and type_of_ramp in (0, .5, 1):
+        phase = wrapped_phase(time, freq, work)
+        if type_of_ramp == .5:
+            phase -= .5
+            np.abs(phase, out=phase)
+            phase *= -4
+            phase += 1
+        else:
+            slope = 4 * type_of_ramp - 2
+            phase *= slope
+            phase -= slope / 2
+        np.copyto(out, phase)
+        return out
+    
     wave = sawtooth(2 * np.pi * time * freq, type_of_ramp)
     return wave
     
-def create_sawtooth_up(time, freq, *args):
+def create_sawtooth_up(time, freq, *args, out=None, work=None):
     """ Creates sawtooth waveform with positive slope
    
     Parameters
@@ -82,10 +139,10 @@ def create_sawtooth_up(time, freq, *args):
     Evaluated sawtooth waveform with positive slope  and given frequency
     """
     
-    wave = create_ramps(time ,freq, 1)
+    wave = create_ramps(time ,freq, 1, out, work)
     return wave        
 
-def create_sawtooth_down(time, freq, *args):
+def create_sawtooth_down(time, freq, *args, out=None, work=None):
     """ Creates sawtooth waveform with negative slope
    
     Parameters
@@ -105,10 +162,10 @@ def create_sawtooth_down(time, freq, *args):
     Evaluated sawtooth waveform with negative slope and given frequency
     """
 
-    wave = create_ramps(time, freq, 0)
+    wave = create_ramps(time, freq, 0, out, work)
     return wave        
 
-def create_triangular(time, freq, *args):
+def create_triangular(time, freq, *args, out=None, work=None):
     """ Creates a triangular wave with symmetric ramps
    
     Parameters
@@ -129,10 +186,10 @@ def create_triangular(time, freq, *args):
     """
     
 
-    wave = create_ramps(time, freq, .5)
+    wave = create_ramps(time, freq, .5, out, work)
     return wave        
      
-def create_square(time, freq, dutycycle = .5, *args):
+def create_square(time, freq, dutycycle = .5, *args, out=None, work=None):
     """ Creates a square wave. Uses square function from
     scypy signal module
 
@@ -151,14 +208,28 @@ def create_square(time, freq, dutycycle = .5, *args):
         
     args : dummy 
         used to give compatibility with other functions
+        
+    out, work : arrays (optional)
+        if both are given and dutycycle is a scalar, the wave is written 
+        into out, using work (a float64 array shaped like time) as scratch
+        space, and nothing is allocated
 
     Returns
     -------
     
     Evaluated square waveform with given frequency
     """
-    #dutycycle not implemented due to bug
-    wave = square(2 * np.pi * time * freq)
+    
+    if out is not None and work is not None and np.isscalar(dutycycle):
+        phase = wrapped_phase(time, freq, work)
+        phase -= dutycycle
+        #-1 from dutycycle on (copysign gives 1 for 0), 1 before it
+        np.copysign(1, phase, out=phase)
+        np.negative(phase, out=phase)
+        np.copyto(out, phase)
+        return out
+    
+    wave = square(2 * np.pi * time * freq, dutycycle)
     return wave
     
 def create_custom(time, freq, *args):
@@ -189,13 +260,101 @@ def create_custom(time, freq, *args):
     wave = custom_func(time, freq, *params)
     return wave
 
-def create_sum(time, freq, amp, *args):
+def sum_sines_uniform(start, step, length, omega, amp):
+    """ Evaluates a weighted sum of sines on a uniformly spaced time grid.
+    
+    The grid is split into blocks of equal length. Since
+    sin(w*(t0 + tau)) = sin(w*t0)*cos(w*tau) + cos(w*t0)*sin(w*tau),
+    the whole sum becomes two matrix products between per-block and 
+    per-offset terms, and only (blocks + offsets) * partials sines and 
+    cosines have to be computed instead of samples * partials.
+    
+    Parameters
+    ----------
+    start : float
+        first time value
+    step : float
+        time step between samples
+    length : int
+        number of samples
+    omega : array
+        angular frequencies of the partials
+    amp : array
+        amplitudes of the partials
+        
+    Returns
+    -------
+    
+    Unnormalized sum, evaluated on the grid
+    """
+    
+    rows_limit = max(1, SUM_BLOCK_ELEMENTS // len(omega))
+    rows = max(1, min(int(np.sqrt(length)), rows_limit))
+    blocks = -(-length // rows)
+    
+    offset_phases = np.outer(np.arange(rows) * step, omega)
+    cos_offset = np.cos(offset_phases).T
+    sin_offset = np.sin(offset_phases, out=offset_phases).T
+    
+    wave = np.empty((blocks, rows))
+    block_starts = start + np.arange(blocks) * rows * step
+    for first in range(0, blocks, rows_limit):
+        block_phases = np.outer(block_starts[first:first + rows_limit], omega)
+        sin_start = np.sin(block_phases) * amp
+        cos_start = np.cos(block_phases, out=block_phases)
+        cos_start *= amp
+        chunk = wave[first:first + rows_limit]
+        np.dot(sin_start, cos_offset, out=chunk)
+        chunk += cos_start.dot(sin_offset)
+        
+    return wave.ravel()[:length]
+
+def sum_sines_blocks(time, omega, amp, phase=0):
+    """ Evaluates a weighted sum of sines on an arbitrary time vector.
+    
+    Time is processed in blocks, each one evaluated as a matrix product
+    between sin(outer(time_block, omega)) and amp, so memory stays bounded
+    by SUM_BLOCK_ELEMENTS.
+    
+    Parameters
+    ----------
+    time : 1D array
+        time vector in which to evaluate the funcion
+    omega : array
+        angular frequencies of the partials
+    amp : array
+        amplitudes of the partials
+    phase : float (optional)
+        phase added to every partial, i.e. pi/2 gives cosines. Default: 0
+        
+    Returns
+    -------
+    
+    Unnormalized sum, evaluated on time
+    """
+    
+    wave = np.empty(time.shape)
+    rows = max(1, SUM_BLOCK_ELEMENTS // len(omega))
+    for first in range(0, len(time), rows):
+        phases = np.outer(time[first:first + rows], omega)
+        if phase:
+            phases += phase
+        np.sin(phases, out=phases)
+        np.dot(phases, amp, out=wave[first:first + rows])
+    return wave
+
+def create_sum(time, freq, amp=(), *args):
     """ Creates an arbitraty sum of sine waves.
 
     It uses the frequencies in freq and either uniform
     amplitude if amp is None, or the given amplitudes if
     amp is array-like. Output comes out normalized.
     
+    All partials are evaluated at once. Uniformly spaced time vectors 
+    (the usual case) go through sum_sines_uniform; any other time vector
+    goes through sum_sines_blocks. Both work in blocks along the time 
+    axis, so memory stays bounded for any number of partials.
+    
     Parameters
     ----------
     time : array
@@ -224,18 +383,241 @@ def create_sum(time, freq, amp, *args):
     if len(freq) != len(amp):
         raise ValueError('Amplitud and frequency arrays should e the same leght!')
     
+    amp = np.asarray(amp, dtype=float)
+    omega = 2 * np.pi * np.asarray(freq, dtype=float)
+    
     #to be able to handle time vectors and scalars
-    if hasattr(time, '__len__'):
-        time= np.array(time)
-        wave = np.zeros(time.shape)
-    else:
-        wave = 0
+    time = np.asarray(time, dtype=float)
+    flat_time = time.ravel()
+    length = len(flat_time)
+    
+    uniform = False
+    if length > 2:
+        step = (flat_time[-1] - flat_time[0]) / (length - 1)
+        grid = flat_time[0] + step * np.arange(length)
+        uniform = np.abs(grid - flat_time).max() <= 1e-6 * abs(step)
         
-    for f, a in zip(freq, amp):
-        wave += create_sine(time, f) * a
+    if uniform:
+        wave = sum_sines_uniform(flat_time[0], step, length, omega, amp)
+    else:
+        wave = sum_sines_blocks(flat_time, omega, amp)
     #Normalize it:
-    wave /= sum(amp) 
+    wave /= amp.sum()
+
+    if time.ndim == 0:
+        return wave[0]
+    return wave.reshape(time.shape)
+      
+def phase_step(time, freq):
+    """ Returns the phase increment between consecutive samples, in periods.
+    
+    Time vector is assumed to be uniformly sampled. For scalars, returns 0.
+    
+    Parameters
+    ----------
+    time : array
+        time vector in which the funcion will be evaluated
+    
+    freq : int or float
+        expected frequency of the wave
+        
+    Returns
+    -------
+    
+    Phase increment per sample
+    """
+    
+    time = np.asarray(time)
+    if time.size < 2:
+        return 0
+    step = (time.flat[-1] - time.flat[0]) / (time.size - 1)
+    return abs(step * freq)
+
+def polyblep(phase, dt):
+    """ Polynomial band-limited step residual.
+    
+    Should be subtracted from a naive waveform that jumps down by 2 at
+    phase 0 (or added for a jump up) to smooth the jump over two samples.
+    
+    Parameters
+    ----------
+    phase : array
+        phase of the waveform, in periods, wrapped into [0, 1)
+    
+    dt : float
+        phase increment per sample
+        
+    Returns
+    -------
+    
+    Residual, non zero only within dt of the jump
+    """
+    
+    residual = np.zeros(np.shape(phase))
+    if dt <= 0:
+        return residual
+    
+    after = phase < dt
+    x = phase[after] / dt
+    residual[after] = 2*x - x*x - 1
+    
+    before = phase > 1 - dt
+    x = (phase[before] - 1) / dt
+    residual[before] = x*x + 2*x + 1
+    
+    return residual
+
+def polyblamp(phase, dt):
+    """ Polynomial band-limited ramp residual.
+    
+    Should be multiplied by the slope change per sample and added to a 
+    naive waveform that has a corner at phase 0.
+    
+    Parameters
+    ----------
+    phase : array
+        phase of the waveform, in periods, wrapped into [0, 1)
+    
+    dt : float
+        phase increment per sample
+        
+    Returns
+    -------
+    
+    Residual, non zero only within dt of the corner
+    """
+    
+    residual = np.zeros(np.shape(phase))
+    if dt <= 0:
+        return residual
+    
+    after = phase < dt
+    x = phase[after] / dt - 1
+    residual[after] = -x**3 / 3
+    
+    before = phase > 1 - dt
+    x = (phase[before] - 1) / dt + 1
+    residual[before] = x**3 / 3
+    
+    return residual
+
+def create_sawtooth_up_bl(time, freq, *args):
+    """ Creates band-limited sawtooth waveform with positive slope
+    
+    Naive sawtooth corrected with polyBLEP at its jumps, so it doesn't
+    alias. Time vector should be uniformly sampled.
+   
+    Parameters
+    ----------
+    time : array
+        time vector in which to evaluate the funcion
+    
+    freq : int or float
+        expected frequency of sawtooth wave
+
+    args : dummy 
+        used to give compatibility with other functions
+
+    Returns
+    -------
+    
+    Evaluated sawtooth waveform with positive slope  and given frequency
+    """
+    
+    phase = np.mod(np.asarray(time) * freq, 1)
+    wave = 2 * phase - 1
+    wave -= polyblep(phase, phase_step(time, freq))
+    return wave
+
+def create_sawtooth_down_bl(time, freq, *args):
+    """ Creates band-limited sawtooth waveform with negative slope
+    
+    Naive sawtooth corrected with polyBLEP at its jumps, so it doesn't
+    alias. Time vector should be uniformly sampled.
+   
+    Parameters
+    ----------
+    time : array
+        time vector in which to evaluate the funcion
+    
+    freq : int or float
+        expected frequency of sawtooth wave
+
+    args : dummy 
+        used to give compatibility with other functions
+
+    Returns
+    -------
+    
+    Evaluated sawtooth waveform with negative slope and given frequency
+    """
+    
+    return -create_sawtooth_up_bl(time, freq)
+
+def create_triangular_bl(time, freq, *args):
+    """ Creates band-limited triangular wave with symmetric ramps
+    
+    Naive triangle corrected with polyBLAMP at its corners, so it doesn't
+    alias. Time vector should be uniformly sampled.
+   
+    Parameters
+    ----------
+    time : array
+        time vector in which to evaluate the funcion
+    
+    freq : int or float
+        expected frequency of triangular wave
+        
+    args : dummy 
+        used to give compatibility with other functions
+
+    Returns
+    -------
+    
+    Evaluated triangular waveform with given frequency
+    """
+    
+    phase = np.mod(np.asarray(time) * freq, 1)
+    dt = phase_step(time, freq)
+    
+    wave = 1 - 4 * np.abs(phase - .5)
+    #Slope goes from -4 to 4 at phase 0, and back at phase .5
+    wave += 8 * dt * polyblamp(phase, dt)
+    wave -= 8 * dt * polyblamp(np.mod(phase - .5, 1), dt)
+    return wave
+
+def create_square_bl(time, freq, dutycycle=.5, *args):
+    """ Creates band-limited square wave
+    
+    Naive square corrected with polyBLEP at its jumps, so it doesn't
+    alias. Time vector should be uniformly sampled.
+
+    Parameters
+    ----------
+    time : array
+        time vector in which to evaluate the funcion
+    
+    freq : int or float
+        expected frequency of square wave
+        
+    dutycycle=.5 : scalar
+        Duty cycle. Default is 0.5 (50% duty cycle).
+        
+    args : dummy 
+        used to give compatibility with other functions
 
+    Returns
+    -------
+    
+    Evaluated square waveform with given frequency
+    """
+    
+    phase = np.mod(np.asarray(time) * freq, 1)
+    dt = phase_step(time, freq)
+    
+    wave = np.where(phase < dutycycle, 1., -1.)
+    wave += polyblep(phase, dt)
+    wave -= polyblep(np.mod(phase - dutycycle, 1), dt)
     return wave
       
 def given_waveform(input_waveform):
@@ -263,62 +645,316 @@ def given_waveform(input_waveform):
         'triangular': create_triangular,
         'square': create_square,
         'custom': create_custom,
-        'sum': create_sum
+        'sum': create_sum,
+        'sawtoothup_bl': create_sawtooth_up_bl,
+        'sawtoothdown_bl': create_sawtooth_down_bl,
+        'ramp_bl': create_sawtooth_up_bl, #redirects to sawtoothup_bl
+        'sawtooth_bl': create_sawtooth_up_bl, #redirects to sawtoothup_bl
+        'triangular_bl': create_triangular_bl,
+        'square_bl': create_square_bl
     }
 
     func = switcher.get(input_waveform, wrong_input_build(list(switcher.keys())))
     return func
 
+#Band-limited waveforms depend on the sampling step, so they can't be tabulated
+BAND_LIMITED_WAVEFORMS = {create_sawtooth_up_bl, create_sawtooth_down_bl,
+                          create_triangular_bl, create_square_bl}
+
+#Waveforms that can be evaluated in place, given out and work arrays
+IN_PLACE_WAVEFORMS = {create_sine, create_sawtooth_up, create_sawtooth_down,
+                      create_triangular, create_square}
+
 def wrong_input_build(input_list):
     def wrong_input(*args):
         msg = 'Given waveform is invalid. Choose from following list:{}'.format(input_list)
         raise ValueError(msg)
     return wrong_input
 
-#%% Clase que genera ondas
-
-class Wave:
-    '''Generates an object with a single method: evaluate(time).
-  
-    Attributes
+def freeze(item):
+    """ Turns arrays and lists, even nested ones, into tuples.
+    
+    Parameters
     ----------
-    waveform : str {'sine', 'sawtoothup', 'sawtoothdown', 'ramp', 'triangular', 'square', 'custom'} optional
-        waveform type. If 'custom', function should acept inputs
-        (time, frequency, *args). Default = 'sine'
-    frequency : float (optional)
-        wave frequency
-    amplitude : float (optional)
-        wave amplitud
+    item : any
+        object to be frozen
         
-    Methods
-    ----------
-    evaluate(time)
-        returns evaluated function type
+    Returns
+    -------
+    
+    Equivalent hashable object, if item only holds hashable elements
+    """
+    
+    if isinstance(item, np.ndarray):
+        return (item.shape, tuple(item.ravel().tolist()))
+    if isinstance(item, (list, tuple)):
+        return tuple(freeze(i) for i in item)
+    return item
 
-    '''
+def make_spec(*items):
+    """ Builds a hashable specification of a wave out of its parameters.
     
-    def __init__(self, waveform='sine', frequency=400, amplitude=1, *args):
-        ''' See class atributes.
+    Two waves with equal specification evaluate to the same signal, so it
+    can be used as a cache key.
+    
+    Parameters
+    ----------
+    items : tuple
+        whatever defines the wave: its class, function, frequency, etc.
         
-        If wave is 'custom', the custom function should be passed to *args.
-        '''
+    Returns
+    -------
+    
+    Hashable tuple, or None if some item can't be hashed
+    """
+    
+    spec = freeze(items)
+    try:
+        hash(spec)
+    except TypeError:
+        return None
+    return spec
+
+#%% Wavetables shared by all Wave instances
+
+WAVETABLE_SIZE = 4096
+SAMPLE_DTYPE = np.float32 #Tables are kept with the precision they are played
+_wavetables = {}
+
+def wavetable(waveform_func, size=WAVETABLE_SIZE, *args):
+    """ Returns one high-resolution period of the given waveform.
+    
+    Tables are cached by (waveform_func, size, args), so every Wave using
+    the same function and extra arguments shares the same array. If args
+    can't be hashed (i.e. they contain arrays) the table is built but not
+    cached.
+    
+    Parameters
+    ----------
+    waveform_func : function
+        waveform function, as returned by given_waveform
+    size : int (optional)
+        number of samples in one period. Default: WAVETABLE_SIZE
+    args : tuple (optional)
+        extra arguments to be passed to waveform_func
         
-        self._frequency = frequency
-        self.amplitude = amplitude
-        self.waveform = given_waveform(waveform)
-        self.extra_args = args
+    Returns
+    -------
+    
+    Float32 array of length size+1 holding one period evaluated at phases 
+    n/size. Last element repeats the first one to close the loop.
+    """
+    
+    key = (waveform_func, size, args)
+    try:
+        table = _wavetables.get(key)
+        cacheable = True
+    except TypeError:
+        table = None
+        cacheable = False
+    
+    if table is None:
+        phase = np.arange(size + 1) / size
+        table = np.asarray(waveform_func(phase, 1, *args), dtype=SAMPLE_DTYPE)
+        table[-1] = table[0]
+        if cacheable:
+            _wavetables[key] = table
         
-    @property
-    def frequency(self):
-        '''Frequency getter: returns frequency of wave. 
+    return table
+
+def read_wavetable(table, time, freq, out=None):
+    """ Evaluates a wavetable at given times using linear interpolation.
+    
+    Phase is computed and wrapped in float64, so precision doesn't depend
+    on how big time is, while samples keep the table's dtype.
+    
+    Parameters
+    ----------
+    table : array
+        one period as returned by wavetable
+    time : array
+        time vector in which to evaluate the funcion
+    freq : int or float
+        expected frequency of the wave
+    out : array (optional)
+        array of table's dtype to write into
         
-        If frequency is an iterable, as it be in a sum or a 
-        custom function, returns first value. Used to have 
-        backwards compatibility wen sum and custom were added.'''
+    Returns
+    -------
+    
+    Evaluated wave of given frequency
+    """
+    
+    size = len(table) - 1
+    position = np.array(time, dtype=float)
+    position *= freq
+    np.mod(position, 1, out=position)
+    position *= size
+    index = np.minimum(position.astype(np.intp), size - 1)
+    position -= index #now holds the interpolation fraction
+    
+    wave = table.take(index, out=out)
+    step = table.take(index + 1)
+    step -= wave
+    step *= position
+    wave += step
+    return wave
+
+#%% Operators shared by all waves
+
+def write_out(wave, out):
+    """ Writes an evaluated wave into out, if given.
+    
+    Parameters
+    ----------
+    wave : array
+        evaluated wave
+    out : array or None
+        array to write into
         
-        if isinstance(self._frequency, (list, tuple, np.ndarray)):
-            return self._frequency[0]
-        else:
+    Returns
+    -------
+    
+    out if given, else wave
+    """
+    
+    if out is None:
+        return wave
+    out[...] = wave
+    return out
+
+def is_number(value):
+    """Returns True if value is a real number, Python's or numpy's."""
+    
+    return isinstance(value, (int, float, np.integer, np.floating))
+
+class WaveOperators:
+    '''Lets waves combine into lazy expressions (see Expression).
+    
+    Waves can be added, subtracted and multiplied among themselves, or 
+    with numbers (giving a DC offset or a gain). Nothing is evaluated 
+    until the resulting expression is. Any other operand, such as an 
+    array of samples, raises TypeError.
+    
+    Methods
+    ----------
+    shift(delay)
+        returns the wave delayed by delay seconds
+    am(modulator, depth=1)
+        returns the wave amplitude-modulated by modulator
+    fm(modulator, deviation)
+        returns the wave frequency-modulated by modulator
+    '''
+    
+    #Makes numpy arrays hand their operators over to these, to be rejected
+    __array_ufunc__ = None
+    
+    def __add__(self, other):
+        if is_number(other):
+            return Offset(self, other)
+        if not isinstance(other, WaveOperators):
+            return NotImplemented
+        return Sum(self, other)
+    
+    __radd__ = __add__
+    
+    def __sub__(self, other):
+        return self + (-other)
+    
+    def __rsub__(self, other):
+        return (-self) + other
+    
+    def __mul__(self, other):
+        if is_number(other):
+            return Gain(self, other)
+        if not isinstance(other, WaveOperators):
+            return NotImplemented
+        return Product(self, other)
+    
+    __rmul__ = __mul__
+    
+    def __truediv__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return Gain(self, 1 / other)
+    
+    def __neg__(self):
+        return Gain(self, -1)
+    
+    def shift(self, delay):
+        '''Returns this wave delayed by delay seconds.'''
+        
+        return Shift(self, delay)
+    
+    def am(self, modulator, depth=1):
+        '''Returns this wave multiplied by 1 + depth * modulator.'''
+        
+        return AM(self, modulator, depth)
+    
+    def fm(self, modulator, deviation):
+        '''Returns this wave with its frequency deviated by deviation
+        times modulator, in Hz.'''
+        
+        return FM(self, modulator, deviation)
+
+#%% Clase que genera ondas
+
+class Wave(WaveOperators):
+    '''Generates an object with a single method: evaluate(time).
+  
+    Attributes
+    ----------
+    waveform : str {'sine', 'sawtoothup', 'sawtoothdown', 'ramp', 'triangular', 'square', 'custom', 'sum'} optional
+        waveform type. If 'custom', function should acept inputs
+        (time, frequency, *args). Adding '_bl' to 'sawtoothup', 
+        'sawtoothdown', 'ramp', 'triangular' or 'square' gives its 
+        band-limited (polyBLEP) version. Default = 'sine'
+    frequency : float (optional)
+        wave frequency
+    amplitude : float (optional)
+        wave amplitud
+    wavetable : bool (optional)
+        if True, evaluate reads a shared precomputed period with linear
+        interpolation instead of calling the waveform function. Not
+        available for 'sum'. Ignored by band-limited ('_bl') waveforms,
+        whose correction depends on the playback sampling step rather 
+        than the table's. Default = False
+        
+    Methods
+    ----------
+    evaluate(time)
+        returns evaluated function type
+
+    '''
+    
+    def __init__(self, waveform='sine', frequency=400, amplitude=1, *args,
+                 wavetable=False):
+        ''' See class atributes.
+        
+        If wave is 'custom', the custom function should be passed to *args.
+        If wave is 'square', duty cycle may be passed to *args.
+        '''
+        
+        if wavetable and waveform == 'sum':
+            raise ValueError("Wavetable backend can't be used for 'sum' waves.")
+        
+        self._frequency = frequency
+        self.amplitude = amplitude
+        self.waveform = given_waveform(waveform)
+        self.extra_args = args
+        self.wavetable = wavetable
+        
+    @property
+    def frequency(self):
+        '''Frequency getter: returns frequency of wave. 
+        
+        If frequency is an iterable, as it be in a sum or a 
+        custom function, returns first value. Used to have 
+        backwards compatibility wen sum and custom were added.'''
+        
+        if isinstance(self._frequency, (list, tuple, np.ndarray)):
+            return self._frequency[0]
+        else:
             return self._frequency
         
     @frequency.setter
@@ -326,7 +962,20 @@ class Wave:
         '''Frequency setter: sets value as self._frequency.'''
         self._frequency = value    
         
-    def evaluate(self, time, *args):
+    @property
+    def period(self):
+        '''Period getter: returns the time after which the wave repeats itself.'''
+        
+        return 1 / self.frequency
+        
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        return make_spec('Wave', self.waveform, self._frequency, 
+                         self.amplitude, self.extra_args, self.wavetable)
+        
+    def evaluate(self, time, *args, out=None, work=None):
         """Takes in an array-like object to evaluate the funcion in.
         
         Parameters
@@ -335,6 +984,13 @@ class Wave:
             time vector in which to evaluate the funcion
         args : tuple (optional)
             extra arguments to be passed to evaluated function
+        out : array (optional)
+            array to write into
+        work : array (optional)
+            float64 array shaped like time, used as scratch space. If given
+            along with out, basic waveforms ('sine', 'sawtoothup', 
+            'sawtoothdown', 'triangular' and scalar duty 'square') are 
+            evaluated in place, allocating nothing.
             
         Returns
         -------
@@ -345,9 +1001,24 @@ class Wave:
         if isinstance(self.amplitude, (list, tuple, np.ndarray)):
             #for sums 
             wave = self.waveform(time, self._frequency, self.amplitude)
+            return write_out(wave, out)
+        elif self.wavetable and self.waveform not in BAND_LIMITED_WAVEFORMS:
+            table = wavetable(self.waveform, WAVETABLE_SIZE, *args, *self.extra_args)
+            if out is None or out.dtype != table.dtype:
+                wave = read_wavetable(table, time, self._frequency)
+            else:
+                wave = read_wavetable(table, time, self._frequency, out=out)
+        elif out is not None and work is not None and self.waveform in IN_PLACE_WAVEFORMS:
+            wave = self.waveform(time, self._frequency, *args, *self.extra_args,
+                                 out=out, work=work)
         else:
-            wave = self.waveform(time, self._frequency, *args, self.extra_args) * self.amplitude
-        return wave
+            wave = self.waveform(time, self._frequency, *args, *self.extra_args)
+        
+        if out is None:
+            return wave * self.amplitude
+        if wave is out and self.amplitude == 1:
+            return out
+        return np.multiply(wave, self.amplitude, out=out)
 
 
 #%% Fourier series classfor wave generator
@@ -473,7 +1144,50 @@ def custom_series(order, freq, amp, *args):
     freqs = np.arange(1, order+1) * freq
     return amps, freqs
     
-class Fourier:
+FOURIER_PERIOD_SIZE = 4096
+_fourier_periods = {}
+
+def fourier_period(amps, freqs, samples, sine=True):
+    """ Builds one exact period of a Fourier partial sum with an inverse FFT.
+    
+    Partial frequencies must be integer multiples of freqs[0]. The output
+    is normalized by the sum of amplitudes, just like create_sum, unless
+    they add up to zero.
+    
+    Parameters
+    ----------
+    amps : array-like
+        amplitudes of the partials
+    freqs : array-like
+        frequencies of the partials
+    samples : int
+        number of samples in the period. Should be bigger than twice the
+        highest harmonic number.
+    sine : bool (optional)
+        if True, partials are sine terms; if False, cosine terms. 
+        Default: True.
+   
+    Returns
+    -------
+    array
+        Partial sum evaluated at n/samples periods, for n in range(samples)
+    """
+    
+    amps = np.asarray(amps, dtype=float)
+    harmonics = np.rint(np.asarray(freqs) / freqs[0]).astype(int)
+    
+    spectrum = np.zeros(samples//2 + 1, dtype=complex)
+    if sine:
+        np.add.at(spectrum, harmonics, -.5j * samples * amps)
+    else:
+        np.add.at(spectrum, harmonics, .5 * samples * amps)
+        
+    period = np.fft.irfft(spectrum, samples)
+    if amps.sum() != 0:
+        period /= amps.sum()
+    return period
+
+class Fourier(WaveOperators):
     '''Generates an object with a single method: evaluate(time).
   
     Attributes
@@ -485,6 +1199,10 @@ class Fourier:
         series up to given order.
     custom : bool
         desides wether user has requested custom series or not
+    ifft_order : int or None
+        number of partials from which evaluate reads one period built with
+        an inverse FFT instead of summing sines. If None, sines are always
+        summed.
         
     Methods
     ----------
@@ -492,7 +1210,8 @@ class Fourier:
         returns evaluated fourier partial sum
 
     '''
-    def __init__(self, waveform='square', frequency=400, order=5, *args):
+    def __init__(self, waveform='square', frequency=400, order=5, *args,
+                 ifft_order=32):
         """Initializes class instance. 
                
         Parameters
@@ -508,7 +1227,12 @@ class Fourier:
             if waveform is 'custom', a tuple of length 2, each element 
             containing the amplitudes of the cosine and sine terms, 
             respectively. Order will be ignored and will be assumed to be
-            equal to len(amplitudes[0]).
+            equal to len(amplitudes[0]). Each series is normalized by the
+            sum of its amplitudes, and the wave is half of each.
+        ifft_order : int or None (optional)
+            number of partials from which the series is synthesized as one
+            period with an inverse FFT, which is then read as a wavetable.
+            If None, sines are always summed. Default: 32
             
         Returns
         -------
@@ -518,17 +1242,52 @@ class Fourier:
         
         self.waveform_maker = fourier_switcher(waveform)
         self._order = order #doesn't call setup_props becaouse there's no frequency defined yet
-        self.setup_props(frequency)
         self.extra_args = args
+        self.ifft_order = ifft_order
+        self.setup_props(frequency)
         
         self.custom = waveform=='custom'
     
     
     def setup_props(self, freq):
-        '''Sets up frequencyes, amplitudes and wave attributes for given freq.'''
+        '''Sets up frequencyes, amplitudes and wave attributes for given freq.
+        Drops the inverse FFT period, which is rebuilt on next evaluation.'''
         
-        self.amplitudes, self._frequencies =  self.waveform_maker(self.order, freq)
+        self.amplitudes, self._frequencies =  self.waveform_maker(self.order, freq, *self.extra_args)
         self.wave = Wave('sum', self._frequencies, self.amplitudes)
+        self._period = None
+        
+    def period_table(self):
+        '''Returns one period of the partial sum, built with an inverse FFT,
+        as a wavetable. Periods are cached by (waveform, order, samples per 
+        period) and shared among instances.'''
+        
+        if self._period is not None:
+            return self._period
+        
+        highest = int(round(self._frequencies[-1] / self._frequencies[0]))
+        samples = max(FOURIER_PERIOD_SIZE, 
+                      2**int(np.ceil(np.log2(16 * highest))))
+        
+        key = (self.waveform_maker, self.order, samples)
+        if self.custom:
+            key += tuple(tuple(a) for a in self.amplitudes)
+            
+        table = _fourier_periods.get(key)
+        if table is None:
+            if self.custom:
+                table = (fourier_period(self.amplitudes[0], self._frequencies, 
+                                        samples, sine=False) +
+                         fourier_period(self.amplitudes[1], self._frequencies, 
+                                        samples)) * .5
+            else:
+                table = fourier_period(self.amplitudes, self._frequencies, 
+                                       samples)
+            table = np.append(table, table[0]).astype(SAMPLE_DTYPE)
+            _fourier_periods[key] = table
+            
+        self._period = table
+        return table
 
         
     @property
@@ -544,6 +1303,19 @@ class Fourier:
         
         self.setup_props(value)
         
+    @property
+    def period(self):
+        '''Period getter: returns the time after which the wave repeats itself.'''
+        
+        return 1 / self.frequency
+        
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        return make_spec('Fourier', self.waveform_maker, self.order, 
+                         self.frequency, self.extra_args, self.ifft_order)
+        
     @property
     def order(self):
         '''Order getter: returns order of the last nonzero term in partial sum.'''
@@ -558,13 +1330,15 @@ class Fourier:
         self._order = value
         self.setup_props(self.frequency)
         
-    def evaluate(self, time):
+    def evaluate(self, time, out=None):
         """Takes in an array-like object to evaluate the funcion in.
         
         Parameters
         ----------
         time : array
             time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
             
         Returns
         -------
@@ -572,18 +1346,1092 @@ class Fourier:
         Evaluated waveform 
         """          
         
+        if self.ifft_order is not None and len(self._frequencies) >= self.ifft_order:
+            table = self.period_table()
+            if out is None or out.dtype != table.dtype:
+                return write_out(read_wavetable(table, time, self.frequency), out)
+            return read_wavetable(table, time, self.frequency, out=out)
+        
         if self.custom:
-            #missing support for custom phases
+            #Same series as period_table: half the normalized cosine 
+            #series plus half the normalized sine series
+            time = np.asarray(time, dtype=float)
+            omega = 2 * np.pi * np.asarray(self._frequencies, dtype=float)
+            wave = np.zeros(time.size)
+            for amps, phase in zip(self.amplitudes, (np.pi * .5, 0)):
+                amps = np.asarray(amps, dtype=float)
+                series = sum_sines_blocks(time.ravel(), omega, amps, phase)
+                if amps.sum() != 0:
+                    series /= amps.sum()
+                wave += series * .5
+            
+            return write_out(wave.reshape(time.shape), out)
             
-            #cosine series:
-            self.wave.amplitude = self.amplitudes[0]
-            wave = self.wave.evaluate(time + np.pi *.5) * .5
+        else:
+            return self.wave.evaluate(time, out=out)
+
+#%% Exponential sine sweep
+
+class Sweep(WaveOperators):
+    '''Generates an object with a single method: evaluate(time).
+    
+    Exponential (Farina) sine sweep: instantaneous frequency grows from 
+    frequency to stop_frequency as an exponential of time, so every octave
+    lasts the same. It repeats itself every duration + silence seconds. See
+    fwp_analysis.sweep_response to get transfer functions out of it.
+  
+    Attributes
+    ----------
+    frequency : float
+        start frequency in Hz
+    stop_frequency : float
+        final frequency in Hz
+    duration : float
+        sweep duration in seconds
+    amplitude : float
+        sweep amplitude
+    silence : float
+        silence after each sweep, in seconds
+        
+    Methods
+    ----------
+    evaluate(time)
+        returns evaluated sweep
+
+    '''
+    
+    def __init__(self, frequency=20, stop_frequency=20000, duration=2, 
+                 amplitude=1, silence=0):
+        ''' See class atributes.'''
+        
+        self.frequency = frequency
+        self.stop_frequency = stop_frequency
+        self.duration = duration
+        self.amplitude = amplitude
+        self.silence = silence
+        
+    @property
+    def rate_time(self):
+        '''Time it takes for the instantaneous frequency to grow by a factor e.'''
+        
+        return self.duration / np.log(self.stop_frequency / self.frequency)
+        
+    @property
+    def period(self):
+        '''Period getter: returns the time after which the sweep repeats itself.'''
+        
+        return self.duration + self.silence
+    
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        return make_spec('Sweep', self.frequency, self.stop_frequency, 
+                         self.duration, self.amplitude, self.silence)
+        
+    def evaluate(self, time, out=None):
+        """Takes in an array-like object to evaluate the funcion in.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
             
-            #sine series:
-            self.wave.amplitude = self.amplitudes[1]
-            wave += self.wave.evaluate(time) * .5
+        Returns
+        -------
+        
+        Evaluated sweep
+        """
+        
+        time = np.mod(time, self.period)
+        rate_time = self.rate_time
+        
+        phase = 2 * np.pi * self.frequency * rate_time * np.expm1(time / rate_time)
+        wave = np.sin(phase) * self.amplitude
+        wave = np.where(time < self.duration, wave, 0)
+        return write_out(wave, out)
+
+#%% Multisine
+
+class Multisine(WaveOperators):
+    '''Generates an object with a single method: evaluate(time).
+    
+    Sum of equal amplitude tones placed exactly on the FFT bins of a 
+    period of samples samples, so that any whole number of recorded 
+    periods can be analysed without leakage. Phases are chosen to keep 
+    the crest factor low. See fwp_analysis.multisine_response to get 
+    transfer functions out of it.
+  
+    Attributes
+    ----------
+    samples : int
+        samples in one period
+    samplerate : int or float
+        sampling rate the multisine is meant to be played at
+    bins : array
+        excited FFT bins; bin k has frequency k*samplerate/samples
+    phases : array
+        phase of every tone, in radians
+    amplitude : float
+        peak amplitude of the multisine
+        
+    Methods
+    ----------
+    evaluate(time)
+        returns evaluated multisine
+
+    '''
+    
+    def __init__(self, frequency=20, stop_frequency=20000, samples=2**16,
+                 samplerate=44100, amplitude=1, phases='schroeder', 
+                 seed=None, step=1, bins=None):
+        '''Initializes class instance.
+        
+        Parameters
+        ----------
+        frequency : float (optional)
+            lowest frequency to excite in Hz. Default: 20
+        stop_frequency : float (optional)
+            highest frequency to excite in Hz. Default: 20000
+        samples : int (optional)
+            samples in one period. Frequency resolution will be 
+            samplerate/samples. Default: 2**16
+        samplerate : int or float (optional)
+            sampling rate the multisine is meant to be played at. 
+            Default: 44100
+        amplitude : float (optional)
+            peak amplitude. Default: 1
+        phases : {'schroeder', 'random'} (optional)
+            phases to use. Default: 'schroeder'
+        seed : int or None (optional)
+            seed for random phases. Default: None
+        step : int (optional)
+            excite one every step bins, i.e. 2 to leave room to see 
+            distortion between excited bins. Default: 1
+        bins : array-like or None (optional)
+            excited FFT bins. If given, frequency, stop_frequency and step
+            are ignored. Default: None
+        '''
+        
+        self.samples = samples
+        self.samplerate = samplerate
+        self.amplitude = amplitude
+        
+        if bins is None:
+            resolution = samplerate / samples
+            first = max(1, int(np.ceil(frequency / resolution)))
+            last = min(samples//2 - 1, int(stop_frequency // resolution))
+            bins = np.arange(first, last + 1, step)
+        self.bins = np.asarray(bins, dtype=int)
+        
+        if phases == 'schroeder':
+            k = np.arange(1, len(self.bins) + 1)
+            self.phases = -np.pi * k * (k - 1) / len(self.bins)
+        elif phases == 'random':
+            self.phases = np.random.RandomState(seed).uniform(0, 2*np.pi, 
+                                                              len(self.bins))
+        else:
+            raise ValueError("Phases should be 'schroeder' or 'random'.")
             
-            return wave
+        self._period = None
+    
+    @property
+    def frequency(self):
+        '''Frequency getter: returns frequency resolution, the inverse of period.'''
+        
+        return self.samplerate / self.samples
+    
+    @property
+    def frequencies(self):
+        '''Returns the excited frequencies in Hz.'''
+        
+        return self.bins * self.frequency
+    
+    @property
+    def period(self):
+        '''Period getter: returns the time after which the multisine repeats itself.'''
+        
+        return self.samples / self.samplerate
+    
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        return make_spec('Multisine', self.samples, self.samplerate,
+                         self.amplitude, self.bins, self.phases)
+        
+    @property
+    def crest_factor(self):
+        '''Returns the ratio between peak and RMS values.'''
+        
+        table = self.period_table()[:-1]
+        return np.abs(table).max() / np.sqrt(np.mean(table**2))
+        
+    def spectrum(self):
+        '''Returns the rfft of one period, as played.'''
+        
+        spectrum = np.zeros(self.samples//2 + 1, dtype=complex)
+        spectrum[self.bins] = np.exp(1j * self.phases)
+        return spectrum
+        
+    def period_table(self):
+        '''Returns one period, normalized to given amplitude, as a wavetable.'''
+        
+        if self._period is None:
+            table = np.fft.irfft(self.spectrum(), self.samples)
+            table *= self.amplitude / np.abs(table).max()
+            self._period = np.append(table, table[0]).astype(SAMPLE_DTYPE)
+        return self._period
+        
+    def evaluate(self, time, out=None):
+        """Takes in an array-like object to evaluate the funcion in.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
             
+        Returns
+        -------
+        
+        Evaluated multisine
+        """
+        
+        table = self.period_table()
+        if out is None or out.dtype != table.dtype:
+            return write_out(read_wavetable(table, time, self.frequency), out)
+        return read_wavetable(table, time, self.frequency, out=out)
+
+#%% Maximum length sequence
+
+class MLS(WaveOperators):
+    '''Generates an object with a single method: evaluate(time).
+    
+    Maximum length sequence: a binary pseudo-random sequence of length 
+    2**order - 1 played as +amplitude and -amplitude, one value per sample.
+    Its circular autocorrelation is an impulse, so impulse responses can 
+    be recovered from it. See fwp_analysis.mls_response.
+  
+    Attributes
+    ----------
+    order : int
+        number of bits in the shift register
+    samplerate : int or float
+        sampling rate the sequence is meant to be played at
+    amplitude : float
+        sequence amplitude
+    sequence : array
+        one period of the sequence, as bits (0 or 1)
+        
+    Methods
+    ----------
+    evaluate(time)
+        returns evaluated sequence
+
+    '''
+    
+    def __init__(self, order=16, samplerate=44100, amplitude=1, taps=None, 
+                 seed=None):
+        '''Initializes class instance.
+        
+        Parameters
+        ----------
+        order : int (optional)
+            number of bits in the shift register. Period will be 
+            2**order - 1 samples. Default: 16
+        samplerate : int or float (optional)
+            sampling rate the sequence is meant to be played at. 
+            Default: 44100
+        amplitude : float (optional)
+            sequence amplitude. Default: 1
+        taps : array-like or None (optional)
+            feedback taps of the shift register. If None, scipy's default
+            taps for given order are used. Default: None
+        seed : int or None (optional)
+            seed for a random initial state of the shift register. If None,
+            the register starts with all ones. Default: None
+        '''
+        
+        self.order = order
+        self.samplerate = samplerate
+        self.amplitude = amplitude
+        self.taps = taps
+        self.seed = seed
+        
+        if seed is None:
+            state = np.ones(order)
         else:
-            return self.wave.evaluate(time)
\ No newline at end of file
+            state = np.zeros(order)
+            random = np.random.RandomState(seed)
+            while not state.any():
+                state = random.randint(0, 2, order)
+        self.sequence = max_len_seq(order, state=state, taps=taps)[0]
+        
+    @property
+    def frequency(self):
+        '''Frequency getter: returns the inverse of period.'''
+        
+        return self.samplerate / len(self.sequence)
+    
+    @property
+    def period(self):
+        '''Period getter: returns the time after which the sequence repeats itself.'''
+        
+        return len(self.sequence) / self.samplerate
+    
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        return make_spec('MLS', self.order, self.samplerate, self.amplitude,
+                         self.taps, self.seed)
+        
+    def evaluate(self, time, out=None):
+        """Takes in an array-like object to evaluate the funcion in.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion; it is rounded to
+            the nearest sample
+            
+        Returns
+        -------
+        
+        Evaluated sequence
+        """
+        
+        index = np.mod(np.rint(np.asarray(time) * self.samplerate).astype(int),
+                       len(self.sequence))
+        wave = (1 - 2 * self.sequence[index].astype(float)) * self.amplitude
+        return write_out(wave, out)
+
+#%% Tone burst
+
+class Burst(WaveOperators):
+    '''Generates an object with a single method: evaluate(time).
+    
+    Gated tone burst: the given wave plays for cycles of its periods and is
+    silent for off_cycles periods, and this repeats repeats times (or 
+    forever). Each burst starts at time 0 of the wave. Bursts may have 
+    raised-cosine edges to limit spectral splatter.
+  
+    Attributes
+    ----------
+    wave : wave object
+        periodic wave to gate (i.e. Wave or Fourier)
+    cycles : int or float
+        periods of wave on each burst
+    off_cycles : int or float
+        periods of wave off after each burst
+    repeats : int or None
+        number of bursts. If None, bursts repeat forever.
+    edge : int or float
+        periods of wave taken by each raised-cosine edge. If 0, bursts are
+        rectangular.
+        
+    Methods
+    ----------
+    evaluate(time)
+        returns evaluated burst
+    envelope(time)
+        returns the gate applied within a burst
+
+    '''
+    
+    def __init__(self, wave, cycles=10, off_cycles=10, repeats=None, edge=0):
+        ''' See class atributes.'''
+        
+        if 2 * edge > cycles:
+            raise ValueError('Edges must not be longer than half the burst')
+        
+        self.wave = wave
+        self.cycles = cycles
+        self.off_cycles = off_cycles
+        self.repeats = repeats
+        self.edge = edge
+        
+    @property
+    def frequency(self):
+        '''Frequency getter: returns how many bursts start per second.'''
+        
+        return 1 / self.period
+    
+    @property
+    def period(self):
+        '''Period getter: returns time between the starts of two bursts.'''
+        
+        return (self.cycles + self.off_cycles) * self.wave.period
+    
+    @property
+    def on_duration(self):
+        '''Time each burst is on, in seconds.'''
+        
+        return self.cycles * self.wave.period
+    
+    @property
+    def duration(self):
+        '''Total duration of all bursts in seconds, or None if endless.'''
+        
+        if self.repeats is None:
+            return None
+        return self.repeats * self.period
+    
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        if self.repeats is not None:
+            return None #Not periodic, so it can't be looped
+        wave_spec = getattr(self.wave, 'spec', None)
+        if wave_spec is None:
+            return None
+        return make_spec('Burst', wave_spec, self.cycles, self.off_cycles, 
+                         self.edge)
+    
+    def envelope(self, time):
+        """Returns the gate of a burst at times measured from its start.
+        
+        Parameters
+        ----------
+        time : array
+            time since the start of the burst, in [0, period)
+            
+        Returns
+        -------
+        
+        Gate, between 0 and 1
+        """
+        
+        time = np.asarray(time)
+        on_duration = self.on_duration
+        gate = np.where(time < on_duration, 1., 0.)
+        
+        if self.edge > 0:
+            edge_duration = self.edge * self.wave.period
+            distance = np.minimum(time, on_duration - time) / edge_duration
+            rising = (distance >= 0) & (distance < 1)
+            gate[rising] = .5 * (1 - np.cos(np.pi * distance[rising]))
+        return gate
+        
+    def evaluate(self, time, out=None):
+        """Takes in an array-like object to evaluate the funcion in.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated burst
+        """
+        
+        period = self.period
+        since_start = np.mod(time, period)
+        wave = self.wave.evaluate(since_start, out=out)
+        wave *= self.envelope(since_start)
+        if self.repeats is not None:
+            ended = np.asarray(time) >= self.repeats * period
+            wave = write_out(np.where(ended, 0, wave), out)
+        return wave
+
+#%% Audio files through a memory map
+
+WAV_FORMAT_PCM = 1
+WAV_FORMAT_FLOAT = 3
+WAV_FORMAT_EXTENSIBLE = 0xFFFE
+
+def read_wav_header(filename):
+    """ Parses a WAV file's RIFF header without reading its samples.
+    
+    Parameters
+    ----------
+    filename : str
+        path to the WAV file
+        
+    Returns
+    -------
+    dict
+        format tag, channels, samplerate, bits per sample, bytes per frame,
+        offset of the first sample in bytes and number of frames
+    """
+    
+    with open(filename, 'rb') as file:
+        riff, _, wave = struct.unpack('<4sI4s', file.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError('{} is not a WAV file'.format(filename))
+        
+        header = None
+        while True:
+            chunk = file.read(8)
+            if len(chunk) < 8:
+                raise ValueError('No data found in {}'.format(filename))
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            
+            if chunk_id == b'fmt ':
+                body = file.read(chunk_size + chunk_size % 2)
+                tag, channels, samplerate, _, block_align, bits = \
+                    struct.unpack('<HHIIHH', body[:16])
+                if tag == WAV_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack('<H', body[24:26])[0]
+                header = dict(tag=tag, channels=channels, 
+                              samplerate=samplerate, bits=bits, 
+                              block_align=block_align)
+                
+            elif chunk_id == b'data':
+                if header is None:
+                    raise ValueError('No format found in {}'.format(filename))
+                offset = file.tell()
+                #Size may be wrong on files that were never closed
+                available = os.path.getsize(filename) - offset
+                size = min(chunk_size, available)
+                header.update(offset=offset, 
+                              frames=size // header['block_align'])
+                return header
+            
+            else:
+                file.seek(chunk_size + chunk_size % 2, 1)
+
+class AudioFile(WaveOperators):
+    '''Generates an object with a single method: evaluate(time).
+    
+    Plays one channel of a WAV file (16, 24 or 32 bit integer PCM, or 
+    32 bit float) or of a raw float32 file. Samples are read through a 
+    memory map, so only the blocks being played are ever loaded, no matter
+    how big the file is. Integer samples are scaled to [-1, 1).
+  
+    Attributes
+    ----------
+    filename : str
+        path to the file
+    channel : int
+        channel to play, starting at 0
+    samplerate : int
+        sampling rate of the file
+    nchannels : int
+        number of channels in the file
+    frames : int
+        number of samples per channel
+    gain : float
+        factor multiplying every sample
+    loop : bool
+        if True, file repeats itself; else it's followed by silence
+        
+    Methods
+    ----------
+    evaluate(time)
+        returns file's nearest samples to given times
+    read(first, frames, out=None)
+        returns a block of consecutive samples
+
+    '''
+    
+    def __init__(self, filename, channel=0, gain=1, loop=False, raw=False, 
+                 samplerate=44100, nchannels=1):
+        '''Initializes class instance.
+        
+        Parameters
+        ----------
+        filename : str
+            path to a WAV file, or to a raw file of interleaved float32
+            samples if raw is True
+        channel : int (optional)
+            channel to play, starting at 0. Default: 0
+        gain : float (optional)
+            factor multiplying every sample. Default: 1
+        loop : bool (optional)
+            if True, file repeats itself. Default: False
+        raw : bool (optional)
+            if True, file holds raw float32 samples. Default: False
+        samplerate : int (optional)
+            sampling rate of a raw file. Ignored for WAV files. 
+            Default: 44100
+        nchannels : int (optional)
+            number of interleaved channels of a raw file. Ignored for WAV
+            files. Default: 1
+        '''
+        
+        self.filename = filename
+        self.gain = gain
+        self.loop = loop
+        
+        if raw:
+            self.samplerate = samplerate
+            self.nchannels = nchannels
+            self.data = np.memmap(filename, dtype='<f4', mode='r')
+            self.frames = len(self.data) // nchannels
+            self.data = self.data[:self.frames * nchannels]
+            self.data = self.data.reshape(self.frames, nchannels)
+            self.scale = 1
+            
+        else:
+            header = read_wav_header(filename)
+            self.samplerate = header['samplerate']
+            self.nchannels = header['channels']
+            self.frames = header['frames']
+            self.data, self.scale = self.map_wav(header)
+        
+        if channel not in range(self.nchannels):
+            raise ValueError('Channel {} not in file with {} channels'.format(
+                    channel, self.nchannels))
+        self.channel = channel
+        
+    def map_wav(self, header):
+        '''Returns a memory map of WAV samples, shaped (frames, channels),
+        and the factor that scales them to [-1, 1).'''
+        
+        tag, bits = header['tag'], header['bits']
+        if tag == WAV_FORMAT_FLOAT and bits == 32:
+            dtype, scale = '<f4', 1
+        elif tag == WAV_FORMAT_PCM and bits == 16:
+            dtype, scale = '<i2', 2.**-15
+        elif tag == WAV_FORMAT_PCM and bits == 32:
+            dtype, scale = '<i4', 2.**-31
+        elif tag == WAV_FORMAT_PCM and bits == 24:
+            dtype, scale = 'u1', 2.**-31 #Read into the top of an int32
+        else:
+            raise ValueError('Unsupported WAV format {} with {} bits'.format(
+                    tag, bits))
+            
+        shape = (self.frames, self.nchannels)
+        if bits == 24:
+            shape += (3,)
+        if self.frames == 0:
+            return np.zeros(shape, dtype=dtype), scale
+        data = np.memmap(self.filename, dtype=dtype, mode='r', 
+                         offset=header['offset'], shape=shape)
+        return data, scale
+    
+    @property
+    def period(self):
+        '''Period getter: returns file duration in seconds.'''
+        
+        return self.frames / self.samplerate
+    
+    @property
+    def frequency(self):
+        '''Frequency getter: returns how many times per second the file 
+        would repeat.'''
+        
+        return 1 / self.period
+    
+    @property
+    def spec(self):
+        '''Always None: files are streamed, never rendered into loops.'''
+        
+        return None
+    
+    def samples(self, start, stop, out=None):
+        '''Returns float32 samples from start to stop, which should lie 
+        within the file. If given, out is written into.'''
+        
+        if out is None:
+            out = np.empty(stop - start, dtype=np.float32)
+        
+        data = self.data[start:stop, self.channel]
+        if data.ndim == 2: #24 bit samples, as three little endian bytes
+            block = np.zeros(len(data), dtype=np.int32)
+            for byte in range(3):
+                block |= data[:, byte].astype(np.int32) << (8 * byte + 8)
+            data = block
+        
+        out[:] = data
+        factor = self.scale * self.gain
+        if factor != 1:
+            out *= factor
+        return out
+    
+    def read(self, first, frames, out=None):
+        """Returns frames consecutive samples, starting at sample first.
+        
+        If loop is True, reading wraps around the file; else samples past 
+        its end are zero.
+        
+        Parameters
+        ----------
+        first : int
+            index of first sample
+        frames : int
+            number of samples
+        out : array (optional)
+            float32 array of length frames to write into
+            
+        Returns
+        -------
+        
+        Float32 array of samples
+        """
+        
+        if out is None:
+            out = np.empty(frames, dtype=np.float32)
+            
+        filled = 0
+        while filled < frames:
+            position = first + filled
+            if self.loop and self.frames:
+                position %= self.frames
+            n = min(frames - filled, self.frames - position)
+            if n <= 0:
+                out[filled:] = 0
+                break
+            self.samples(position, position + n, out[filled:filled + n])
+            filled += n
+        return out
+        
+    def evaluate(self, time, out=None):
+        """Takes in an array-like object to evaluate the funcion in.
+        
+        Every time is rounded to the nearest sample of the file.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        File's samples
+        """
+        
+        index = np.rint(np.asarray(time) * self.samplerate).astype(np.int64)
+        if self.loop and self.frames:
+            index %= self.frames
+        inside = (index >= 0) & (index < self.frames)
+        
+        wave = np.zeros(index.shape, dtype=np.float32)
+        where = np.flatnonzero(inside)
+        needed = index.ravel()[where]
+        #Read each increasing run on its own, so that wrapping around a 
+        #looping file doesn't touch every sample in between
+        for run in np.split(np.arange(len(needed)), 
+                            np.flatnonzero(np.diff(needed) < 0) + 1):
+            if len(run):
+                start = needed[run].min()
+                block = self.samples(start, needed[run].max() + 1)
+                wave.ravel()[where[run]] = block[needed[run] - start]
+        return write_out(wave, out)
+
+#%% Wave expressions
+
+def common_period(*periods):
+    """ Returns the shortest time holding a whole number of every period.
+    
+    Periods are approximated by fractions with denominators up to 1e9, so 
+    i.e. 1/440 and 1/660 give 1/220.
+    
+    Parameters
+    ----------
+    periods : floats
+        periods in seconds
+        
+    Returns
+    -------
+    
+    Common period in seconds
+    """
+    
+    fractions = [Fraction(p).limit_denominator(10**9) for p in periods]
+    numerator = reduce(lambda a, b: a * b // gcd(a, b), 
+                       [f.numerator for f in fractions])
+    denominator = reduce(gcd, [f.denominator for f in fractions])
+    return numerator / denominator
+
+class Expression(WaveOperators):
+    '''Base class for lazy combinations of waves.
+    
+    Expressions keep the waves they combine and only evaluate them when 
+    they are evaluated themselves, writing into a single output array and
+    at most one scratch array per level. Like any wave, they have 
+    frequency, period and spec, so they can be streamed and looped.
+  
+    Attributes
+    ----------
+    waves : list
+        combined waves
+        
+    Methods
+    ----------
+    evaluate(time, out=None)
+        returns evaluated expression
+    '''
+    
+    parameters = ()
+    
+    @property
+    def period(self):
+        '''Period getter: returns the common period of all waves.'''
+        
+        return common_period(*(w.period for w in self.waves))
+    
+    @property
+    def frequency(self):
+        '''Frequency getter: returns inverse of period.'''
+        
+        return 1 / self.period
+    
+    @property
+    def spec(self):
+        '''Hashable specification of the wave, or None if it can't be built.'''
+        
+        specs = [getattr(w, 'spec', None) for w in self.waves]
+        if any(spec is None for spec in specs):
+            return None
+        return make_spec(type(self).__name__, *specs, *self.parameters)
+    
+    def output(self, time, out):
+        '''Returns out, or a new array shaped as time if it's None.'''
+        
+        if out is None:
+            out = np.empty(np.shape(time))
+        return out
+
+class Sum(Expression):
+    '''Lazy sum of waves. Usually built as wave1 + wave2.'''
+    
+    def __init__(self, *waves):
+        
+        self.waves = []
+        for w in waves:
+            self.waves.extend(w.waves if isinstance(w, Sum) else [w])
+    
+    def evaluate(self, time, out=None):
+        """Evaluates every wave and adds them into out.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated sum
+        """
+        
+        out = self.waves[0].evaluate(time, out=self.output(time, out))
+        scratch = np.empty_like(out)
+        for w in self.waves[1:]:
+            out += w.evaluate(time, out=scratch)
+        return out
+
+class Product(Expression):
+    '''Lazy product of waves. Usually built as wave1 * wave2.'''
+    
+    def __init__(self, *waves):
+        
+        self.waves = []
+        for w in waves:
+            self.waves.extend(w.waves if isinstance(w, Product) else [w])
+    
+    def evaluate(self, time, out=None):
+        """Evaluates every wave and multiplies them into out.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated product
+        """
+        
+        out = self.waves[0].evaluate(time, out=self.output(time, out))
+        scratch = np.empty_like(out)
+        for w in self.waves[1:]:
+            out *= w.evaluate(time, out=scratch)
+        return out
+
+class Gain(Expression):
+    '''Lazy wave times a number. Usually built as factor * wave.'''
+    
+    def __init__(self, wave, factor):
+        
+        if isinstance(wave, Gain):
+            wave, factor = wave.waves[0], wave.factor * factor
+        self.waves = [wave]
+        self.factor = factor
+        self.parameters = (factor,)
+        
+    def evaluate(self, time, out=None):
+        """Evaluates wave into out and scales it.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated wave times factor
+        """
+        
+        out = self.waves[0].evaluate(time, out=self.output(time, out))
+        out *= self.factor
+        return out
+
+class Offset(Expression):
+    '''Lazy wave plus a DC offset. Usually built as wave + offset.'''
+    
+    def __init__(self, wave, offset):
+        
+        if isinstance(wave, Offset):
+            wave, offset = wave.waves[0], wave.offset + offset
+        self.waves = [wave]
+        self.offset = offset
+        self.parameters = (offset,)
+        
+    def evaluate(self, time, out=None):
+        """Evaluates wave into out and adds the offset.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated wave plus offset
+        """
+        
+        out = self.waves[0].evaluate(time, out=self.output(time, out))
+        out += self.offset
+        return out
+
+class Shift(Expression):
+    '''Lazy wave delayed by delay seconds. Usually built as 
+    wave.shift(delay).'''
+    
+    def __init__(self, wave, delay):
+        
+        if isinstance(wave, Shift):
+            wave, delay = wave.waves[0], wave.delay + delay
+        self.waves = [wave]
+        self.delay = delay
+        self.parameters = (delay,)
+        
+    def evaluate(self, time, out=None):
+        """Evaluates wave at time - delay into out.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated delayed wave
+        """
+        
+        return self.waves[0].evaluate(np.subtract(time, self.delay), 
+                                      out=self.output(time, out))
+
+class AM(Expression):
+    '''Lazy amplitude modulation: carrier * (1 + depth * modulator). 
+    Usually built as carrier.am(modulator, depth).'''
+    
+    def __init__(self, carrier, modulator, depth=1):
+        
+        self.waves = [carrier, modulator]
+        self.depth = depth
+        self.parameters = (depth,)
+        
+    def evaluate(self, time, out=None):
+        """Evaluates carrier into out and modulates it.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated modulated carrier
+        """
+        
+        out = self.waves[0].evaluate(time, out=self.output(time, out))
+        scratch = self.waves[1].evaluate(time, out=np.empty_like(out))
+        scratch *= self.depth
+        scratch += 1
+        out *= scratch
+        return out
+
+class FM(Expression):
+    '''Lazy frequency modulation: carrier's instantaneous frequency is 
+    its own plus deviation * modulator, in Hz. Usually built as
+    carrier.fm(modulator, deviation).
+    
+    Modulator's mean is ignored, so that the result stays periodic. Its
+    time integral is tabulated once per period and read as a wavetable.'''
+    
+    def __init__(self, carrier, modulator, deviation):
+        
+        self.waves = [carrier, modulator]
+        self.deviation = deviation
+        self.parameters = (deviation,)
+        self._integral = None
+        
+    def integral(self):
+        '''Returns one period of the modulator's integral, with its mean
+        removed, as a float64 wavetable.'''
+        
+        if self._integral is None:
+            modulator = self.waves[1]
+            step = modulator.period / WAVETABLE_SIZE
+            values = np.asarray(modulator.evaluate(
+                    np.arange(WAVETABLE_SIZE) * step), dtype=float)
+            values -= values.mean()
+            #Trapezoids, so last element closes the loop back to 0
+            trapezoids = (values + np.roll(values, -1)) * (step / 2)
+            self._integral = np.concatenate(([0], np.cumsum(trapezoids)))
+        return self._integral
+        
+    def evaluate(self, time, out=None):
+        """Evaluates carrier into out at modulated times.
+        
+        Parameters
+        ----------
+        time : array
+            time vector in which to evaluate the funcion
+        out : array (optional)
+            array to write into
+            
+        Returns
+        -------
+        
+        Evaluated modulated carrier
+        """
+        
+        carrier, modulator = self.waves
+        warped = read_wavetable(self.integral(), time, 1 / modulator.period)
+        warped *= self.deviation / carrier.frequency
+        warped += time
+        return carrier.evaluate(warped, out=self.output(time, out))